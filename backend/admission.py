@@ -0,0 +1,230 @@
+"""
+Priority-aware admission control for API requests.
+
+Every ``/api`` request is put in a route class. A request runs only while
+the worker has a free slot overall and in its class; otherwise it waits in
+its class's queue. Freed slots go to the highest-priority class with
+waiters and an open slot, so quiz submissions are served ahead of everything
+else when a deadline hits.
+
+Reads are the only class that can be shed. Once the oldest queued request
+has waited longer than the target queue delay, new reads get a 503 with
+``Retry-After`` straight away. Reads already queued get the same answer
+once their own wait passes the target. Other classes queue for as long as
+it takes.
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Tuple
+
+from starlette.responses import JSONResponse
+
+from ratelimit import retry_after_header
+
+SUBMISSION_PATH = re.compile(r"^/api/quizzes/[^/]+/attempt$")
+AUTH_PATHS = frozenset(("/api/login", "/api/register", "/api/token/refresh"))
+READ_METHODS = frozenset(("GET", "HEAD"))
+
+# Weight of the latest sample in the average queue wait
+WAIT_EWMA_WEIGHT = 0.1
+
+
+class RouteClass(NamedTuple):
+    name: str
+    priority: int  # lower is served first
+    max_in_flight: int
+    sheddable: bool
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; ``retry_after`` is in seconds"""
+
+    def __init__(self, route_class: str, retry_after: float):
+        super().__init__(f"Shedding {route_class} requests")
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+
+def classify(method: str, path: str) -> str:
+    if method == "POST" and SUBMISSION_PATH.match(path):
+        return "submission"
+    if path in AUTH_PATHS:
+        return "auth"
+    if method in READ_METHODS:
+        return "read"
+    return "write"
+
+
+class AdmissionController:
+    def __init__(self, classes: List[RouteClass], max_in_flight: int, target_queue_delay: float):
+        self.classes = sorted(classes, key=lambda route_class: route_class.priority)
+        self.by_name = {route_class.name: route_class for route_class in self.classes}
+        self.max_in_flight = max_in_flight
+        self.target_queue_delay = target_queue_delay
+        self.in_flight = 0
+        self._in_flight = {route_class.name: 0 for route_class in self.classes}
+        self._waiters: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {
+            route_class.name: deque() for route_class in self.classes
+        }
+        self._metrics = {
+            route_class.name: {"admitted": 0, "queued": 0, "shed": 0, "avg_wait_ms": 0.0, "max_wait_ms": 0.0}
+            for route_class in self.classes
+        }
+
+    def _has_slot(self, route_class: RouteClass) -> bool:
+        return self.in_flight < self.max_in_flight and self._in_flight[route_class.name] < route_class.max_in_flight
+
+    def queue_delay(self, now: float) -> float:
+        """How long the oldest queued request has been waiting, in seconds"""
+        oldest = min((waiters[0][0] for waiters in self._waiters.values() if waiters), default=now)
+        return now - oldest
+
+    async def acquire(self, name: str) -> None:
+        route_class = self.by_name[name]
+        metrics = self._metrics[name]
+        if self._has_slot(route_class) and not self._waiters[name]:
+            self._start(name, 0.0)
+            return
+
+        now = time.monotonic()
+        if route_class.sheddable and self.queue_delay(now) > self.target_queue_delay:
+            metrics["shed"] += 1
+            raise Overloaded(name, self.queue_delay(now))
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (now, future)
+        self._waiters[name].append(waiter)
+        metrics["queued"] += 1
+        try:
+            timeout = self.target_queue_delay if route_class.sheddable else None
+            await asyncio.wait((future,), timeout=timeout)
+        except asyncio.CancelledError:
+            # Client went away; give back a slot that was granted meanwhile
+            if future.done():
+                self.release(name)
+            else:
+                self._waiters[name].remove(waiter)
+                future.cancel()
+            raise
+        if not future.done():
+            self._waiters[name].remove(waiter)
+            future.cancel()
+            metrics["shed"] += 1
+            raise Overloaded(name, self.queue_delay(time.monotonic()))
+
+    def release(self, name: str) -> None:
+        self.in_flight -= 1
+        self._in_flight[name] -= 1
+        self._grant()
+
+    def _start(self, name: str, waited: float) -> None:
+        self.in_flight += 1
+        self._in_flight[name] += 1
+        metrics = self._metrics[name]
+        metrics["admitted"] += 1
+        waited_ms = waited * 1000
+        metrics["avg_wait_ms"] += WAIT_EWMA_WEIGHT * (waited_ms - metrics["avg_wait_ms"])
+        if waited_ms > metrics["max_wait_ms"]:
+            metrics["max_wait_ms"] = waited_ms
+
+    def _grant(self) -> None:
+        now = time.monotonic()
+        for route_class in self.classes:
+            waiters = self._waiters[route_class.name]
+            while waiters and self._has_slot(route_class):
+                enqueued_at, future = waiters.popleft()
+                if future.done():
+                    continue
+                self._start(route_class.name, now - enqueued_at)
+                future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_delay_ms": round(self.queue_delay(now) * 1000, 1),
+            "target_queue_delay_ms": self.target_queue_delay * 1000,
+            "classes": {
+                route_class.name: {
+                    "priority": route_class.priority,
+                    "in_flight": self._in_flight[route_class.name],
+                    "max_in_flight": route_class.max_in_flight,
+                    "waiting": len(self._waiters[route_class.name]),
+                    **{
+                        key: round(value, 1) if isinstance(value, float) else value
+                        for key, value in self._metrics[route_class.name].items()
+                    },
+                }
+                for route_class in self.classes
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting ``/api`` requests through an ``AdmissionController``"""
+
+    def __init__(self, app, controller: AdmissionController, prefix: str = "/api"):
+        self.app = app
+        self.controller = controller
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope["method"], scope["path"])
+        try:
+            await self.controller.acquire(name)
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server busy, please retry"},
+                headers={"Retry-After": retry_after_header(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.controller.release(name)
+
+        async def send_and_release(message) -> None:
+            await send(message)
+            # Background tasks run after the last body chunk; they must not hold the slot
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                release()
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
+
+
+def create_admission_controller() -> AdmissionController:
+    """
+    Build the controller from ``ADMISSION_MAX_IN_FLIGHT``,
+    ``ADMISSION_TARGET_QUEUE_MS`` and per-class caps
+    ``ADMISSION_LIMIT_<CLASS>``.
+    """
+    def cap(name: str, default: int) -> int:
+        return int(os.environ.get(f"ADMISSION_LIMIT_{name.upper()}", str(default)))
+
+    classes = [
+        RouteClass("submission", 0, cap("submission", 48), sheddable=False),
+        RouteClass("auth", 1, cap("auth", 16), sheddable=False),
+        RouteClass("write", 2, cap("write", 16), sheddable=False),
+        RouteClass("read", 3, cap("read", 32), sheddable=True),
+    ]
+    return AdmissionController(
+        classes,
+        max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "64")),
+        target_queue_delay=float(os.environ.get("ADMISSION_TARGET_QUEUE_MS", "250")) / 1000,
+    )
@@ -0,0 +1,207 @@
+"""
+Cold storage for old quiz results.
+
+Published results older than ``ARCHIVE_AFTER_DAYS``, or belonging to a
+deactivated quiz, are moved out of the hot ``quiz_results`` collection
+into compressed NDJSON segments on local disk, partitioned as
+``<root>/quiz_id=<quiz>/<YYYY-MM>/<segment>``. Segments are written once
+and never modified. A SQLite index next to them maps each archived result
+to its segment and line, so single results and a user's history can
+still be served after archival. Index queries and segment reads run in
+worker threads so they never block the event loop.
+
+Segments use zstd when the ``zstandard`` package is installed and gzip
+otherwise; readers pick the codec from the file suffix.
+"""
+
+import asyncio
+import functools
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used instead
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.sqlite3"
+DATETIME_FIELDS = ("completed_at",)
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+
+def _compress(payload: bytes):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(payload), ".ndjson.zst"
+    return gzip.compress(payload, compresslevel=9), ".ndjson.gz"
+
+
+@functools.lru_cache(maxsize=8)
+def _load_segment(path: str) -> List[bytes]:
+    """Decompressed lines of a segment; safe to cache since segments never change"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = gzip.decompress(data)
+    return data.splitlines()
+
+
+class ResultArchive:
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._connection: Optional[sqlite3.Connection] = None
+        # Serializes use of the shared connection across worker threads
+        self._db_lock = threading.Lock()
+        self.lock = asyncio.Lock()
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so workers that never touch the archive skip it at startup
+        if self._connection is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.root / INDEX_FILE), check_same_thread=False)
+            # WAL lets every worker read while the archiver writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS archived_results (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    quiz_id TEXT NOT NULL,
+                    completed_at TEXT NOT NULL,
+                    segment TEXT NOT NULL,
+                    line INTEGER NOT NULL
+                )"""
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS archived_results_user ON archived_results (user_id, completed_at)"
+            )
+            db.commit()
+            self._connection = db
+        return self._connection
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Writing
+    def write_segments(self, results: List[Dict[str, Any]]) -> List[tuple]:
+        """Write results into new segments, one per quiz and month, and return their index rows"""
+        partitions: Dict[tuple, List[Dict[str, Any]]] = {}
+        for result in results:
+            month = result["completed_at"].strftime("%Y-%m")
+            partitions.setdefault((result["quiz_id"], month), []).append(result)
+
+        rows = []
+        for (quiz_id, month), docs in partitions.items():
+            directory = self.root / f"quiz_id={quiz_id}" / month
+            directory.mkdir(parents=True, exist_ok=True)
+            lines = [json.dumps(doc, default=_encode_default, separators=(",", ":")) for doc in docs]
+            data, suffix = _compress("\n".join(lines).encode("utf-8"))
+            name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}{suffix}"
+            tmp_path = directory / (name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path.rename(directory / name)
+            segment = str((directory / name).relative_to(self.root))
+            rows.extend(
+                (doc["id"], doc["user_id"], quiz_id, doc["completed_at"].isoformat(), segment, line)
+                for line, doc in enumerate(docs)
+            )
+        return rows
+
+    def index(self, rows: List[tuple]) -> None:
+        # A re-run after a crash re-archives the same ids; the newest copy wins
+        with self._db_lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO archived_results VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    # Reading
+    def _read(self, segment: str, line: int) -> Dict[str, Any]:
+        doc = json.loads(_load_segment(str(self.root / segment))[line])
+        for field in DATETIME_FIELDS:
+            if isinstance(doc.get(field), str):
+                doc[field] = datetime.fromisoformat(doc[field])
+        return doc
+
+    def _get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT segment, line FROM archived_results WHERE id = ?", (result_id,))
+        return self._read(*rows[0]) if rows else None
+
+    def _list_for_user(
+        self, user_id: str, limit: int, before: Optional[datetime], before_id: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        # completed_at is stored in ISO format, which sorts like the datetimes it encodes
+        before_at = before.isoformat() if before is not None else "9999"
+        rows = self._query(
+            "SELECT segment, line FROM archived_results"
+            " WHERE user_id = ? AND (completed_at < ? OR (completed_at = ? AND id < ?))"
+            " ORDER BY completed_at DESC, id DESC LIMIT ?",
+            (user_id, before_at, before_at, before_id if before_id is not None else "", limit),
+        )
+        return [self._read(segment, line) for segment, line in rows]
+
+    def _user_ids(self) -> List[str]:
+        return [user_id for (user_id,) in self._query("SELECT DISTINCT user_id FROM archived_results")]
+
+    def _stats(self) -> Dict[str, Any]:
+        ((count,),) = self._query("SELECT COUNT(*) FROM archived_results")
+        return {"archived_results": count, "codec": "zstd" if zstandard is not None else "gzip"}
+
+    async def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, result_id)
+
+    async def list_for_user(
+        self, user_id: str, limit: int, before: Optional[datetime] = None, before_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Archived results of a user after the ``(before, before_id)`` cursor, newest first then by descending id"""
+        return await asyncio.to_thread(self._list_for_user, user_id, limit, before, before_id)
+
+    async def user_ids(self) -> List[str]:
+        """Users with at least one archived result"""
+        return await asyncio.to_thread(self._user_ids)
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats)
+
+async def run_archival(storage, archive: ResultArchive, after_days: int, batch_size: int = 5000) -> int:
+    """Move archivable results from the hot collection into ``archive``"""
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    archived = 0
+    async with archive.lock:
+        closed_quiz_ids = await storage.quizzes.list_inactive_ids()
+        while True:
+            results = await storage.results.list_archivable(cutoff, closed_quiz_ids, batch_size)
+            if not results:
+                break
+            rows = await asyncio.to_thread(archive.write_segments, results)
+            await asyncio.to_thread(archive.index, rows)
+            # Delete only once the segments are durable and indexed
+            await storage.results.delete_many([result["id"] for result in results])
+            archived += len(results)
+    logger.info("Archived %d quiz results", archived)
+    return archived
@@ -0,0 +1,170 @@
+"""
+In-process caches and the invalidation bus that keeps workers in sync.
+
+``SerializedCache`` holds a pre-serialized JSON body for a read-mostly
+query, coalesces concurrent misses into a single load and drops its value
+as soon as it is invalidated. ``InvalidationBus`` fans invalidations out to
+every worker on the host through unix datagram sockets in a shared
+directory, so a write handled by one uvicorn worker clears the cache in
+all of them.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_SIZE = 4096
+
+
+def serialize_json(content: Any) -> bytes:
+    """Encode like FastAPI's JSONResponse so cached bodies are byte-identical"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class InvalidationBus:
+    """Host-local pub/sub for cache invalidation messages"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.handlers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+        self._sock: Optional[socket.socket] = None
+        self._path: Optional[Path] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, channel: str, handler: Callable[[Optional[str]], None]) -> None:
+        self.handlers.setdefault(channel, []).append(handler)
+
+    def dispatch(self, channel: str, key: Optional[str] = None) -> None:
+        """Run the local handlers of a channel"""
+        for handler in self.handlers.get(channel, []):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Invalidation handler failed for %s", channel)
+
+    async def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path = self.directory / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(str(self._path))
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    async def stop(self) -> None:
+        if self._sock is None:
+            return
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._path.unlink(missing_ok=True)
+        self._sock = None
+
+    def publish(self, channel: str, key: Optional[str] = None) -> None:
+        """Send a message to every other worker; local handlers are not run"""
+        if self._sock is None or not self.directory.exists():
+            return
+        message = json.dumps({"channel": channel, "key": key}).encode("utf-8")
+        for path in self.directory.glob("*.sock"):
+            if path == self._path:
+                continue
+            try:
+                self._sock.sendto(message, str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker behind this socket is gone
+                path.unlink(missing_ok=True)
+            except BlockingIOError:
+                # Receiver is backlogged; its cache TTL bounds the staleness
+                logger.warning("Dropped invalidation for %s to %s", channel, path.name)
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data = self._sock.recv(MAX_MESSAGE_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            self.dispatch(message.get("channel"), message.get("key"))
+
+
+class SerializedCache:
+    """
+    Read-through cache of one JSON response body.
+
+    Concurrent misses share a single call to ``loader``; an invalidation
+    while a load is in flight discards its result so stale data is never
+    stored. ``ttl`` is a safety net for lost bus messages.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float,
+        bus: Optional[InvalidationBus] = None,
+    ):
+        self.channel = channel
+        self.loader = loader
+        self.ttl = ttl
+        self.bus = bus
+        self._body: Optional[bytes] = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._inflight: Optional[asyncio.Future] = None
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+        if bus is not None:
+            bus.subscribe(channel, lambda key: self.drop())
+
+    async def get(self) -> bytes:
+        if self._body is not None and time.monotonic() < self._expires_at:
+            self.stats["hits"] += 1
+            return self._body
+        if self._inflight is None:
+            self.stats["misses"] += 1
+            self._inflight = asyncio.ensure_future(self._load(self._generation))
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so one cancelled request does not abort the shared load
+        return await asyncio.shield(self._inflight)
+
+    async def _load(self, generation: int) -> bytes:
+        try:
+            body = serialize_json(await self.loader())
+            if generation == self._generation:
+                self._body = body
+                self._expires_at = time.monotonic() + self.ttl
+            return body
+        finally:
+            if generation == self._generation:
+                self._inflight = None
+
+    def drop(self) -> None:
+        """Forget the cached body in this worker only"""
+        self._generation += 1
+        self._body = None
+        self._inflight = None
+        self.stats["invalidations"] += 1
+
+    def invalidate(self) -> None:
+        """Forget the cached body here and in every other worker"""
+        self.drop()
+        if self.bus is not None:
+            self.bus.publish(self.channel)
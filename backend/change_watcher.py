@@ -0,0 +1,133 @@
+"""
+MongoDB change-stream watcher for cache invalidation.
+
+Every worker runs one watcher over the ``quizzes`` and ``users``
+collections and hands each change to the caches subscribed to that
+collection, so a write handled by any worker clears
+the matching entries everywhere. After a stream error the watcher resumes
+from the last resume token; if the token has expired it tells every
+subscriber to reset. When the deployment does not support change streams
+(a standalone server) the watcher stops and caches rely on their TTLs.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Only collections something subscribes to: each event costs a full document lookup
+WATCHED_COLLECTIONS = ("quizzes", "users")
+
+# Fields of the changed document handed to subscribers
+EVENT_FIELDS = ("id", "is_active", "token_version")
+
+# Server error codes
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40324)  # standalone server / unknown $changeStream stage
+CHANGE_STREAM_HISTORY_LOST = (286, 280)  # resume point fell off the oplog / fatal stream error
+
+RESET = "reset"
+
+
+class ChangeEvent(NamedTuple):
+    collection: str
+    operation: str  # insert, update, replace, delete or reset
+    document: Dict[str, Any]  # EVENT_FIELDS of the document, empty for deletes and resets
+
+    @property
+    def document_id(self) -> Optional[str]:
+        return self.document.get("id")
+
+
+class ChangeStreamWatcher:
+    def __init__(self, db, collections=WATCHED_COLLECTIONS, retry_delay: float = 1.0):
+        self.db = db
+        self.collections = tuple(collections)
+        self.retry_delay = retry_delay
+        self.handlers: Dict[str, List[Callable[[ChangeEvent], None]]] = {}
+        self.resume_token: Optional[Dict[str, Any]] = None
+        self.active = False
+        self.supported = True
+        self.events = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, collection: str, handler: Callable[[ChangeEvent], None]) -> None:
+        self.handlers.setdefault(collection, []).append(handler)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.active = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"supported": self.supported, "active": self.active, "events": self.events}
+
+    def _pipeline(self) -> List[Dict[str, Any]]:
+        projection = {"operationType": 1, "ns": 1}
+        projection.update({f"fullDocument.{field}": 1 for field in EVENT_FIELDS})
+        return [
+            {"$match": {"ns.coll": {"$in": list(self.collections)}}},
+            {"$project": projection},
+        ]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with self.db.watch(
+                    self._pipeline(), full_document="updateLookup", resume_after=self.resume_token
+                ) as stream:
+                    self.active = True
+                    logger.info("Watching %s for cache invalidation", ", ".join(self.collections))
+                    async for change in stream:
+                        self.resume_token = stream.resume_token
+                        self._handle(change)
+            except OperationFailure as e:
+                self.active = False
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    self.supported = False
+                    logger.warning("Change streams unavailable, caches fall back to their TTLs: %s", e)
+                    return
+                if e.code in CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Change stream history lost, resetting caches: %s", e)
+                    self.resume_token = None
+                    self._reset()
+                else:
+                    logger.warning("Change stream failed, retrying: %s", e)
+                    await asyncio.sleep(self.retry_delay)
+            except PyMongoError as e:
+                self.active = False
+                logger.warning("Change stream interrupted, resuming: %s", e)
+                await asyncio.sleep(self.retry_delay)
+
+    def _handle(self, change: Dict[str, Any]) -> None:
+        operation = change["operationType"]
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            if operation == "invalidate":
+                # The stream cannot resume past an invalidate, start over
+                self.resume_token = None
+            self._reset()
+            return
+        self.events += 1
+        collection = change["ns"]["coll"]
+        self._dispatch(ChangeEvent(collection, operation, change.get("fullDocument") or {}))
+
+    def _reset(self) -> None:
+        for collection in self.collections:
+            self._dispatch(ChangeEvent(collection, RESET, {}))
+
+    def _dispatch(self, event: ChangeEvent) -> None:
+        for handler in self.handlers.get(event.collection, []):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Change handler failed for %s", event.collection)
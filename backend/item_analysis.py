@@ -0,0 +1,212 @@
+"""
+Item analysis for multiple choice questions.
+
+Results are streamed in chunks into an attempts x questions matrix of
+selected option indices (-1 when unanswered). Each chunk only updates a
+handful of per-question sums, so memory stays bounded by the chunk size
+no matter how many attempts a quiz has. From those sums the report gives
+per question:
+
+- difficulty: share of attempts answering correctly (p-value)
+- discrimination: corrected point-biserial correlation between answering
+  correctly and the points scored on the other MCQ questions
+- option frequencies, including how often the question was skipped
+
+Each result is analyzed against the quiz version it was scored on, so
+the report has one section per version.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from option_indices import correct_option, option_lookup, selected_option
+
+logger = logging.getLogger(__name__)
+
+ITEM_ANALYSIS_KIND = "item_analysis"
+UNANSWERED = -1
+
+
+class ItemAnalyzer:
+    def __init__(self, quiz: Dict[str, Any]):
+        self.quiz = quiz
+        self.questions = [
+            q for q in quiz["questions"] if q["question_type"] == "multiple_choice" and q.get("options")
+        ]
+        self.column = {q["id"]: i for i, q in enumerate(self.questions)}
+        self.option_index = [option_lookup(q) for q in self.questions]
+        self.n_options = [len(q["options"]) for q in self.questions]
+        self.max_options = max(self.n_options, default=0)
+        # -2 never matches a selection, so a key missing from the options scores nobody
+        correct = [correct_option(q, index) for q, index in zip(self.questions, self.option_index)]
+        self.correct = np.array([-2 if k is None else k for k in correct], dtype=np.int16)
+        self.weights = np.array([q.get("points", 1) for q in self.questions], dtype=np.float64)
+
+        n_questions = len(self.questions)
+        self.attempts = 0
+        # Last column of option_counts counts unanswered questions
+        self.option_counts = np.zeros((n_questions, self.max_options + 1), dtype=np.int64)
+        self.sum_correct = np.zeros(n_questions, dtype=np.float64)
+        self.sum_correct_total = np.zeros(n_questions, dtype=np.float64)
+        self.sum_total = 0.0
+        self.sum_total_sq = 0.0
+
+    def encode(self, results: List[Dict[str, Any]]) -> np.ndarray:
+        """Build the option-index matrix of one chunk of results"""
+        rows: List[int] = []
+        cols: List[int] = []
+        options: List[int] = []
+        column = self.column
+        option_index = self.option_index
+        n_options = self.n_options
+        for row, result in enumerate(results):
+            for response in result.get("responses") or ():
+                col = column.get(response.get("question_id"))
+                if col is None:
+                    continue
+                # Results stored before option indices carry the option text
+                option = selected_option(
+                    n_options[col], option_index[col], response.get("selected_option"), response.get("selected_answer")
+                )
+                if option is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    options.append(option)
+        matrix = np.full((len(results), len(self.questions)), UNANSWERED, dtype=np.int16)
+        matrix[rows, cols] = options
+        return matrix
+
+    def add_matrix(self, matrix: np.ndarray) -> None:
+        n_attempts, n_questions = matrix.shape
+        if n_attempts == 0 or n_questions == 0:
+            self.attempts += n_attempts
+            return
+        slots = self.max_options + 1
+        selected = np.where(matrix == UNANSWERED, self.max_options, matrix).astype(np.int64)
+        flat = selected + np.arange(n_questions, dtype=np.int64) * slots
+        self.option_counts += np.bincount(flat.ravel(), minlength=n_questions * slots).reshape(n_questions, slots)
+
+        correct = (matrix == self.correct).astype(np.float64)
+        totals = correct @ self.weights
+        self.attempts += n_attempts
+        self.sum_correct += correct.sum(axis=0)
+        self.sum_correct_total += correct.T @ totals
+        self.sum_total += totals.sum()
+        self.sum_total_sq += totals @ totals
+
+    def add_results(self, results: List[Dict[str, Any]]) -> None:
+        self.add_matrix(self.encode(results))
+
+    def _discrimination(self) -> np.ndarray:
+        n = self.attempts
+        w = self.weights
+        sx = self.sum_correct
+        # Sums over the rest score R = T - w * x, from the running totals
+        sr = self.sum_total - w * sx
+        srr = self.sum_total_sq - 2 * w * self.sum_correct_total + w * w * sx
+        sxr = self.sum_correct_total - w * sx
+        cov = sxr / n - (sx / n) * (sr / n)
+        var_x = sx / n - (sx / n) ** 2
+        var_r = srr / n - (sr / n) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = cov / np.sqrt(var_x * var_r)
+        return np.where((var_x > 1e-12) & (var_r > 1e-12), r, np.nan)
+
+    def report(self) -> Dict[str, Any]:
+        n = self.attempts
+        difficulty = self.sum_correct / n if n else np.full(len(self.questions), np.nan)
+        discrimination = self._discrimination() if n else np.full(len(self.questions), np.nan)
+
+        questions = []
+        for i, question in enumerate(self.questions):
+            counts = self.option_counts[i]
+            questions.append({
+                "question_id": question["id"],
+                "question_text": question["question_text"],
+                "difficulty": _rounded(difficulty[i]),
+                "discrimination": _rounded(discrimination[i]),
+                "options": [
+                    {
+                        "option": option,
+                        "is_correct": bool(k == self.correct[i]),
+                        "count": int(counts[k]),
+                        "frequency": _rounded(counts[k] / n) if n else None,
+                    }
+                    for k, option in enumerate(question["options"])
+                ],
+                "unanswered": int(counts[self.max_options]),
+            })
+
+        return {
+            "quiz_title": self.quiz["title"],
+            "attempts": n,
+            "computed_at": datetime.utcnow(),
+            "questions": questions,
+            "excluded_questions": [
+                q["id"] for q in self.quiz["questions"] if q["id"] not in self.column
+            ],
+        }
+
+
+def _rounded(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+async def stream_by_version(
+    storage, versions, quiz: Dict[str, Any], fields: Iterable[str], chunk_size: int
+) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Chunks of a quiz's results grouped by the version they were scored on,
+    each with that version's title and questions
+    """
+    contents: Dict[Optional[str], Dict[str, Any]] = {}
+    async for results in storage.results.stream_for_quiz(quiz["id"], tuple(fields) + ("quiz_version",), chunk_size):
+        groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for result in results:
+            groups.setdefault(result.get("quiz_version"), []).append(result)
+        for version_id, group in groups.items():
+            if version_id not in contents:
+                version = await versions.get(version_id)
+                # Results from before versioning carry no version; the live quiz is the closest match
+                contents[version_id] = (
+                    {"title": version.title, "questions": version.questions} if version is not None else quiz
+                )
+            yield version_id, contents[version_id], group
+
+
+def version_sections(quiz: Dict[str, Any], reports: Dict[Optional[str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-version reports, the current version first and then by attempts"""
+    current = quiz.get("current_version")
+    sections = [
+        {"version_id": version_id, "is_current": version_id == current, **report}
+        for version_id, report in reports.items()
+    ]
+    sections.sort(key=lambda section: (not section["is_current"], -section["attempts"]))
+    return sections
+
+
+async def run_item_analysis(storage, versions, quiz: Dict[str, Any], chunk_size: int = 5000) -> Dict[str, Any]:
+    """Analyze every attempt of ``quiz`` against its version and store the report"""
+    analyzers: Dict[Optional[str], ItemAnalyzer] = {}
+    async for version_id, content, results in stream_by_version(storage, versions, quiz, ("responses",), chunk_size):
+        if version_id not in analyzers:
+            analyzers[version_id] = ItemAnalyzer(content)
+        # Encoding and the matrix sums are CPU-bound; keep them off the event loop
+        await asyncio.to_thread(analyzers[version_id].add_results, results)
+    sections = version_sections(quiz, {version_id: analyzer.report() for version_id, analyzer in analyzers.items()})
+    report = {
+        "quiz_title": quiz["title"],
+        "attempts": sum(section["attempts"] for section in sections),
+        "computed_at": datetime.utcnow(),
+        "versions": sections,
+    }
+    await storage.analytics.save(ITEM_ANALYSIS_KIND, quiz["id"], report)
+    logger.info(
+        "Item analysis of quiz %s finished over %d attempts and %d versions",
+        quiz["id"], report["attempts"], len(sections),
+    )
+    return report
@@ -0,0 +1,197 @@
+"""
+In-process runner for bulk admin operations.
+
+A job kind is registered with a ``fetch`` coroutine returning the next
+chunk of item keys after a cursor, in ascending key order, and a
+``run_chunk`` coroutine that processes one chunk and returns how many
+items it changed. Work is planned inside the job, a chunk at a time, so
+neither the request that submits a job nor the job document ever holds
+the full list of items.
+
+The job document persists the last key of the chunks finished so far as
+its ``cursor``. Chunks run concurrently but the cursor only moves past a
+chunk once every earlier one finished, so a job resumed after a crash
+re-runs at most the chunks that were in flight. Chunk handlers must be
+idempotent for that reason.
+
+Jobs are persisted through the storage job repository. A worker claims a
+job with a lease that it renews after every chunk; any worker picks up
+queued jobs and jobs whose lease expired, so work survives restarts.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class JobKind(NamedTuple):
+    fetch: Callable[[Dict[str, Any], Optional[str], int], Awaitable[List[str]]]
+    run_chunk: Callable[[Dict[str, Any], List[str]], Awaitable[int]]
+
+
+class JobRunner:
+    def __init__(
+        self,
+        repository,
+        max_running: int = 2,
+        chunk_size: int = 200,
+        chunk_concurrency: int = 4,
+        lease_seconds: float = 120,
+        poll_seconds: float = 30,
+    ):
+        self.repository = repository
+        self.max_running = max_running
+        self.chunk_size = chunk_size
+        self.chunk_concurrency = chunk_concurrency
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_seconds = poll_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.kinds: Dict[str, JobKind] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        self._poller: Optional[asyncio.Task] = None
+
+    def register(self, kind: str, fetch, run_chunk) -> None:
+        self.kinds[kind] = JobKind(fetch, run_chunk)
+
+    async def start(self) -> None:
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        tasks = list(self._running.values())
+        if self._poller is not None:
+            tasks.append(self._poller)
+        for task in tasks:
+            task.cancel()
+        # Interrupted jobs keep their lease until it expires, then resume
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+        self._cancelled.clear()
+        self._poller = None
+
+    async def submit(self, kind: str, params: Dict[str, Any], created_by: str) -> Dict[str, Any]:
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params,
+            "status": "queued",
+            "cursor": None,
+            "completed_chunks": 0,
+            "processed_items": 0,
+            "cancel_requested": False,
+            "error": None,
+            "owner": None,
+            "lease_expires_at": None,
+            "created_by": created_by,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.repository.create(job)
+        await self._try_start(job["id"])
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        if not await self.repository.request_cancel(job_id):
+            return False
+        # Stops before the next chunk here; other workers see the flag when recording one,
+        # and a job nobody runs yet finishes as cancelled when it is claimed
+        if job_id in self._running:
+            self._cancelled.add(job_id)
+        return True
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                for job_id in await self.repository.list_claimable(datetime.utcnow()):
+                    if len(self._running) >= self.max_running:
+                        break
+                    await self._try_start(job_id)
+            except Exception:
+                logger.exception("Polling for jobs failed")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _try_start(self, job_id: str) -> None:
+        if job_id in self._running or len(self._running) >= self.max_running:
+            return
+        now = datetime.utcnow()
+        if not await self.repository.claim(job_id, self.owner, now, now + self.lease):
+            return
+        # A fresh context, so a job started from a request does not inherit its trace
+        task = asyncio.create_task(self._execute(job_id), context=contextvars.Context())
+        self._running[job_id] = task
+        task.add_done_callback(lambda _: self._running.pop(job_id, None))
+
+    async def _execute(self, job_id: str) -> None:
+        job = await self.repository.get(job_id)
+        kind = self.kinds.get(job["kind"])
+        if kind is None:
+            await self._finish(job_id, "failed", error=f"Unknown job kind: {job['kind']}")
+            return
+        if job.get("cancel_requested"):
+            await self._finish(job_id, "cancelled")
+            return
+
+        await self.repository.update(job_id, {
+            "status": "running",
+            "started_at": job.get("started_at") or datetime.utcnow(),
+        })
+        after = job.get("cursor")
+        if after is not None:
+            logger.info("Resuming job %s after %d chunks", job_id, job["completed_chunks"])
+
+        # Chunks in flight, oldest first, with the last key of each
+        in_flight: Deque[Tuple[asyncio.Task, str]] = deque()
+
+        async def record_oldest() -> None:
+            task, last_key = in_flight.popleft()
+            processed = await task
+            lease_until = datetime.utcnow() + self.lease
+            if await self.repository.record_chunk(job_id, last_key, processed, lease_until):
+                self._cancelled.add(job_id)
+
+        try:
+            while job_id not in self._cancelled:
+                items = await kind.fetch(job["params"], after, self.chunk_size)
+                if not items:
+                    break
+                after = items[-1]
+                in_flight.append((asyncio.create_task(kind.run_chunk(job["params"], items)), after))
+                if len(in_flight) >= self.chunk_concurrency:
+                    await record_oldest()
+            while in_flight:
+                await record_oldest()
+        except asyncio.CancelledError:
+            for task, _ in in_flight:
+                task.cancel()
+            raise
+        except Exception as e:
+            for task, _ in in_flight:
+                task.cancel()
+            logger.exception("Job %s failed", job_id)
+            await self._finish(job_id, "failed", error=str(e))
+            return
+
+        await self._finish(job_id, "cancelled" if job_id in self._cancelled else "completed")
+
+    async def _finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        self._cancelled.discard(job_id)
+        await self.repository.update(job_id, {
+            "status": status,
+            "error": error,
+            "finished_at": datetime.utcnow(),
+            "owner": None,
+            "lease_expires_at": None,
+        })
+        logger.info("Job %s %s", job_id, status)
+
@@ -0,0 +1,174 @@
+"""
+Multiple choice answers as option indices.
+
+Questions store ``correct_option`` and responses ``selected_option``, an
+index into the question's ``options``. Documents written before that
+carry the option text in ``correct_answer`` and ``selected_answer``; the
+helpers here read both forms, and running this module rewrites the stored
+quizzes and results in bulk::
+
+    python option_indices.py [--batch-size 1000]
+
+Results in the archive are not rewritten, since segments are never
+modified; they are read through the same helpers.
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def option_lookup(question: Dict[str, Any]) -> Dict[str, int]:
+    """Index of each option text; the first wins if options repeat"""
+    lookup: Dict[str, int] = {}
+    for index, option in enumerate(question.get("options") or ()):
+        lookup.setdefault(option, index)
+    return lookup
+
+
+def correct_option(question: Dict[str, Any], lookup: Optional[Dict[str, int]] = None) -> Optional[int]:
+    if question.get("correct_option") is not None:
+        return question["correct_option"]
+    if question.get("correct_answer") is None:
+        return None
+    return (lookup if lookup is not None else option_lookup(question)).get(question["correct_answer"])
+
+
+def selected_option(
+    n_options: int, lookup: Dict[str, int], index: Optional[int], text: Optional[str]
+) -> Optional[int]:
+    """Option picked by a response given as an index or, from older clients, as option text"""
+    if index is None:
+        return lookup.get(text) if text is not None else None
+    return index if 0 <= index < n_options else None
+
+
+def migrate_question(question: Dict[str, Any]) -> Dict[str, Any]:
+    question = dict(question)
+    if question.get("question_type") == "multiple_choice" and "correct_answer" in question:
+        index = correct_option(question)
+        if index is None and question["correct_answer"] is not None:
+            # A key that matches no option scores nobody; keep it visible instead of dropping it
+            logger.warning("Question %s has an answer key outside its options", question.get("id"))
+            return question
+        question.pop("correct_answer")
+        question["correct_option"] = index
+    return question
+
+
+def migrate_result(result: Dict[str, Any], lookups: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    """Rewrite a result's MCQ answers as indices, given each question's option lookup"""
+    responses = []
+    for response in result.get("responses") or ():
+        lookup = lookups.get(response.get("question_id"))
+        text = response.get("selected_answer")
+        if lookup is not None and text is not None and response.get("selected_option") is None:
+            index = lookup.get(text)
+            if index is not None:
+                response = {**response, "selected_option": index}
+                del response["selected_answer"]
+        responses.append({key: value for key, value in response.items() if value is not None})
+
+    # Versioned results render option text from their version; older ones keep their own copy
+    drop_text = bool(result.get("quiz_version"))
+    details = []
+    for detail in result.get("detailed_results") or ():
+        lookup = lookups.get(detail.get("question_id"))
+        if detail.get("question_type") == "multiple_choice" and lookup is not None:
+            detail = dict(detail)
+            for text_field, index_field in (("selected_answer", "selected_option"), ("correct_answer", "correct_option")):
+                if index_field in detail or text_field not in detail:
+                    continue
+                index = lookup.get(detail[text_field])
+                detail[index_field] = index
+                if drop_text and (index is not None or detail[text_field] is None):
+                    del detail[text_field]
+        details.append(detail)
+    return {"responses": responses, "detailed_results": details}
+
+
+async def _flush(collection, operations: List[Any]) -> int:
+    if not operations:
+        return 0
+    outcome = await collection.bulk_write(operations, ordered=False)
+    operations.clear()
+    return outcome.modified_count
+
+
+async def migrate(db, batch_size: int = 1000) -> Dict[str, int]:
+    """Rewrite string answers in ``quizzes`` and ``quiz_results`` as option indices"""
+    from pymongo import UpdateOne
+
+    operations: List[Any] = []
+    quizzes = 0
+    cursor = db.quizzes.find({"questions.correct_answer": {"$exists": True}}, {"_id": 1, "questions": 1})
+    async for quiz in cursor:
+        questions = [migrate_question(question) for question in quiz["questions"]]
+        operations.append(UpdateOne({"_id": quiz["_id"]}, {"$set": {"questions": questions}}))
+        if len(operations) >= batch_size:
+            quizzes += await _flush(db.quizzes, operations)
+    quizzes += await _flush(db.quizzes, operations)
+
+    # Option lists never change within a version, so results resolve against the one they were scored on
+    lookup_cache: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+    async def lookups_for(result) -> Dict[str, Dict[str, int]]:
+        key = result.get("quiz_version") or result["quiz_id"]
+        if key not in lookup_cache:
+            source = None
+            if result.get("quiz_version"):
+                source = await db.quiz_versions.find_one({"version_id": result["quiz_version"]}, {"questions": 1})
+            if source is None:
+                source = await db.quizzes.find_one({"id": result["quiz_id"]}, {"questions": 1})
+            lookup_cache[key] = {
+                question["id"]: option_lookup(question)
+                for question in (source or {}).get("questions", [])
+                if question.get("question_type") == "multiple_choice"
+            }
+        return lookup_cache[key]
+
+    results = 0
+    cursor = db.quiz_results.find(
+        {"$or": [
+            {"responses.selected_answer": {"$type": "string"}},
+            {"detailed_results.correct_answer": {"$exists": True}},
+        ]},
+        {"_id": 1, "quiz_id": 1, "quiz_version": 1, "responses": 1, "detailed_results": 1},
+        batch_size=batch_size,
+    )
+    async for result in cursor:
+        changes = migrate_result(result, await lookups_for(result))
+        operations.append(UpdateOne({"_id": result["_id"]}, {"$set": changes}))
+        if len(operations) >= batch_size:
+            results += await _flush(db.quiz_results, operations)
+    results += await _flush(db.quiz_results, operations)
+
+    logger.info("Migrated %d quizzes and %d results to option indices", quizzes, results)
+    return {"quizzes": quizzes, "results": results}
+
+
+async def _main(batch_size: int) -> None:
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / ".env")
+    from storage import create_storage
+
+    storage = create_storage()
+    if getattr(storage, "db", None) is None:
+        raise SystemExit("The migration only applies to the MongoDB storage engine")
+    try:
+        print(await migrate(storage.db, batch_size))
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Rewrite stored MCQ answers as option indices")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(_main(parser.parse_args().batch_size))
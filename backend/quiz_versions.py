@@ -0,0 +1,177 @@
+"""
+Immutable, content-addressed quiz versions.
+
+A version is the scoring-relevant content of a quiz (title, questions,
+points) identified by a hash of that content. Versions are never
+modified, so once loaded they are cached for the life of the process
+with no invalidation. Results record the version they were scored
+against, and question text and explanations are rehydrated from it
+instead of being copied into every result.
+"""
+
+import asyncio
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from option_indices import correct_option, option_lookup, selected_option
+from tracing import span
+
+VERSION_CONTENT_FIELDS = ("title", "questions", "total_points", "requires_evaluation")
+
+# Per-question fields of a result that are served from its version instead of being stored
+VERSIONED_DETAIL_FIELDS = ("question_text", "explanation", "selected_answer", "correct_answer")
+
+
+class QuizVersion:
+    __slots__ = (
+        "version_id", "quiz_id", "title", "questions", "questions_by_id",
+        "total_points", "requires_evaluation", "option_lookups", "correct_options", "_scoring",
+    )
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.version_id = doc["version_id"]
+        self.quiz_id = doc["quiz_id"]
+        self.title = doc["title"]
+        self.questions = doc["questions"]
+        self.questions_by_id = {question["id"]: question for question in self.questions}
+        self.total_points = doc["total_points"]
+        self.requires_evaluation = doc["requires_evaluation"]
+        # Versions written before option indices keep the answer key as option text
+        self.option_lookups = {question["id"]: option_lookup(question) for question in self.questions}
+        self.correct_options = {
+            question["id"]: correct_option(question, self.option_lookups[question["id"]])
+            for question in self.questions
+        }
+        # Per-question inputs of score(), resolved once since versions never change
+        self._scoring = {
+            question["id"]: (
+                question["question_type"],
+                question.get("options") or [],
+                self.option_lookups[question["id"]],
+                self.correct_options[question["id"]],
+                question.get("points", 1),
+                question.get("question_text", ""),
+                question.get("explanation", ""),
+            )
+            for question in self.questions
+        }
+
+    def score(self, responses) -> Tuple[int, List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Auto score, detailed results and compact stored responses of a submission"""
+        auto_score = 0
+        detailed_results = []
+        stored_responses = []
+        for response in responses:
+            question_id = response.question_id
+            scoring = self._scoring.get(question_id)
+            if scoring is None:
+                continue
+            question_type, options, lookup, correct, points, question_text, explanation = scoring
+
+            if question_type == "multiple_choice":
+                selected = selected_option(len(options), lookup, response.selected_option, response.selected_answer)
+                is_correct = selected is not None and selected == correct
+                points_earned = points if is_correct else 0
+                auto_score += points_earned
+
+                stored_responses.append({"question_id": question_id, "selected_option": selected})
+                detailed_results.append({
+                    "question_id": question_id,
+                    "question_text": question_text,
+                    "question_type": "multiple_choice",
+                    "selected_option": selected,
+                    "selected_answer": options[selected] if selected is not None else None,
+                    "correct_option": correct,
+                    "correct_answer": options[correct] if correct is not None else None,
+                    "is_correct": is_correct,
+                    "points_possible": points,
+                    "points_earned": points_earned,
+                    "explanation": explanation
+                })
+
+            elif question_type == "text":
+                stored_responses.append({"question_id": question_id, "text_answer": response.text_answer})
+                detailed_results.append({
+                    "question_id": question_id,
+                    "question_text": question_text,
+                    "question_type": "text",
+                    "text_answer": response.text_answer,
+                    "points_possible": points,
+                    "points_earned": 0,
+                    "is_evaluated": False
+                })
+        return auto_score, detailed_results, stored_responses
+
+
+def version_id_for(quiz: Dict[str, Any]) -> str:
+    content = {field: quiz.get(field) for field in VERSION_CONTENT_FIELDS}
+    content["quiz_id"] = quiz["id"]
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+class QuizVersionStore:
+    def __init__(self, repository):
+        self.repository = repository
+        self._cache: Dict[str, QuizVersion] = {}
+
+    async def save(self, quiz: Dict[str, Any]) -> QuizVersion:
+        """Store the version of ``quiz``'s current content; a no-op if it already exists"""
+        version_id = version_id_for(quiz)
+        if version_id in self._cache:
+            return self._cache[version_id]
+        doc = {field: quiz.get(field) for field in VERSION_CONTENT_FIELDS}
+        doc.update(version_id=version_id, quiz_id=quiz["id"], created_at=datetime.utcnow())
+        await self.repository.save_version(doc)
+        version = self._cache[version_id] = QuizVersion(doc)
+        return version
+
+    async def get(self, version_id: Optional[str]) -> Optional[QuizVersion]:
+        if not version_id:
+            return None
+        version = self._cache.get(version_id)
+        if version is None:
+            doc = await self.repository.get_version(version_id)
+            if doc is None:
+                return None
+            version = self._cache[version_id] = QuizVersion(doc)
+        return version
+
+    async def preload(self, version_ids: Iterable[str]) -> int:
+        """Load versions into the cache ahead of their first request; returns how many were fetched"""
+        missing = {version_id for version_id in version_ids if version_id and version_id not in self._cache}
+        await asyncio.gather(*(self.get(version_id) for version_id in missing))
+        return len(missing)
+
+    async def for_quiz(self, quiz: Dict[str, Any]) -> QuizVersion:
+        """Current version of a quiz document, creating it for quizzes that predate versions"""
+        version = await self.get(quiz.get("current_version"))
+        if version is None:
+            version = await self.save(quiz)
+            await self.repository.update(quiz["id"], {"current_version": version.version_id})
+        return version
+
+    async def rehydrate(self, results: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill question text and explanations of results back in from their versions"""
+        results = list(results)
+        with span("results.rehydrate", results=len(results)):
+            for result in results:
+                version = await self.get(result.get("quiz_version"))
+                if version is None:
+                    continue  # older results carry their own copy
+                for detail in result.get("detailed_results") or ():
+                    question = version.questions_by_id.get(detail["question_id"])
+                    if question is None:
+                        continue
+                    detail.setdefault("question_text", question["question_text"])
+                    if detail.get("question_type") == "multiple_choice":
+                        detail.setdefault("explanation", question.get("explanation") or "")
+                        options = question.get("options") or []
+                        for index_field, text_field in (
+                            ("selected_option", "selected_answer"), ("correct_option", "correct_answer")
+                        ):
+                            index = detail.get(index_field)
+                            detail.setdefault(text_field, options[index] if index is not None else None)
+        return results
@@ -0,0 +1,175 @@
+"""
+Token-bucket rate limiting.
+
+Each ``TokenBucketLimiter`` guards one route: a bucket per key (user id or
+client IP) holds up to ``capacity`` tokens and refills at
+``capacity / period`` tokens per second. Buckets live in the worker by
+default; ``MongoBucketStore`` shares them between workers through an
+atomic ``findOneAndUpdate`` on the ``rate_limits`` collection, where a TTL
+index drops buckets once they would have refilled.
+"""
+
+import itertools
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+from storage import StorageUnavailableError
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a key has no token left; ``retry_after`` is in seconds"""
+
+    def __init__(self, route: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {route}")
+        self.route = route
+        self.retry_after = retry_after
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """Parse ``"<capacity>/<period seconds>"`` e.g. ``"10/60"``"""
+    capacity, period = spec.split("/")
+    return int(capacity), float(period)
+
+
+class MemoryBucketStore:
+    """
+    Buckets in a dict of ``[tokens, updated_at, full_at]`` lists, kept in
+    least recently used order. ``full_at`` is when the bucket will have
+    refilled, by the capacity and rate of its own route.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, List[float]] = {}
+
+    async def init_indexes(self) -> None:
+        pass
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        """Consume a token and return 0, or the seconds until one is available"""
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            self._buckets[key] = [capacity - 1.0, now, now + 1.0 / rate]
+            return 0.0
+        # Reinserting keeps the dict ordered from least to most recently used
+        self._buckets[key] = bucket
+        tokens = bucket[0] + (now - bucket[1]) * rate
+        if tokens > capacity:
+            tokens = capacity
+        bucket[1] = now
+        retry_after = 0.0
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            retry_after = (1.0 - tokens) / rate
+        bucket[0] = tokens
+        bucket[2] = now + (capacity - tokens) / rate
+        return retry_after
+
+    def _evict(self, now: float) -> None:
+        # Buckets that have refilled completely carry no state worth keeping
+        stale = [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for key in stale:
+            del self._buckets[key]
+        # Otherwise drop the least recently used, a batch at a time so the scan above stays rare
+        excess = len(self._buckets) - (self.max_keys - max(1, self.max_keys // 10))
+        if excess > 0:
+            for key in list(itertools.islice(self._buckets, excess)):
+                del self._buckets[key]
+
+
+class MongoBucketStore:
+    """Buckets shared by every worker, updated atomically in MongoDB"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def init_indexes(self) -> None:
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            raise StorageUnavailableError(str(e)) from e
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        try:
+            return await self._take(key, capacity, rate)
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            raise StorageUnavailableError(str(e)) from e
+
+    async def _take(self, key: str, capacity: int, rate: float) -> float:
+        now = time.time()
+        # A bucket left alone this long is full again, so deleting it loses nothing
+        expires_at = datetime.utcnow() + timedelta(seconds=capacity / rate)
+        refilled = {"$min": [
+            capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, rate]},
+            ]},
+        ]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now, "expires_at": expires_at}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (1.0 - bucket["tokens"]) / rate
+
+
+class TokenBucketLimiter:
+    def __init__(self, route: str, capacity: int, period: float, store):
+        self.route = route
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.store = store
+
+    async def hit(self, key: str) -> None:
+        retry_after = await self.store.take(f"{self.route}:{key}", self.capacity, self.rate)
+        if retry_after:
+            raise RateLimitExceeded(self.route, retry_after)
+
+
+def create_limiters(defaults: Dict[str, str], db=None) -> Dict[str, TokenBucketLimiter]:
+    """
+    Build one limiter per route from ``defaults``, overridable with
+    ``RATE_LIMIT_<ROUTE>=<capacity>/<seconds>``. ``RATE_LIMIT_STORE=mongo``
+    shares buckets between workers when a Mongo database is available.
+    """
+    store_name = os.environ.get("RATE_LIMIT_STORE", "memory").lower()
+    if store_name == "mongo" and db is not None:
+        store = MongoBucketStore(db.rate_limits)
+    elif store_name in ("memory", "mongo"):
+        store = MemoryBucketStore()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_STORE: {store_name}")
+
+    limiters = {}
+    for route, spec in defaults.items():
+        capacity, period = parse_limit(os.environ.get(f"RATE_LIMIT_{route.upper()}", spec))
+        limiters[route] = TokenBucketLimiter(route, capacity, period, store)
+    return limiters
+
+
+async def init_limiters(limiters: Iterable[TokenBucketLimiter]) -> None:
+    """Create the indexes the limiters' bucket stores rely on"""
+    for store in {id(limiter.store): limiter.store for limiter in limiters}.values():
+        await store.init_indexes()
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
@@ -1,36 +1,95 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
+import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any, Union
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
+from admission import AdmissionMiddleware, create_admission_controller
+from archive import ResultArchive, run_archival
+from cache import InvalidationBus, SerializedCache, serialize_json
+from change_watcher import RESET, ChangeStreamWatcher
+from jobs import JobRunner
+from option_indices import option_lookup
+from quiz_versions import VERSIONED_DETAIL_FIELDS, QuizVersionStore
+from ratelimit import RateLimitExceeded, create_limiters, init_limiters, retry_after_header
+from summaries import list_user_results, rebuild_summary
+from tracing import TracingMiddleware, create_tracer, current_request_id, span
+from storage import (
+    create_storage, StorageUnavailableError, MAX_LIST_RESULTS, QUIZ_LISTING_FIELDS, RESULT_LEADERBOARD_FIELDS,
+)
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Request tracing, exported as OTLP JSON for a TRACE_SAMPLE_RATE share of requests
+tracer = create_tracer()
+
+# Storage engine (MongoDB unless STORAGE_BACKEND=memory)
+storage = create_storage()
+
+# Immutable quiz versions that results are scored and rendered against
+quiz_versions = QuizVersionStore(storage.quizzes)
+
+# Cold tier for old published results
+result_archive = ResultArchive(os.environ.get("ARCHIVE_DIR", str(ROOT_DIR / "archive")))
+
+# Background jobs for bulk admin operations
+job_runner = JobRunner(
+    storage.jobs,
+    max_running=int(os.environ.get("JOB_MAX_RUNNING", "2")),
+    chunk_size=int(os.environ.get("JOB_CHUNK_SIZE", "200")),
+    chunk_concurrency=int(os.environ.get("JOB_CHUNK_CONCURRENCY", "4")),
+)
+
+# Cross-worker cache invalidation and the quiz catalogue cache
+invalidation_bus = InvalidationBus(
+    os.environ.get("CACHE_BUS_DIR", os.path.join(tempfile.gettempdir(), "quiz-invalidation-bus"))
+)
+quiz_catalogue = SerializedCache(
+    "quiz_catalogue",
+    # From the primary: a lagging secondary would pin a stale catalogue for the whole TTL
+    lambda: storage.quizzes.list_active(QUIZ_LISTING_FIELDS, primary=True),
+    ttl=float(os.environ.get("CATALOGUE_CACHE_TTL_SECONDS", "300")),
+    bus=invalidation_bus,
+)
 
 # Security
 SECRET_KEY = "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_MINUTES = 12 * 60
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-# Create the main app without a prefix
-app = FastAPI()
+# Rate limits as "<requests>/<seconds>", overridable with RATE_LIMIT_<ROUTE>; login and
+# register count per client IP and email, with a looser per-IP cap for schools behind one NAT
+rate_limiters = create_limiters(
+    {
+        "login": "10/60",
+        "login_ip": "300/60",
+        "register": "5/60",
+        "register_ip": "100/60",
+        "quiz_attempt": "5/60",
+        "token_refresh": "30/60",
+    },
+    db=getattr(storage, "db", None),
+)
+
+# Per route class in-flight caps, submissions first, reads shed under overload
+admission = create_admission_controller()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -58,6 +117,10 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: Optional[str] = None
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
 
 # Enhanced Question Models
 class Question(BaseModel):
@@ -65,15 +128,17 @@ class Question(BaseModel):
     question_text: str
     question_type: str  # "multiple_choice" or "text"
     options: Optional[List[str]] = None  # For multiple choice questions
-    correct_answer: Optional[str] = None  # For multiple choice questions
+    correct_option: Optional[int] = None  # Index into options, for multiple choice questions
     explanation: Optional[str] = None
     points: int = 1  # Points for this question
 
 class QuestionCreate(BaseModel):
+    id: Optional[str] = None  # Keep an existing question's id when editing a quiz
     question_text: str
     question_type: str = "multiple_choice"
     options: Optional[List[str]] = None
-    correct_answer: Optional[str] = None
+    correct_option: Optional[int] = None
+    correct_answer: Optional[str] = None  # Option text, accepted from older clients
     explanation: Optional[str] = None
     points: int = 1
 
@@ -90,6 +155,7 @@ class Quiz(BaseModel):
     total_points: int = 0
     is_active: bool = True
     requires_evaluation: bool = False  # True if has text questions
+    current_version: Optional[str] = None
 
 class QuizCreate(BaseModel):
     title: str
@@ -100,12 +166,14 @@ class QuizCreate(BaseModel):
 
 class QuizResponse(BaseModel):
     question_id: str
-    selected_answer: Optional[str] = None  # For MCQ
+    selected_option: Optional[int] = None  # For MCQ, index into the options
+    selected_answer: Optional[str] = None  # Option text, accepted from older clients
     text_answer: Optional[str] = None  # For text questions
 
 class QuizAttemptSubmission(BaseModel):
     responses: List[QuizResponse]
     time_taken: Optional[int] = None  # in seconds
+    quiz_version: Optional[str] = None  # Version the quiz was taken on, the current one if omitted
 
 class TextAnswerEvaluation(BaseModel):
     question_id: str
@@ -119,6 +187,7 @@ class QuizEvaluation(BaseModel):
 class QuizResult(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     quiz_id: str
+    quiz_version: Optional[str] = None
     quiz_title: str
     user_id: str
     user_email: str
@@ -153,25 +222,104 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_token_pair(user_data: dict):
+    """Issue access and refresh tokens carrying the claims get_current_user needs"""
+    claims = {
+        "sub": user_data["email"],
+        "uid": user_data["id"],
+        "role": user_data.get("role", "user"),
+        "name": user_data["full_name"],
+        "ver": user_data.get("token_version", 0),
+    }
+    access_token = create_access_token(
+        {**claims, "typ": "access"}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_access_token(
+        {**claims, "typ": "refresh"}, expires_delta=timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+    )
+    return access_token, refresh_token
+
+class TokenDenylist:
+    """Lowest valid token version per user, kept only for users who revoked tokens"""
+
+    def __init__(self):
+        self.min_versions: Dict[str, int] = {}
+
+    def revoke(self, user_id: str, version: int):
+        if version > self.min_versions.get(user_id, 0):
+            self.min_versions[user_id] = version
+
+    def is_revoked(self, user_id: str, version: int) -> bool:
+        return version < self.min_versions.get(user_id, 0)
+
+token_denylist = TokenDenylist()
+
+def _apply_revocation(key: str):
+    user_id, version = key.rsplit(":", 1)
+    token_denylist.revoke(user_id, int(version))
+
+invalidation_bus.subscribe("token_revocation", _apply_revocation)
+
+async def load_token_denylist():
+    for user_id, version in (await storage.users.list_token_versions()).items():
+        token_denylist.revoke(user_id, version)
+
+_denylist_reloads = set()
+
+async def _reload_token_denylist():
+    try:
+        await load_token_denylist()
+    except StorageUnavailableError as e:
+        logger.warning("Could not reload token revocations: %s", e)
+
+def _revoke_from_change(event):
+    if event.operation == RESET:
+        # Revocations made while the stream was down were never seen, so read them all again
+        task = asyncio.create_task(_reload_token_denylist())
+        _denylist_reloads.add(task)
+        task.add_done_callback(_denylist_reloads.discard)
+    elif event.document.get("token_version") and event.document_id:
+        token_denylist.revoke(event.document_id, event.document["token_version"])
+
+# Change streams keep every worker's caches in sync with writes made by
+# any worker; without them the invalidation bus and cache TTLs apply
+change_watcher = None
+if getattr(storage, "db", None) is not None and os.environ.get("CHANGE_STREAMS", "on") == "on":
+    change_watcher = ChangeStreamWatcher(storage.db)
+    change_watcher.subscribe("quizzes", lambda event: quiz_catalogue.drop())
+    change_watcher.subscribe("users", _revoke_from_change)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    with span("auth.authenticate") as auth_span:
+        try:
+            token = credentials.credentials
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None or payload.get("typ", "access") != "access":
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = await db.users.find_one({"email": email}, {"_id": 0})
-    if user is None:
-        raise credentials_exception
-    return User(**user)
+        
+        # Tokens carrying claims authenticate without touching the database
+        if "uid" in payload:
+            auth_span.set_attribute("user.id", payload["uid"])
+            if token_denylist.is_revoked(payload["uid"], payload.get("ver", 0)):
+                raise credentials_exception
+            return User.model_construct(
+                id=payload["uid"], email=email, full_name=payload["name"], role=payload["role"]
+            )
+        
+        # Tokens issued before claims were added still need a lookup
+        auth_span.set_attribute("auth.legacy_token", True)
+        user = await storage.users.get_by_email(email)
+        if user is None or user.get("token_version", 0) > 0:
+            raise credentials_exception
+        return User(**user)
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -181,12 +329,39 @@ async def get_admin_user(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
+def client_ip(request: Request) -> str:
+    # Run uvicorn with --proxy-headers behind a proxy
+    return request.client.host if request.client else "unknown"
+
+def limit_by_ip(route: str):
+    """Rate limit a route per client IP"""
+    limiter = rate_limiters[route]
+
+    async def check(request: Request):
+        await limiter.hit(client_ip(request))
+    return Depends(check)
+
+async def limit_by_ip_and_email(route: str, request: Request, email: str):
+    """Rate limit a route per client IP and email, within a looser per-IP cap"""
+    ip = client_ip(request)
+    await rate_limiters[f"{route}_ip"].hit(ip)
+    await rate_limiters[route].hit(f"{ip}:{email.lower()}")
+
+def limit_by_user(route: str):
+    """Rate limit a route per authenticated user"""
+    limiter = rate_limiters[route]
+
+    async def check(current_user: User = Depends(get_current_user)):
+        await limiter.hit(current_user.id)
+    return Depends(check)
+
 # Authentication Endpoints
 @api_router.post("/register", response_model=User)
-async def register_user(user_data: UserCreate):
+async def register_user(user_data: UserCreate, request: Request):
+    await limit_by_ip_and_email("register", request, user_data.email)
     try:
         # Check if user already exists
-        existing_user = await db.users.find_one({"email": user_data.email})
+        existing_user = await storage.users.get_by_email(user_data.email)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -200,19 +375,20 @@ async def register_user(user_data: UserCreate):
         user_dict["hashed_password"] = hashed_password
         
         new_user = User(**user_dict)
-        await db.users.insert_one(new_user.dict())
+        await storage.users.create({**new_user.dict(), "hashed_password": hashed_password})
         
         return new_user
-    except HTTPException:
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
 
 @api_router.post("/login", response_model=Token)
-async def login_user(user_credentials: UserLogin):
+async def login_user(user_credentials: UserLogin, request: Request):
+    await limit_by_ip_and_email("login", request, user_credentials.email)
     try:
         # Find user by email
-        user_data = await db.users.find_one({"email": user_credentials.email}, {"_id": 0})
+        user_data = await storage.users.get_by_email(user_credentials.email)
         if not user_data:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -226,191 +402,294 @@ async def login_user(user_credentials: UserLogin):
                 detail="Incorrect email or password"
             )
         
-        # Create access token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user_data["email"]}, expires_delta=access_token_expires
-        )
+        # Create access and refresh tokens
+        access_token, refresh_token = create_token_pair(user_data)
         
         user_data.pop("hashed_password")  # Remove password from response
         user = User(**user_data)
         
-        return Token(access_token=access_token, token_type="bearer", user=user)
-    except HTTPException:
+        return Token(access_token=access_token, refresh_token=refresh_token, token_type="bearer", user=user)
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Login error: {str(e)}")
 
+@api_router.post("/token/refresh", response_model=Token, dependencies=[limit_by_ip("token_refresh")])
+async def refresh_access_token(body: TokenRefresh):
+    """Exchange a refresh token for a new token pair"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(body.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    if payload.get("typ") != "refresh":
+        raise credentials_exception
+    
+    # Refreshing re-reads the user so role changes and revocations take effect
+    user_data = await storage.users.get_by_email(payload.get("sub"))
+    if (
+        not user_data
+        or not user_data.get("is_active", True)
+        or user_data.get("token_version", 0) != payload.get("ver", 0)
+    ):
+        raise credentials_exception
+    
+    access_token, refresh_token = create_token_pair(user_data)
+    user_data.pop("hashed_password", None)
+    return Token(access_token=access_token, refresh_token=refresh_token, token_type="bearer", user=User(**user_data))
+
+@api_router.post("/logout")
+async def logout_user(current_user: User = Depends(get_current_user)):
+    """Revoke every access and refresh token issued to the current user"""
+    version = await storage.users.bump_token_version(current_user.email)
+    token_denylist.revoke(current_user.id, version)
+    invalidation_bus.publish("token_revocation", f"{current_user.id}:{version}")
+    return {"message": "Logged out successfully"}
+
 @api_router.get("/me", response_model=User)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return current_user
+    # Claims only carry identity and role, so load the full profile here
+    user = await storage.users.get_by_email(current_user.email)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return User(**user)
 
 # Enhanced Quiz Management Endpoints
+def build_quiz_content(quiz_data: QuizCreate) -> Dict[str, Any]:
+    """Quiz fields derived from submitted quiz data"""
+    # Convert QuestionCreate to Question models
+    questions = []
+    total_points = 0
+    requires_evaluation = False
+    
+    for q in quiz_data.questions:
+        data = q.dict(exclude_none=True)
+        answer = data.pop("correct_answer", None)
+        if q.question_type == "multiple_choice":
+            options = q.options or []
+            if q.correct_option is None and answer is not None:
+                data["correct_option"] = option_lookup(data).get(answer)
+            if data.get("correct_option") is None or not 0 <= data["correct_option"] < len(options):
+                raise HTTPException(status_code=400, detail=f"Correct answer of '{q.question_text}' must be one of its options")
+        question = Question(**data)
+        questions.append(question)
+        total_points += question.points
+        if question.question_type == "text":
+            requires_evaluation = True
+    
+    quiz_dict = quiz_data.dict()
+    quiz_dict['questions'] = [q.dict() for q in questions]
+    quiz_dict['total_questions'] = len(questions)
+    quiz_dict['total_points'] = total_points
+    quiz_dict['requires_evaluation'] = requires_evaluation
+    return quiz_dict
+
 @api_router.post("/quizzes", response_model=Quiz)
 async def create_quiz(quiz_data: QuizCreate, current_user: User = Depends(get_admin_user)):
     """Create a new quiz (Admin only)"""
     try:
-        # Convert QuestionCreate to Question models
-        questions = []
-        total_points = 0
-        requires_evaluation = False
-        
-        for q in quiz_data.questions:
-            question = Question(**q.dict())
-            questions.append(question)
-            total_points += question.points
-            if question.question_type == "text":
-                requires_evaluation = True
-        
-        quiz_dict = quiz_data.dict()
-        quiz_dict['questions'] = [q.dict() for q in questions]
-        quiz_dict['total_questions'] = len(questions)
-        quiz_dict['total_points'] = total_points
-        quiz_dict['requires_evaluation'] = requires_evaluation
+        quiz_dict = build_quiz_content(quiz_data)
         quiz_dict['created_by'] = current_user.email
         
         quiz = Quiz(**quiz_dict)
         
+        # Store the version before the quiz that points at it
+        version = await quiz_versions.save(quiz.dict())
+        quiz.current_version = version.version_id
+        
         # Insert into database
-        await db.quizzes.insert_one(quiz.dict())
+        await storage.quizzes.create(quiz.dict())
+        quiz_catalogue.invalidate()
         
         return quiz
+    except (HTTPException, StorageUnavailableError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating quiz: {str(e)}")
 
+@api_router.put("/quizzes/{quiz_id}", response_model=Quiz)
+async def update_quiz(quiz_id: str, quiz_data: QuizCreate, current_user: User = Depends(get_admin_user)):
+    """Edit a quiz as a new version; results already submitted keep the version they were scored on"""
+    try:
+        quiz = await storage.quizzes.get_active(quiz_id)
+        
+        if not quiz:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        
+        quiz.update(build_quiz_content(quiz_data))
+        version = await quiz_versions.save(quiz)
+        if quiz.get('current_version') and quiz['current_version'] != version.version_id:
+            # Students who started on the old version may still submit against it within the time limit
+            now = datetime.utcnow()
+            window = timedelta(minutes=quiz.get('time_limit') or 0)
+            quiz['superseded_versions'] = [{"version_id": quiz['current_version'], "superseded_at": now}] + [
+                entry for entry in quiz.get('superseded_versions') or ()
+                if entry['superseded_at'] >= now - window and entry['version_id'] != version.version_id
+            ]
+        quiz['current_version'] = version.version_id
+        
+        await storage.quizzes.update(quiz_id, {
+            field: quiz[field]
+            for field in (
+                "title", "subject", "description", "time_limit", "questions",
+                "total_questions", "total_points", "requires_evaluation", "current_version",
+                "superseded_versions",
+            )
+            if field in quiz
+        })
+        quiz_catalogue.invalidate()
+        
+        return Quiz(**quiz)
+    except (HTTPException, StorageUnavailableError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating quiz: {str(e)}")
+
 @api_router.get("/quizzes", response_model=List[Dict[str, Any]])
 async def get_all_quizzes(current_user: User = Depends(get_current_user)):
     """Get all available quizzes"""
     try:
-        quizzes = await db.quizzes.find(
-            {"is_active": True},
-            {
-                "_id": 0, "id": 1, "title": 1, "subject": 1, "description": 1,
-                "total_questions": 1, "total_points": 1, "time_limit": 1, 
-                "created_at": 1, "requires_evaluation": 1
-            }
-        ).to_list(1000)
-        
-        return quizzes
+        # Served pre-serialized from the catalogue cache
+        return Response(content=await quiz_catalogue.get(), media_type="application/json")
+    except StorageUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching quizzes: {str(e)}")
 
+def sanitize_questions(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Questions as shown for quiz taking, without answer keys or explanations"""
+    safe_questions = []
+    for question in questions:
+        safe_question = {
+            "id": question['id'],
+            "question_text": question['question_text'],
+            "question_type": question['question_type'],
+            "points": question['points']
+        }
+        
+        if question['question_type'] == "multiple_choice":
+            safe_question['options'] = question['options']
+        
+        safe_questions.append(safe_question)
+    return safe_questions
+
 @api_router.get("/quizzes/{quiz_id}")
 async def get_quiz(quiz_id: str, current_user: User = Depends(get_current_user)):
     """Get a specific quiz for taking"""
     try:
-        quiz = await db.quizzes.find_one({"id": quiz_id, "is_active": True}, {"_id": 0})
+        quiz = await storage.quizzes.get_active(quiz_id)
         
         if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
         
-        # Remove correct answers from MCQ questions for quiz taking
-        safe_questions = []
-        for question in quiz['questions']:
-            safe_question = {
-                "id": question['id'],
-                "question_text": question['question_text'],
-                "question_type": question['question_type'],
-                "points": question['points']
-            }
-            
-            if question['question_type'] == "multiple_choice":
-                safe_question['options'] = question['options']
-            
-            safe_questions.append(safe_question)
+        # Quizzes created before versioning get their first version here
+        quiz['current_version'] = (await quiz_versions.for_quiz(quiz)).version_id
         
-        quiz['questions'] = safe_questions
+        # Remove correct answers from MCQ questions for quiz taking
+        quiz['questions'] = sanitize_questions(quiz['questions'])
         return quiz
         
-    except HTTPException:
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching quiz: {str(e)}")
 
-@api_router.post("/quizzes/{quiz_id}/attempt", response_model=QuizResult)
+def is_submittable_version(quiz: Dict[str, Any], version_id: str) -> bool:
+    """The current version, or one replaced less than the quiz's time limit ago"""
+    if version_id == quiz.get('current_version'):
+        return True
+    if not quiz.get('time_limit'):
+        return False
+    cutoff = datetime.utcnow() - timedelta(minutes=quiz['time_limit'])
+    return any(
+        entry['version_id'] == version_id and entry['superseded_at'] >= cutoff
+        for entry in quiz.get('superseded_versions') or ()
+    )
+
+@api_router.post("/quizzes/{quiz_id}/attempt", response_model=QuizResult, dependencies=[limit_by_user("quiz_attempt")])
 async def submit_quiz_attempt(quiz_id: str, attempt: QuizAttemptSubmission, current_user: User = Depends(get_current_user)):
     """Submit quiz responses and get results"""
     try:
-        # Get the quiz with correct answers
-        quiz = await db.quizzes.find_one({"id": quiz_id, "is_active": True}, {"_id": 0})
-        
-        if not quiz:
-            raise HTTPException(status_code=404, detail="Quiz not found")
-        
-        # Create a lookup for questions
-        questions_lookup = {}
-        for question in quiz['questions']:
-            questions_lookup[question['id']] = question
-        
-        # Calculate auto score (MCQ only) and prepare detailed results
-        auto_score = 0
-        detailed_results = []
-        
-        for response in attempt.responses:
-            question_id = response.question_id
-            question_data = questions_lookup.get(question_id, {})
+        with span("quiz.load", quiz_id=quiz_id) as load_span:
+            # Get the quiz with correct answers
+            quiz = await storage.quizzes.get_active(quiz_id)
             
-            if question_data.get('question_type') == 'multiple_choice':
-                selected_answer = response.selected_answer
-                correct_answer = question_data.get('correct_answer')
-                
-                is_correct = selected_answer == correct_answer
-                points_earned = question_data.get('points', 1) if is_correct else 0
-                auto_score += points_earned
-                
-                detailed_results.append({
-                    "question_id": question_id,
-                    "question_text": question_data.get('question_text', ''),
-                    "question_type": "multiple_choice",
-                    "selected_answer": selected_answer,
-                    "correct_answer": correct_answer,
-                    "is_correct": is_correct,
-                    "points_possible": question_data.get('points', 1),
-                    "points_earned": points_earned,
-                    "explanation": question_data.get('explanation', '')
-                })
+            if not quiz:
+                raise HTTPException(status_code=404, detail="Quiz not found")
             
-            elif question_data.get('question_type') == 'text':
-                detailed_results.append({
-                    "question_id": question_id,
-                    "question_text": question_data.get('question_text', ''),
-                    "question_type": "text",
-                    "text_answer": response.text_answer,
-                    "points_possible": question_data.get('points', 1),
-                    "points_earned": 0,  # Will be updated after evaluation
-                    "is_evaluated": False
-                })
+            # Score against the version the quiz was taken on, so edits mid-exam do not change the key;
+            # answers given on an older version are refused rather than scored against another one,
+            # since option indices and questions may no longer line up
+            if attempt.quiz_version:
+                version = None
+                if is_submittable_version(quiz, attempt.quiz_version):
+                    version = await quiz_versions.get(attempt.quiz_version)
+                if version is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="The quiz has changed since it was started, please reload it"
+                    )
+            else:
+                version = await quiz_versions.for_quiz(quiz)
+            questions_lookup = version.questions_by_id
+            load_span.set_attribute("quiz_version", version.version_id)
+        
+        # Calculate auto score (MCQ only) and prepare detailed results
+        with span("quiz.score", quiz_id=quiz_id, responses=len(attempt.responses)) as score_span:
+            auto_score, detailed_results, responses = version.score(attempt.responses)
+            score_span.set_attribute("auto_score", auto_score)
         
         # Create result object
-        is_evaluated = not quiz.get('requires_evaluation', False)  # Auto-evaluated if no text questions
+        is_evaluated = not version.requires_evaluation  # Auto-evaluated if no text questions
         total_score = auto_score  # Will be updated after manual evaluation
-        max_possible_score = quiz.get('total_points', 0)
+        max_possible_score = version.total_points or 0
         percentage = (total_score / max_possible_score * 100) if max_possible_score > 0 else 0
         
-        result = QuizResult(
-            quiz_id=quiz_id,
-            quiz_title=quiz['title'],
-            user_id=current_user.id,
-            user_email=current_user.email,
-            user_name=current_user.full_name,
-            responses=attempt.responses,
-            auto_score=auto_score,
-            manual_score=0,
-            total_score=total_score,
-            max_possible_score=max_possible_score,
-            percentage=round(percentage, 2),
-            time_taken=attempt.time_taken,
-            is_evaluated=is_evaluated,
-            is_published=is_evaluated,  # Auto-publish if no manual evaluation needed
-            detailed_results=detailed_results
-        )
+        with span("result.build", quiz_id=quiz_id, details=len(detailed_results)):
+            result = QuizResult(
+                quiz_id=quiz_id,
+                quiz_version=version.version_id,
+                quiz_title=version.title,
+                user_id=current_user.id,
+                user_email=current_user.email,
+                user_name=current_user.full_name,
+                responses=responses,
+                auto_score=auto_score,
+                manual_score=0,
+                total_score=total_score,
+                max_possible_score=max_possible_score,
+                percentage=round(percentage, 2),
+                time_taken=attempt.time_taken,
+                is_evaluated=is_evaluated,
+                is_published=is_evaluated,  # Auto-publish if no manual evaluation needed
+                detailed_results=detailed_results
+            )
+            
+            # Question content is not copied into stored results; it is rehydrated from the version
+            stored = result.dict()
+            stored['responses'] = responses
+            stored['detailed_results'] = [
+                {key: value for key, value in detail.items() if key not in VERSIONED_DETAIL_FIELDS}
+                for detail in detailed_results
+            ]
         
         # Save result to database
-        await db.quiz_results.insert_one(result.dict())
+        with span("result.store", result_id=result.id, published=result.is_published):
+            await storage.results.create(stored)
+            if result.is_published:
+                await storage.summaries.record_published(stored)
         
-        return result
+        # Serialized here rather than by FastAPI so the cost shows up in traces
+        with span("result.serialize", result_id=result.id) as serialize_span:
+            body = serialize_json(result)
+            serialize_span.set_attribute("result_bytes", len(body))
+        return Response(content=body, media_type="application/json")
         
-    except HTTPException:
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing quiz attempt: {str(e)}")
@@ -420,12 +699,11 @@ async def submit_quiz_attempt(quiz_id: str, attempt: QuizAttemptSubmission, curr
 async def get_pending_evaluations(current_user: User = Depends(get_admin_user)):
     """Get quiz results that need manual evaluation"""
     try:
-        results = await db.quiz_results.find(
-            {"is_evaluated": False},
-            {"_id": 0}
-        ).sort("completed_at", 1).to_list(1000)
+        results = await quiz_versions.rehydrate(await storage.results.list_pending())
         
         return results
+    except StorageUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching pending evaluations: {str(e)}")
 
@@ -434,7 +712,7 @@ async def evaluate_quiz_result(result_id: str, evaluation: QuizEvaluation, curre
     """Evaluate text questions and update result"""
     try:
         # Get the result
-        result = await db.quiz_results.find_one({"id": result_id}, {"_id": 0})
+        result = await storage.results.get(result_id)
         if not result:
             raise HTTPException(status_code=404, detail="Result not found")
         
@@ -456,66 +734,104 @@ async def evaluate_quiz_result(result_id: str, evaluation: QuizEvaluation, curre
                 detail['is_evaluated'] = True
         
         # Update result in database
-        await db.quiz_results.update_one(
-            {"id": result_id},
-            {
-                "$set": {
-                    "manual_score": manual_score,
-                    "total_score": total_score,
-                    "percentage": round(percentage, 2),
-                    "is_evaluated": True,
-                    "detailed_results": detailed_results,
-                    "evaluations": [eval.dict() for eval in evaluation.evaluations]
-                }
-            }
-        )
+        updates = {
+            "manual_score": manual_score,
+            "total_score": total_score,
+            "percentage": round(percentage, 2),
+            "is_evaluated": True,
+            "detailed_results": detailed_results,
+            "evaluations": [eval.dict() for eval in evaluation.evaluations]
+        }
+        await storage.results.update(result_id, updates)
+        
+        # Re-grading an already published result changes the student's summary
+        if result.get('is_published'):
+            await storage.summaries.record_rescored({**result, **updates}, result['percentage'])
         
         return {"message": "Evaluation completed successfully"}
         
-    except HTTPException:
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error evaluating result: {str(e)}")
 
+async def publish_and_summarize(result_id: str) -> bool:
+    """Publish a result and fold it into the student's summary; False if already published or missing"""
+    published = await storage.results.publish(result_id)
+    if published is None:
+        return False
+    await storage.summaries.record_published(published)
+    return True
+
 @api_router.post("/admin/publish/{result_id}")
 async def publish_result(result_id: str, current_user: User = Depends(get_admin_user)):
     """Publish a quiz result"""
     try:
-        result = await db.quiz_results.update_one(
-            {"id": result_id},
-            {"$set": {"is_published": True}}
-        )
-        
-        if result.matched_count == 0:
+        if not await publish_and_summarize(result_id) and not await storage.results.get(result_id):
             raise HTTPException(status_code=404, detail="Result not found")
         
         return {"message": "Result published successfully"}
         
-    except HTTPException:
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error publishing result: {str(e)}")
 
-@api_router.post("/admin/publish-all/{quiz_id}")
+async def fetch_publishable(params: Dict[str, Any], after: Optional[str], limit: int) -> List[str]:
+    return await storage.results.list_publishable_ids(params["quiz_id"], after, limit)
+
+async def publish_chunk(params: Dict[str, Any], result_ids: List[str]) -> int:
+    # Re-running a chunk is harmless: already published results are skipped
+    published = 0
+    for result_id in result_ids:
+        published += await publish_and_summarize(result_id)
+    return published
+
+job_runner.register("publish_all", fetch_publishable, publish_chunk)
+
+@api_router.post("/admin/publish-all/{quiz_id}", status_code=status.HTTP_202_ACCEPTED)
 async def publish_all_results(quiz_id: str, current_user: User = Depends(get_admin_user)):
-    """Publish all evaluated results for a quiz"""
+    """Publish all evaluated results for a quiz as a background job"""
     try:
-        result = await db.quiz_results.update_many(
-            {"quiz_id": quiz_id, "is_evaluated": True},
-            {"$set": {"is_published": True}}
-        )
+        job = await job_runner.submit("publish_all", {"quiz_id": quiz_id}, current_user.email)
         
-        return {"message": f"Published {result.modified_count} results"}
+        # Results are looked up by the job itself; progress shows on /admin/jobs/{job_id}
+        return {"message": "Publishing results in the background", "job_id": job["id"]}
         
+    except StorageUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error publishing results: {str(e)}")
 
+# Job Endpoints
+@api_router.get("/admin/jobs")
+async def list_jobs(current_user: User = Depends(get_admin_user)):
+    """Most recent background jobs"""
+    return await storage.jobs.list_recent(50)
+
+@api_router.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    """Status and progress of a background job"""
+    job = await storage.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/admin/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    """Stop a background job before its next chunk"""
+    if not await job_runner.cancel(job_id):
+        raise HTTPException(status_code=404, detail="No unfinished job with this id")
+    return {"message": "Cancellation requested"}
+
 # Results Endpoints
 @api_router.get("/results/{result_id}", response_model=QuizResult)
 async def get_quiz_result(result_id: str, current_user: User = Depends(get_current_user)):
     """Get quiz result by ID"""
     try:
-        result = await db.quiz_results.find_one({"id": result_id}, {"_id": 0})
+        result = await storage.results.get(result_id)
+        if not result:
+            result = await result_archive.get(result_id)
         
         if not result:
             raise HTTPException(status_code=404, detail="Result not found")
@@ -524,40 +840,70 @@ async def get_quiz_result(result_id: str, current_user: User = Depends(get_curre
         if current_user.role != "admin" and result['user_id'] != current_user.id:
             raise HTTPException(status_code=403, detail="Access denied")
         
+        await quiz_versions.rehydrate([result])
         return QuizResult(**result)
         
-    except HTTPException:
+    except (HTTPException, StorageUnavailableError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching result: {str(e)}")
 
 @api_router.get("/results/my/all")
-async def get_my_results(current_user: User = Depends(get_current_user)):
-    """Get all results for current user"""
+async def get_my_results(
+    before: Optional[datetime] = None,
+    before_id: Optional[str] = None,
+    limit: int = MAX_LIST_RESULTS,
+    current_user: User = Depends(get_current_user),
+):
+    """Get results for current user, newest first; pass the last result's completed_at and id as before and before_id to page back"""
     try:
-        results = await db.quiz_results.find(
-            {"user_id": current_user.id, "is_published": True},
-            {"_id": 0}
-        ).sort("completed_at", -1).to_list(1000)
+        if before is not None and before.tzinfo is not None:
+            before = before.astimezone(timezone.utc).replace(tzinfo=None)
+        # Closed quizzes are archived whatever their age, so both tiers are merged by completion time
+        results = await list_user_results(
+            storage, result_archive, current_user.id, before, min(max(limit, 1), MAX_LIST_RESULTS), before_id
+        )
         
-        return results
+        return await quiz_versions.rehydrate(results)
+    except StorageUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching results: {str(e)}")
 
+@api_router.get("/results/my/summary")
+async def get_my_results_summary(current_user: User = Depends(get_current_user)):
+    """Scores overview for the student dashboard; full results load from /results/{result_id}"""
+    try:
+        summary = await storage.summaries.get(current_user.id)
+        if summary is None or not summary.get("complete"):
+            # Results published before summaries existed are folded in on first read
+            summary = await rebuild_summary(storage, result_archive, current_user.id)
+        
+        quizzes = [
+            {
+                "quiz_id": quiz_id,
+                "quiz_title": stats["quiz_title"],
+                "attempts": stats["attempts"],
+                "best_percentage": stats["best_percentage"],
+                "average_percentage": round(stats["percentage_sum"] / stats["attempts"], 2),
+            }
+            for quiz_id, stats in summary["quizzes"].items()
+        ]
+        return {"attempts": summary["attempts"], "quizzes": quizzes, "recent": summary["recent"]}
+    except StorageUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching results summary: {str(e)}")
+
 @api_router.get("/results/published/{quiz_id}")
 async def get_published_results(quiz_id: str, current_user: User = Depends(get_current_user)):
     """Get all published results for a quiz"""
     try:
-        results = await db.quiz_results.find(
-            {"quiz_id": quiz_id, "is_published": True},
-            {
-                "_id": 0, "id": 1, "user_name": 1, "user_email": 1,
-                "total_score": 1, "max_possible_score": 1, "percentage": 1,
-                "completed_at": 1
-            }
-        ).sort("percentage", -1).to_list(1000)
+        results = await storage.results.list_published_for_quiz(quiz_id, RESULT_LEADERBOARD_FIELDS)
         
         return results
+    except StorageUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching published results: {str(e)}")
 
@@ -565,34 +911,195 @@ async def get_published_results(quiz_id: str, current_user: User = Depends(get_c
 async def get_all_results(current_user: User = Depends(get_admin_user)):
     """Get all quiz results for admin"""
     try:
-        results = await db.quiz_results.find({}, {"_id": 0}).sort("completed_at", -1).to_list(1000)
-        return results
+        results = await storage.results.list_all()
+        return await quiz_versions.rehydrate(results)
+    except StorageUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching results: {str(e)}")
 
+# Analytics Endpoints
+@api_router.post("/admin/quizzes/{quiz_id}/item-analysis", status_code=status.HTTP_202_ACCEPTED)
+async def start_item_analysis(quiz_id: str, background_tasks: BackgroundTasks, current_user: User = Depends(get_admin_user)):
+    """Compute question difficulty, discrimination and distractor use in the background"""
+    try:
+        quiz = await storage.quizzes.get_active(quiz_id)
+        if not quiz:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        
+        # Imported on first use so workers that never run analytics skip numpy
+        from item_analysis import run_item_analysis
+        
+        chunk_size = int(os.environ.get("ITEM_ANALYSIS_CHUNK_SIZE", "5000"))
+        background_tasks.add_task(run_item_analysis, storage, quiz_versions, quiz, chunk_size)
+        return {"message": "Item analysis started"}
+    except (HTTPException, StorageUnavailableError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting item analysis: {str(e)}")
+
+@api_router.get("/admin/quizzes/{quiz_id}/item-analysis")
+async def get_item_analysis(quiz_id: str, current_user: User = Depends(get_admin_user)):
+    """Latest item analysis report of a quiz"""
+    from item_analysis import ITEM_ANALYSIS_KIND
+    
+    try:
+        report = await storage.analytics.get(ITEM_ANALYSIS_KIND, quiz_id)
+        if not report:
+            raise HTTPException(status_code=404, detail="Item analysis not found")
+        return report
+    except (HTTPException, StorageUnavailableError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching item analysis: {str(e)}")
+
+@api_router.post("/admin/quizzes/{quiz_id}/similarity", status_code=status.HTTP_202_ACCEPTED)
+async def start_similarity_detection(quiz_id: str, background_tasks: BackgroundTasks, current_user: User = Depends(get_admin_user)):
+    """Look for pairs of attempts with near-identical answers in the background"""
+    try:
+        quiz = await storage.quizzes.get_active(quiz_id)
+        if not quiz:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        
+        from similarity import run_similarity_detection
+        
+        workers = os.environ.get("SIMILARITY_WORKERS")
+        background_tasks.add_task(
+            run_similarity_detection,
+            storage,
+            quiz_versions,
+            quiz,
+            chunk_size=int(os.environ.get("SIMILARITY_CHUNK_SIZE", "5000")),
+            workers=int(workers) if workers else None,
+            agreement_threshold=float(os.environ.get("SIMILARITY_MCQ_AGREEMENT", "0.9")),
+            min_shared_wrong=int(os.environ.get("SIMILARITY_MIN_SHARED_WRONG", "3")),
+            text_threshold=float(os.environ.get("SIMILARITY_TEXT_THRESHOLD", "0.7")),
+            block_memory_bytes=int(os.environ.get("SIMILARITY_BLOCK_MEMORY_MB", "64")) * 1024 * 1024,
+        )
+        return {"message": "Similarity detection started"}
+    except (HTTPException, StorageUnavailableError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting similarity detection: {str(e)}")
+
+@api_router.get("/admin/quizzes/{quiz_id}/similarity")
+async def get_similarity_report(quiz_id: str, current_user: User = Depends(get_admin_user)):
+    """Latest similarity report of a quiz"""
+    from similarity import SIMILARITY_KIND
+    
+    try:
+        report = await storage.analytics.get(SIMILARITY_KIND, quiz_id)
+        if not report:
+            raise HTTPException(status_code=404, detail="Similarity report not found")
+        return report
+    except (HTTPException, StorageUnavailableError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching similarity report: {str(e)}")
+
+@api_router.post("/admin/archive", status_code=status.HTTP_202_ACCEPTED)
+async def start_archival(background_tasks: BackgroundTasks, current_user: User = Depends(get_admin_user)):
+    """Move old and closed-quiz results from the hot collection to the archive"""
+    after_days = int(os.environ.get("ARCHIVE_AFTER_DAYS", "180"))
+    batch_size = int(os.environ.get("ARCHIVE_BATCH_SIZE", "5000"))
+    background_tasks.add_task(run_archival, storage, result_archive, after_days, batch_size)
+    return {"message": "Archival started"}
+
+@api_router.get("/admin/storage/stats")
+async def get_storage_stats(current_user: User = Depends(get_admin_user)):
+    """Connection pool and timeout settings of the storage engine"""
+    stats = storage.stats()
+    stats["change_stream"] = change_watcher.stats() if change_watcher is not None else None
+    stats["quiz_catalogue_cache"] = quiz_catalogue.stats
+    stats["archive"] = await result_archive.stats()
+    stats["tracing"] = tracer.stats()
+    return stats
+
+@api_router.get("/admin/admission/stats")
+async def get_admission_stats(current_user: User = Depends(get_admin_user)):
+    """In-flight, queued and shed requests per route class"""
+    return admission.stats()
+
 # Health check endpoint
 @api_router.get("/")
 async def root():
     return {"message": "Mini Quiz Platform API with Authentication", "status": "running"}
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+async def warm_caches():
+    """Fill the quiz catalogue and the versions of active quizzes before the first request"""
+    try:
+        await quiz_catalogue.get()
+        quizzes = await storage.quizzes.list_active(("current_version",))
+        loaded = await quiz_versions.preload(quiz.get("current_version") for quiz in quizzes)
+        logger.info("Warmed caches: %d active quizzes, %d versions", len(quizzes), loaded)
+    except StorageUnavailableError as e:
+        # Requests fill the caches on demand; not worth failing startup over
+        logger.warning("Skipping cache warm-up: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracer.start()
+    await storage.connect()
+    await storage.init_indexes()
+    await init_limiters(rate_limiters.values())
+    await invalidation_bus.start()
+    await load_token_denylist()
+    if change_watcher is not None:
+        await change_watcher.start()
+    await job_runner.start()
+    await warm_caches()
+    
+    yield
+    
+    await job_runner.stop()
+    if change_watcher is not None:
+        await change_watcher.stop()
+    await invalidation_bus.stop()
+    result_archive.close()
+    await storage.close()
+    tracer.stop()
+
+# Create the main app without a prefix; connections and caches are set up in the lifespan, not on import
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(StorageUnavailableError)
+async def storage_unavailable_handler(request: Request, exc: StorageUnavailableError):
+    # Degrade with a retryable 503 rather than letting the request hang or 500
+    logger.warning("Storage unavailable on %s (request %s): %s", request.url.path, current_request_id(), exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database temporarily unavailable, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many requests, please slow down"},
+        headers={"Retry-After": retry_after_header(exc.retry_after)},
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Added before CORS so shed responses still carry CORS headers
+app.add_middleware(AdmissionMiddleware, controller=admission)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# Outermost, so traces include admission queueing
+app.add_middleware(TracingMiddleware, tracer=tracer)
@@ -0,0 +1,373 @@
+"""
+Answer-similarity detection for spotting possible collusion.
+
+Multiple choice responses are encoded as bit vectors with one bit per
+(question, option) and packed into uint64 words. All pairs of attempts
+are compared in row blocks with bitwise AND and popcount, giving the
+number of identical answers and of identical wrong answers per pair.
+Identical right answers are expected from strong students, so a pair is
+only flagged when it agrees on nearly every question and also shares
+several wrong answers.
+
+Text answers are compared per question with MinHash signatures over word
+shingles. LSH banding buckets signatures so only answers sharing a band
+become candidates, and candidates are kept when their estimated Jaccard
+similarity passes the threshold.
+
+Both comparisons run in a process pool; attempts by the same user are
+never paired, and attempts are only compared with others scored on the
+same quiz version.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from item_analysis import ItemAnalyzer, UNANSWERED, stream_by_version, version_sections
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_KIND = "similarity"
+RESULT_FIELDS = ("id", "user_id", "user_name", "user_email", "responses")
+
+MAX_REPORTED_PAIRS = 500
+# Memory for the temporaries of one MCQ comparison block, per worker process
+DEFAULT_BLOCK_MEMORY_BYTES = 64 * 1024 * 1024
+
+# MinHash over word shingles, banded into NUM_BANDS bands of NUM_PERMUTATIONS / NUM_BANDS rows
+SHINGLE_WORDS = 3
+MIN_TEXT_WORDS = 8  # shorter answers are too likely to match by chance
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32
+MAX_BUCKET_SIZE = 200  # answers shared this widely are boilerplate, not a pair
+_MERSENNE_PRIME = (1 << 31) - 1
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits of each uint64, summed over the last axis"""
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def mcq_block_rows(n: int, words: int, memory_bytes: int, workers: int = 1) -> int:
+    """Rows per comparison block, as many as fit in ``memory_bytes`` while leaving work for every worker"""
+    # Per row and compared attempt: the ANDed words, an int64 count, a float64 agreement and boolean masks
+    per_row = n * (8 * words + 8 + 8 + 4)
+    rows = memory_bytes // max(per_row, 1)
+    return int(max(1, min(rows, -(-n // max(workers, 1)))))
+
+
+def _pack_rows(bits: np.ndarray) -> np.ndarray:
+    """Pack a (rows, n_bits) boolean matrix into (rows, words) uint64"""
+    n_words = max(1, -(-bits.shape[1] // 64))
+    padded = np.zeros((bits.shape[0], n_words * 64), dtype=bool)
+    padded[:, :bits.shape[1]] = bits
+    return np.packbits(padded, axis=1).view(np.uint64)
+
+
+class MCQEncoder:
+    def __init__(self, quiz: Dict[str, Any]):
+        self.analyzer = ItemAnalyzer(quiz)
+        self.n_questions = len(self.analyzer.questions)
+        self.slots = np.arange(self.analyzer.max_options, dtype=np.int16)
+        wrong = self.slots[None, :] != self.analyzer.correct[:, None]
+        self.wrong_mask = _pack_rows(wrong.reshape(1, -1))[0]
+
+    def encode(self, results: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Packed answer bits and number of answered questions of each result"""
+        matrix = self.analyzer.encode(results)
+        one_hot = matrix[:, :, None] == self.slots[None, None, :]
+        return _pack_rows(one_hot.reshape(len(results), -1)), (matrix != UNANSWERED).sum(axis=1)
+
+
+def _shingle_hashes(text: Optional[str]) -> Optional[np.ndarray]:
+    words = re.findall(r"\w+", (text or "").lower())
+    if len(words) < MIN_TEXT_WORDS:
+        return None
+    word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    # Combine the hashes of consecutive words instead of hashing joined strings
+    n_shingles = len(words) - SHINGLE_WORDS + 1
+    shingles = np.zeros(n_shingles, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(SHINGLE_WORDS):
+            shingles = shingles * np.uint64(0x100000001B3) + word_hashes[k:k + n_shingles]
+    return np.unique(shingles)
+
+
+def _permutations(seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+    return a, b
+
+
+def minhash(hashes: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """MinHash signature of a set of shingle hashes"""
+    # 31-bit inputs and coefficients keep a * x + b inside uint64
+    x = hashes & np.uint64(_MERSENNE_PRIME)
+    return ((np.outer(x, a) + b) % np.uint64(_MERSENNE_PRIME)).min(axis=0)
+
+
+# Worker state, set once per process by _init_worker
+_state: Dict[str, Any] = {}
+
+
+def _init_worker(bits, answered, wrong_mask, users, agreement_threshold, min_shared_wrong):
+    _state.update(
+        bits=bits, answered=answered, wrong_mask=wrong_mask, users=users,
+        agreement_threshold=agreement_threshold, min_shared_wrong=min_shared_wrong,
+    )
+
+
+def _compare_mcq_block(start: int, stop: int) -> List[Tuple[int, int, float, int, int]]:
+    """Flagged pairs (i, j) with i in [start, stop) and j > i"""
+    bits, answered, users = _state["bits"], _state["answered"], _state["users"]
+    block = bits[start:stop, None, :]
+    rest = bits[None, start:, :]
+    both = block & rest
+    identical = _popcount(both)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        agreement = identical / np.maximum(answered[start:stop, None], answered[None, start:])
+
+    rows = np.arange(stop - start)[:, None]
+    cols = np.arange(bits.shape[0] - start)[None, :]
+    i, j = np.nonzero(
+        (cols > rows)
+        & (agreement >= _state["agreement_threshold"])
+        & (users[start:stop, None] != users[None, start:])
+    )
+    # Wrong answers are only counted for the few pairs that agree closely
+    shared_wrong = _popcount(both[i, j] & _state["wrong_mask"])
+    flagged = shared_wrong >= _state["min_shared_wrong"]
+    return [
+        (start + int(x), start + int(y), float(agreement[x, y]), int(identical[x, y]), int(wrong))
+        for x, y, wrong in zip(i[flagged], j[flagged], shared_wrong[flagged])
+    ]
+
+
+def _compare_text_answers(
+    question_id: str, answers: List[Tuple[int, str]], users: np.ndarray, threshold: float
+) -> Dict[str, Any]:
+    """Flagged pairs of similar answers to one text question, via MinHash and LSH banding"""
+    a, b = _permutations()
+    rows: List[int] = []
+    signatures = []
+    for row, text in answers:
+        hashes = _shingle_hashes(text)
+        if hashes is not None:
+            rows.append(row)
+            signatures.append(minhash(hashes, a, b))
+    if len(rows) < 2:
+        return {"question_id": question_id, "pairs": [], "oversized_buckets": 0}
+    signatures = np.vstack(signatures)
+
+    # One 64-bit key per answer and band; wrap-around multiplication is fine for bucketing
+    band_rows = NUM_PERMUTATIONS // NUM_BANDS
+    keys = signatures.reshape(len(rows), NUM_BANDS, band_rows)
+    band_keys = np.zeros((len(rows), NUM_BANDS), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(band_rows):
+            band_keys = band_keys * np.uint64(0x100000001B3) + keys[:, :, k]
+
+    candidates = set()
+    oversized = 0
+    for band in range(NUM_BANDS):
+        order = np.argsort(band_keys[:, band], kind="stable")
+        bounds = np.flatnonzero(np.diff(band_keys[order, band])) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(order)]))
+        shared = stops - starts >= 2
+        for first, last in zip(starts[shared], stops[shared]):
+            if last - first > MAX_BUCKET_SIZE:
+                oversized += 1
+                continue
+            members = order[first:last].tolist()
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    candidates.add((members[x], members[y]))
+    if not candidates:
+        return {"question_id": question_id, "pairs": [], "oversized_buckets": oversized}
+
+    rows = np.array(rows)
+    xs, ys = np.array(sorted(candidates)).T
+    similarity = (signatures[xs] == signatures[ys]).mean(axis=1)
+    keep = (similarity >= threshold) & (users[rows[xs]] != users[rows[ys]])
+    pairs = [
+        (int(rows[x]), int(rows[y]), float(sim))
+        for x, y, sim in zip(xs[keep], ys[keep], similarity[keep])
+    ]
+    return {"question_id": question_id, "pairs": pairs, "oversized_buckets": oversized}
+
+
+class SimilarityDetector:
+    def __init__(
+        self,
+        quiz: Dict[str, Any],
+        agreement_threshold: float = 0.9,
+        min_shared_wrong: int = 3,
+        text_threshold: float = 0.7,
+        block_memory_bytes: int = DEFAULT_BLOCK_MEMORY_BYTES,
+    ):
+        self.quiz = quiz
+        self.agreement_threshold = agreement_threshold
+        self.min_shared_wrong = min_shared_wrong
+        self.text_threshold = text_threshold
+        self.block_memory_bytes = block_memory_bytes
+        self.mcq = MCQEncoder(quiz)
+        self.text_question_ids = [q["id"] for q in quiz["questions"] if q["question_type"] == "text"]
+        self.attempts: List[Dict[str, Any]] = []
+        self._bits: List[np.ndarray] = []
+        self._answered: List[np.ndarray] = []
+        self._text_answers: Dict[str, List[Tuple[int, str]]] = {qid: [] for qid in self.text_question_ids}
+
+    def add_results(self, results: List[Dict[str, Any]]) -> None:
+        """Encode one chunk of results; only the packed vectors and text answers are kept"""
+        text_ids = set(self.text_question_ids)
+        for result in results:
+            row = len(self.attempts)
+            self.attempts.append({field: result.get(field) for field in ("id", "user_id", "user_name", "user_email")})
+            for response in result.get("responses") or ():
+                if response.get("question_id") in text_ids and response.get("text_answer"):
+                    self._text_answers[response["question_id"]].append((row, response["text_answer"]))
+        bits, answered = self.mcq.encode(results)
+        self._bits.append(bits)
+        self._answered.append(answered)
+
+    def _users(self) -> np.ndarray:
+        codes: Dict[str, int] = {}
+        return np.array([codes.setdefault(a["user_id"], len(codes)) for a in self.attempts], dtype=np.int64)
+
+    def _compare(self, workers: int) -> Tuple[List[tuple], List[Dict[str, Any]]]:
+        n = len(self.attempts)
+        users = self._users()
+        mcq_pairs: List[tuple] = []
+        text_reports: List[Dict[str, Any]] = []
+        if n < 2:
+            return mcq_pairs, text_reports
+
+        bits = np.vstack(self._bits)
+        init_args = (
+            bits, np.concatenate(self._answered), self.mcq.wrong_mask, users,
+            self.agreement_threshold, self.min_shared_wrong,
+        )
+        block_rows = mcq_block_rows(n, bits.shape[1], self.block_memory_bytes, workers)
+        blocks = [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+        text_tasks = [
+            (qid, self._text_answers[qid], users, self.text_threshold) for qid in self.text_question_ids
+        ]
+        if workers <= 0:
+            _init_worker(*init_args)
+            if self.mcq.n_questions:
+                for start, stop in blocks:
+                    mcq_pairs.extend(_compare_mcq_block(start, stop))
+            text_reports = [_compare_text_answers(*task) for task in text_tasks]
+            return mcq_pairs, text_reports
+
+        # Spawned workers do not inherit the server's event loop or open sockets
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=init_args,
+        ) as pool:
+            futures = [pool.submit(_compare_text_answers, *task) for task in text_tasks]
+            if self.mcq.n_questions:
+                for block_pairs in pool.map(_compare_mcq_block, *zip(*blocks)):
+                    mcq_pairs.extend(block_pairs)
+            text_reports = [future.result() for future in futures]
+        return mcq_pairs, text_reports
+
+    def report(self, mcq_pairs: List[tuple], text_reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+        mcq_pairs = sorted(mcq_pairs, key=lambda pair: (pair[2], pair[4]), reverse=True)
+        text_pairs = sorted(
+            (
+                (report["question_id"], i, j, similarity)
+                for report in text_reports
+                for i, j, similarity in report["pairs"]
+            ),
+            key=lambda pair: pair[3],
+            reverse=True,
+        )
+        return {
+            "quiz_title": self.quiz["title"],
+            "attempts": len(self.attempts),
+            "computed_at": datetime.utcnow(),
+            "parameters": {
+                "agreement_threshold": self.agreement_threshold,
+                "min_shared_wrong": self.min_shared_wrong,
+                "text_threshold": self.text_threshold,
+            },
+            "mcq_questions": self.mcq.n_questions,
+            "mcq_pairs_found": len(mcq_pairs),
+            "mcq_pairs": [
+                {
+                    "attempts": [self.attempts[i], self.attempts[j]],
+                    "agreement": round(agreement, 4),
+                    "identical_answers": identical,
+                    "shared_wrong_answers": shared_wrong,
+                }
+                for i, j, agreement, identical, shared_wrong in mcq_pairs[:MAX_REPORTED_PAIRS]
+            ],
+            "text_questions": len(self.text_question_ids),
+            "text_pairs_found": len(text_pairs),
+            "text_pairs": [
+                {
+                    "question_id": question_id,
+                    "attempts": [self.attempts[i], self.attempts[j]],
+                    "similarity": round(similarity, 4),
+                }
+                for question_id, i, j, similarity in text_pairs[:MAX_REPORTED_PAIRS]
+            ],
+            "oversized_buckets": sum(report["oversized_buckets"] for report in text_reports),
+        }
+
+    def run(self, workers: int) -> Dict[str, Any]:
+        """Compare every pair of attempts added so far; ``workers`` 0 compares in this process"""
+        return self.report(*self._compare(workers))
+
+
+async def run_similarity_detection(
+    storage,
+    versions,
+    quiz: Dict[str, Any],
+    chunk_size: int = 5000,
+    workers: Optional[int] = None,
+    **thresholds,
+) -> Dict[str, Any]:
+    """Look for suspiciously similar attempts of ``quiz``, per version, and store the report"""
+    detectors: Dict[Optional[str], SimilarityDetector] = {}
+    async for version_id, content, results in stream_by_version(storage, versions, quiz, RESULT_FIELDS, chunk_size):
+        if version_id not in detectors:
+            detectors[version_id] = SimilarityDetector(content, **thresholds)
+        # Encoding is CPU-bound; keep it off the event loop
+        await asyncio.to_thread(detectors[version_id].add_results, results)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    sections = version_sections(quiz, {
+        version_id: await asyncio.to_thread(detector.run, workers) for version_id, detector in detectors.items()
+    })
+    report = {
+        "quiz_title": quiz["title"],
+        "attempts": sum(section["attempts"] for section in sections),
+        "computed_at": datetime.utcnow(),
+        "mcq_pairs_found": sum(section["mcq_pairs_found"] for section in sections),
+        "text_pairs_found": sum(section["text_pairs_found"] for section in sections),
+        "versions": sections,
+    }
+    await storage.analytics.save(SIMILARITY_KIND, quiz["id"], report)
+    logger.info(
+        "Similarity detection of quiz %s flagged %d MCQ and %d text pairs over %d attempts",
+        quiz["id"], report["mcq_pairs_found"], report["text_pairs_found"], report["attempts"],
+    )
+    return report
@@ -0,0 +1,1141 @@
+"""
+Storage backends for the quiz platform.
+
+The API talks to its repositories (users, quizzes, results, analytics,
+per-user result summaries and background jobs) through the ``Storage``
+container. ``MongoStorage`` is the production engine backed by Motor;
+``MemoryStorage`` keeps everything in indexed dicts with the same query
+semantics so the API can run in-process for tests and benchmarks.
+"""
+
+import copy
+import functools
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument, monitoring, read_preferences
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, ExecutionTimeout
+
+from tracing import span
+
+# Mirrors the ``to_list(1000)`` cap the endpoints have always used
+MAX_LIST_RESULTS = 1000
+
+QUIZ_LISTING_FIELDS = (
+    "id", "title", "subject", "description", "total_questions", "total_points",
+    "time_limit", "created_at", "requires_evaluation",
+)
+
+RESULT_LEADERBOARD_FIELDS = (
+    "id", "user_name", "user_email", "total_score", "max_possible_score",
+    "percentage", "completed_at",
+)
+
+# Fields of a result kept in the recent attempts of a user summary
+SUMMARY_ENTRY_FIELDS = (
+    "id", "quiz_id", "quiz_title", "total_score", "max_possible_score", "percentage",
+    "is_evaluated", "time_taken", "completed_at",
+)
+RECENT_ATTEMPTS = 20
+
+
+def _projection(fields: Optional[Iterable[str]]) -> Dict[str, int]:
+    """Build a Mongo projection that always hides ``_id``"""
+    projection = {"_id": 0}
+    if fields:
+        projection.update({field: 1 for field in fields})
+    return projection
+
+
+def _project(doc: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Apply an inclusion projection to an in-memory document"""
+    if not fields:
+        return copy.deepcopy(doc)
+    return {field: copy.deepcopy(doc[field]) for field in fields if field in doc}
+
+
+class StorageUnavailableError(Exception):
+    """The database timed out or could not be reached"""
+
+
+# Repository interfaces
+class UserRepository(ABC):
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def create(self, user: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def bump_token_version(self, email: str) -> int:
+        """Invalidate every token issued so far and return the new version"""
+
+    @abstractmethod
+    async def list_token_versions(self) -> Dict[str, int]:
+        """Map user id to token version for users who have revoked tokens"""
+
+
+class QuizRepository(ABC):
+    @abstractmethod
+    async def create(self, quiz: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def get_active(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def list_active(self, fields: Optional[Iterable[str]] = None, primary: bool = False) -> List[Dict[str, Any]]:
+        """Active quizzes; ``primary`` reads past the listing read preference"""
+
+    @abstractmethod
+    async def list_inactive_ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def update(self, quiz_id: str, fields: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    async def save_version(self, version: Dict[str, Any]) -> None:
+        """Store an immutable quiz version; saving an existing version is a no-op"""
+
+    @abstractmethod
+    async def get_version(self, version_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+
+class ResultRepository(ABC):
+    @abstractmethod
+    async def create(self, result: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update(self, result_id: str, fields: Dict[str, Any]) -> int:
+        """Set ``fields`` on one result and return the matched count"""
+
+    @abstractmethod
+    async def publish(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Publish one result. Returns its ``user_id`` and summary fields only
+        if this call published it, so each result is counted once.
+        """
+
+    @abstractmethod
+    async def list_publishable_ids(self, quiz_id: str, after: Optional[str], limit: int) -> List[str]:
+        """Evaluated but unpublished results of a quiz with ids above ``after``, in id order"""
+
+    @abstractmethod
+    async def list_pending(self) -> List[Dict[str, Any]]:
+        """Unevaluated results, oldest first"""
+
+    @abstractmethod
+    async def list_published_for_user(
+        self,
+        user_id: str,
+        before: Optional[datetime] = None,
+        limit: int = MAX_LIST_RESULTS,
+        before_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Published results of one user, newest first and by descending id on
+        ties, that come after the ``(before, before_id)`` cursor in that order;
+        without ``before_id`` every result completed at ``before`` is skipped
+        """
+
+    @abstractmethod
+    async def list_published_user_ids(self) -> List[str]:
+        """Users with at least one published result"""
+
+    @abstractmethod
+    async def list_published_for_quiz(self, quiz_id: str, fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Published results of one quiz, best percentage first"""
+
+    @abstractmethod
+    async def list_all(self) -> List[Dict[str, Any]]:
+        """Every result, newest first"""
+
+    @abstractmethod
+    def stream_for_quiz(
+        self, quiz_id: str, fields: Optional[Iterable[str]] = None, batch_size: int = 1000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every result of one quiz, in batches of at most ``batch_size``"""
+
+    @abstractmethod
+    async def list_archivable(self, cutoff: datetime, quiz_ids: Iterable[str], limit: int) -> List[Dict[str, Any]]:
+        """Published results completed before ``cutoff`` or belonging to ``quiz_ids``, oldest first"""
+
+    @abstractmethod
+    async def delete_many(self, result_ids: Iterable[str]) -> int:
+        ...
+
+
+class AnalyticsRepository(ABC):
+    """Computed reports, one per ``kind`` and quiz"""
+
+    @abstractmethod
+    async def save(self, kind: str, quiz_id: str, report: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, kind: str, quiz_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+
+class SummaryRepository(ABC):
+    """
+    Per-user rollup of published results: attempt counts, best and summed
+    percentage per quiz, and the most recent attempts. Summaries rebuilt
+    from a user's full history are ``complete``; one started by
+    ``record_published`` alone is not, and readers rebuild it first.
+    """
+
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def record_published(self, result: Dict[str, Any]) -> None:
+        """Fold a newly published result into its user's summary"""
+
+    @abstractmethod
+    async def record_rescored(self, result: Dict[str, Any], previous_percentage: float) -> None:
+        """
+        Apply the new score of an already published result. Lowering the
+        attempt that held the best percentage marks the summary incomplete,
+        since only the full history has the new best.
+        """
+
+    @abstractmethod
+    async def replace(self, summary: Dict[str, Any], expected_updated_at: Optional[datetime]) -> bool:
+        """
+        Store a rebuilt summary unless the stored one changed since it was
+        read (``expected_updated_at`` is None if there was none).
+        """
+
+
+class JobRepository(ABC):
+    """
+    Persistent state of background jobs. A job's ``cursor`` is the last item
+    key of the chunks finished so far, so a job picked up again after a
+    restart continues after it. Workers claim jobs with a lease.
+    """
+
+    @abstractmethod
+    async def create(self, job: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def list_recent(self, limit: int) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def list_claimable(self, now: datetime) -> List[str]:
+        """Queued jobs and running jobs whose lease has expired"""
+
+    @abstractmethod
+    async def claim(self, job_id: str, owner: str, now: datetime, lease_until: datetime) -> bool:
+        ...
+
+    @abstractmethod
+    async def record_chunk(self, job_id: str, cursor: str, processed: int, lease_until: datetime) -> bool:
+        """Move the cursor past a finished chunk and return whether cancellation was requested"""
+
+    @abstractmethod
+    async def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def request_cancel(self, job_id: str) -> bool:
+        """Flag an unfinished job for cancellation; False if missing or finished"""
+
+
+JOB_ACTIVE_STATUSES = ("queued", "running")
+
+
+def _summary_entry(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: result.get(field) for field in SUMMARY_ENTRY_FIELDS}
+
+
+def build_summary(user_id: str, results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """A complete summary computed from every published result of a user"""
+    results = sorted(results, key=lambda result: result["completed_at"], reverse=True)
+    quizzes: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        quiz = quizzes.setdefault(result["quiz_id"], {
+            "attempts": 0, "percentage_sum": 0.0, "best_percentage": result["percentage"],
+            "quiz_title": result["quiz_title"],
+        })
+        quiz["attempts"] += 1
+        quiz["percentage_sum"] += result["percentage"]
+        quiz["best_percentage"] = max(quiz["best_percentage"], result["percentage"])
+    return {
+        "user_id": user_id,
+        "attempts": len(results),
+        "quizzes": quizzes,
+        "recent": [_summary_entry(result) for result in results[:RECENT_ATTEMPTS]],
+        "complete": True,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+class Storage:
+    """Container handing out the repositories of one engine"""
+
+    name = "base"
+
+    def __init__(
+        self,
+        users: UserRepository,
+        quizzes: QuizRepository,
+        results: ResultRepository,
+        analytics: AnalyticsRepository,
+        summaries: SummaryRepository,
+        jobs: JobRepository,
+    ):
+        self.users = users
+        self.quizzes = quizzes
+        self.results = results
+        self.analytics = analytics
+        self.summaries = summaries
+        self.jobs = jobs
+
+    async def connect(self) -> None:
+        pass
+
+    async def init_indexes(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"engine": self.name}
+
+    async def close(self) -> None:
+        pass
+
+
+# MongoDB engine
+READ_PREFERENCE_NAMES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def mongo_client_options() -> Dict[str, Any]:
+    """Pool sizing and timeouts for the Motor client, read from the environment"""
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", None),
+        # Fail fast instead of queueing forever when the pool is exhausted
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        # Hard cap for writes, which cannot carry maxTimeMS through Motor
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def _read_preference(name: str):
+    if name not in READ_PREFERENCE_NAMES:
+        raise ValueError(f"Unknown MONGO_LISTING_READ_PREFERENCE: {name}")
+    return getattr(read_preferences, name[0].upper() + name[1:])()
+
+
+def _translate_errors(method):
+    """Surface driver timeouts and connection failures as ``StorageUnavailableError``"""
+    name = f"mongo {method.__qualname__}"
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        try:
+            with span(name, **{"db.system": "mongodb"}):
+                return await method(*args, **kwargs)
+        except (ConnectionFailure, ExecutionTimeout) as e:
+            raise StorageUnavailableError(str(e)) from e
+    return wrapper
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage per server from pymongo CMAP events"""
+
+    def __init__(self):
+        self.pools: Dict[str, Dict[str, int]] = {}
+
+    def _pool(self, event) -> Dict[str, int]:
+        address = "%s:%s" % event.address
+        return self.pools.setdefault(address, {
+            "open": 0, "in_use": 0, "waiting": 0, "checked_out_total": 0,
+            "check_out_failures": 0, "wait_queue_timeouts": 0, "cleared": 0,
+        })
+
+    def pool_created(self, event):
+        self._pool(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._pool(event)["cleared"] += 1
+
+    def pool_closed(self, event):
+        self.pools.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        self._pool(event)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pool = self._pool(event)
+        pool["open"] = max(pool["open"] - 1, 0)
+
+    def connection_check_out_started(self, event):
+        self._pool(event)["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        pool = self._pool(event)
+        pool["waiting"] = max(pool["waiting"] - 1, 0)
+        pool["check_out_failures"] += 1
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            pool["wait_queue_timeouts"] += 1
+
+    def connection_checked_out(self, event):
+        pool = self._pool(event)
+        pool["waiting"] = max(pool["waiting"] - 1, 0)
+        pool["in_use"] += 1
+        pool["checked_out_total"] += 1
+
+    def connection_checked_in(self, event):
+        pool = self._pool(event)
+        pool["in_use"] = max(pool["in_use"] - 1, 0)
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, collection, max_time_ms: int):
+        self.collection = collection
+        self.max_time_ms = max_time_ms
+
+    @_translate_errors
+    async def get_by_email(self, email):
+        return await self.collection.find_one({"email": email}, _projection(None), max_time_ms=self.max_time_ms)
+
+    @_translate_errors
+    async def create(self, user):
+        await self.collection.insert_one(dict(user))
+
+    @_translate_errors
+    async def bump_token_version(self, email):
+        user = await self.collection.find_one_and_update(
+            {"email": email},
+            {"$inc": {"token_version": 1}},
+            projection={"_id": 0, "token_version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return user["token_version"] if user else 0
+
+    @_translate_errors
+    async def list_token_versions(self):
+        users = await self.collection.find(
+            {"token_version": {"$gt": 0}}, {"_id": 0, "id": 1, "token_version": 1}, max_time_ms=self.max_time_ms
+        ).to_list(None)
+        return {user["id"]: user["token_version"] for user in users}
+
+
+class MongoQuizRepository(QuizRepository):
+    def __init__(self, collection, listing_collection, versions, max_time_ms: int):
+        self.collection = collection
+        self.listing_collection = listing_collection
+        self.versions = versions
+        self.max_time_ms = max_time_ms
+
+    @_translate_errors
+    async def create(self, quiz):
+        await self.collection.insert_one(dict(quiz))
+
+    @_translate_errors
+    async def get_active(self, quiz_id):
+        return await self.collection.find_one(
+            {"id": quiz_id, "is_active": True}, _projection(None), max_time_ms=self.max_time_ms
+        )
+
+    @_translate_errors
+    async def list_active(self, fields=None, primary=False):
+        collection = self.collection if primary else self.listing_collection
+        return await collection.find(
+            {"is_active": True}, _projection(fields), max_time_ms=self.max_time_ms
+        ).to_list(MAX_LIST_RESULTS)
+
+    @_translate_errors
+    async def list_inactive_ids(self):
+        quizzes = await self.collection.find(
+            {"is_active": False}, _projection(("id",)), max_time_ms=self.max_time_ms
+        ).to_list(None)
+        return [quiz["id"] for quiz in quizzes]
+
+    @_translate_errors
+    async def update(self, quiz_id, fields):
+        outcome = await self.collection.update_one({"id": quiz_id}, {"$set": fields})
+        return outcome.matched_count > 0
+
+    @_translate_errors
+    async def save_version(self, version):
+        await self.versions.update_one(
+            {"version_id": version["version_id"]}, {"$setOnInsert": version}, upsert=True
+        )
+
+    @_translate_errors
+    async def get_version(self, version_id):
+        return await self.versions.find_one(
+            {"version_id": version_id}, _projection(None), max_time_ms=self.max_time_ms
+        )
+
+
+class MongoResultRepository(ResultRepository):
+    def __init__(self, collection, listing_collection, max_time_ms: int):
+        self.collection = collection
+        self.listing_collection = listing_collection
+        self.max_time_ms = max_time_ms
+
+    @_translate_errors
+    async def create(self, result):
+        await self.collection.insert_one(dict(result))
+
+    @_translate_errors
+    async def get(self, result_id):
+        return await self.collection.find_one({"id": result_id}, _projection(None), max_time_ms=self.max_time_ms)
+
+    @_translate_errors
+    async def update(self, result_id, fields):
+        result = await self.collection.update_one({"id": result_id}, {"$set": fields})
+        return result.matched_count
+
+    @_translate_errors
+    async def publish(self, result_id):
+        return await self.collection.find_one_and_update(
+            {"id": result_id, "is_published": False},
+            {"$set": {"is_published": True}},
+            projection=_projection(SUMMARY_ENTRY_FIELDS + ("user_id",)),
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @_translate_errors
+    async def list_publishable_ids(self, quiz_id, after, limit):
+        query = {"quiz_id": quiz_id, "is_evaluated": True, "is_published": False}
+        if after is not None:
+            query["id"] = {"$gt": after}
+        results = await self.collection.find(
+            query, _projection(("id",)), max_time_ms=self.max_time_ms
+        ).sort("id", 1).to_list(limit)
+        return [result["id"] for result in results]
+
+    @_translate_errors
+    async def list_pending(self):
+        return await self.listing_collection.find(
+            {"is_evaluated": False}, _projection(None), max_time_ms=self.max_time_ms
+        ).sort("completed_at", 1).to_list(MAX_LIST_RESULTS)
+
+    @_translate_errors
+    async def list_published_for_user(self, user_id, before=None, limit=MAX_LIST_RESULTS, before_id=None):
+        query = {"user_id": user_id, "is_published": True}
+        if before is not None and before_id is not None:
+            query["$or"] = [{"completed_at": {"$lt": before}}, {"completed_at": before, "id": {"$lt": before_id}}]
+        elif before is not None:
+            query["completed_at"] = {"$lt": before}
+        # Students expect their freshly published result, so stay on the primary
+        return await self.collection.find(
+            query, _projection(None), max_time_ms=self.max_time_ms
+        ).sort([("completed_at", -1), ("id", -1)]).to_list(limit)
+
+    @_translate_errors
+    async def list_published_user_ids(self):
+        return await self.collection.distinct("user_id", {"is_published": True}, maxTimeMS=self.max_time_ms)
+
+    @_translate_errors
+    async def list_published_for_quiz(self, quiz_id, fields=None):
+        return await self.listing_collection.find(
+            {"quiz_id": quiz_id, "is_published": True}, _projection(fields), max_time_ms=self.max_time_ms
+        ).sort("percentage", -1).to_list(MAX_LIST_RESULTS)
+
+    @_translate_errors
+    async def list_all(self):
+        return await self.listing_collection.find(
+            {}, _projection(None), max_time_ms=self.max_time_ms
+        ).sort("completed_at", -1).to_list(MAX_LIST_RESULTS)
+
+    async def stream_for_quiz(self, quiz_id, fields=None, batch_size=1000):
+        # Long-running scan, so no maxTimeMS; the driver streams by batch_size
+        cursor = self.listing_collection.find({"quiz_id": quiz_id}, _projection(fields), batch_size=batch_size)
+        batch = []
+        async for result in cursor:
+            batch.append(result)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @_translate_errors
+    async def list_archivable(self, cutoff, quiz_ids, limit):
+        return await self.collection.find(
+            {
+                "is_published": True,
+                "$or": [{"completed_at": {"$lt": cutoff}}, {"quiz_id": {"$in": list(quiz_ids)}}],
+            },
+            _projection(None),
+            max_time_ms=self.max_time_ms,
+        ).sort("completed_at", 1).to_list(limit)
+
+    @_translate_errors
+    async def delete_many(self, result_ids):
+        result = await self.collection.delete_many({"id": {"$in": list(result_ids)}})
+        return result.deleted_count
+
+
+class MongoAnalyticsRepository(AnalyticsRepository):
+    def __init__(self, collection, max_time_ms: int):
+        self.collection = collection
+        self.max_time_ms = max_time_ms
+
+    @_translate_errors
+    async def save(self, kind, quiz_id, report):
+        await self.collection.replace_one(
+            {"kind": kind, "quiz_id": quiz_id}, {**report, "kind": kind, "quiz_id": quiz_id}, upsert=True
+        )
+
+    @_translate_errors
+    async def get(self, kind, quiz_id):
+        return await self.collection.find_one(
+            {"kind": kind, "quiz_id": quiz_id}, _projection(None), max_time_ms=self.max_time_ms
+        )
+
+
+class MongoSummaryRepository(SummaryRepository):
+    def __init__(self, collection, max_time_ms: int):
+        self.collection = collection
+        self.max_time_ms = max_time_ms
+
+    @_translate_errors
+    async def get(self, user_id):
+        return await self.collection.find_one({"user_id": user_id}, _projection(None), max_time_ms=self.max_time_ms)
+
+    @_translate_errors
+    async def record_published(self, result):
+        quiz = f"quizzes.{result['quiz_id']}"
+        percentage = result["percentage"]
+        await self.collection.update_one(
+            {"user_id": result["user_id"]},
+            {
+                "$inc": {"attempts": 1, f"{quiz}.attempts": 1, f"{quiz}.percentage_sum": percentage},
+                "$max": {f"{quiz}.best_percentage": percentage},
+                "$set": {f"{quiz}.quiz_title": result["quiz_title"], "updated_at": datetime.utcnow()},
+                "$setOnInsert": {"complete": False},
+                "$push": {"recent": {
+                    "$each": [_summary_entry(result)],
+                    "$sort": {"completed_at": -1},
+                    "$slice": RECENT_ATTEMPTS,
+                }},
+            },
+            upsert=True,
+        )
+
+    @_translate_errors
+    async def record_rescored(self, result, previous_percentage):
+        quiz = f"quizzes.{result['quiz_id']}"
+        percentage = result["percentage"]
+        update = {
+            "$inc": {f"{quiz}.percentage_sum": percentage - previous_percentage},
+            "$set": {
+                "recent.$[attempt].total_score": result["total_score"],
+                "recent.$[attempt].percentage": percentage,
+                "recent.$[attempt].is_evaluated": result["is_evaluated"],
+                "updated_at": datetime.utcnow(),
+            },
+        }
+        if percentage >= previous_percentage:
+            update["$max"] = {f"{quiz}.best_percentage": percentage}
+        await self.collection.update_one(
+            {"user_id": result["user_id"]}, update, array_filters=[{"attempt.id": result["id"]}]
+        )
+        if percentage < previous_percentage:
+            await self.collection.update_one(
+                {"user_id": result["user_id"], f"{quiz}.best_percentage": previous_percentage},
+                {"$set": {"complete": False, "updated_at": datetime.utcnow()}},
+            )
+
+    @_translate_errors
+    async def replace(self, summary, expected_updated_at):
+        if expected_updated_at is None:
+            try:
+                await self.collection.insert_one(dict(summary))
+            except DuplicateKeyError:
+                return False
+            return True
+        outcome = await self.collection.replace_one(
+            {"user_id": summary["user_id"], "updated_at": expected_updated_at}, summary
+        )
+        return outcome.matched_count == 1
+
+
+class MongoJobRepository(JobRepository):
+    def __init__(self, collection, max_time_ms: int):
+        self.collection = collection
+        self.max_time_ms = max_time_ms
+
+    @_translate_errors
+    async def create(self, job):
+        await self.collection.insert_one(dict(job))
+
+    @_translate_errors
+    async def get(self, job_id):
+        return await self.collection.find_one({"id": job_id}, _projection(None), max_time_ms=self.max_time_ms)
+
+    @_translate_errors
+    async def list_recent(self, limit):
+        return await self.collection.find(
+            {}, _projection(None), max_time_ms=self.max_time_ms
+        ).sort("created_at", -1).to_list(limit)
+
+    @_translate_errors
+    async def list_claimable(self, now):
+        jobs = await self.collection.find(
+            {"status": {"$in": list(JOB_ACTIVE_STATUSES)}, "lease_expires_at": {"$not": {"$gt": now}}},
+            {"_id": 0, "id": 1},
+            max_time_ms=self.max_time_ms,
+        ).sort("created_at", 1).to_list(MAX_LIST_RESULTS)
+        return [job["id"] for job in jobs]
+
+    @_translate_errors
+    async def claim(self, job_id, owner, now, lease_until):
+        result = await self.collection.update_one(
+            {
+                "id": job_id,
+                "status": {"$in": list(JOB_ACTIVE_STATUSES)},
+                "lease_expires_at": {"$not": {"$gt": now}},
+            },
+            {"$set": {"owner": owner, "lease_expires_at": lease_until}},
+        )
+        return result.modified_count == 1
+
+    @_translate_errors
+    async def record_chunk(self, job_id, cursor, processed, lease_until):
+        job = await self.collection.find_one_and_update(
+            {"id": job_id},
+            {
+                "$inc": {"completed_chunks": 1, "processed_items": processed},
+                "$set": {"cursor": cursor, "lease_expires_at": lease_until},
+            },
+            projection={"_id": 0, "cancel_requested": 1},
+        )
+        return bool(job and job.get("cancel_requested"))
+
+    @_translate_errors
+    async def update(self, job_id, fields):
+        await self.collection.update_one({"id": job_id}, {"$set": fields})
+
+    @_translate_errors
+    async def request_cancel(self, job_id):
+        result = await self.collection.update_one(
+            {"id": job_id, "status": {"$in": list(JOB_ACTIVE_STATUSES)}},
+            {"$set": {"cancel_requested": True}},
+        )
+        return result.matched_count == 1
+
+
+class MongoStorage(Storage):
+    """
+    Motor-backed engine.
+
+    Every read carries ``maxTimeMS`` (``MONGO_QUERY_TIMEOUT_MS``) and the
+    read-heavy listings are routed by ``MONGO_LISTING_READ_PREFERENCE`` so
+    they can be served by secondaries.
+    """
+
+    name = "mongo"
+
+    def __init__(self, mongo_url: str, db_name: str):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.pool_stats = PoolStatsListener()
+        self.client_options = mongo_client_options()
+        self.client = AsyncIOMotorClient(mongo_url, event_listeners=[self.pool_stats], **self.client_options)
+        self.db = self.client[db_name]
+        self.max_time_ms = _env_int("MONGO_QUERY_TIMEOUT_MS", 5000)
+        self.listing_read_preference = os.environ.get("MONGO_LISTING_READ_PREFERENCE", "primary")
+        listing_db = self.client.get_database(
+            db_name, read_preference=_read_preference(self.listing_read_preference)
+        )
+        super().__init__(
+            MongoUserRepository(self.db.users, self.max_time_ms),
+            MongoQuizRepository(self.db.quizzes, listing_db.quizzes, self.db.quiz_versions, self.max_time_ms),
+            MongoResultRepository(self.db.quiz_results, listing_db.quiz_results, self.max_time_ms),
+            MongoAnalyticsRepository(self.db.quiz_analytics, self.max_time_ms),
+            MongoSummaryRepository(self.db.user_result_summaries, self.max_time_ms),
+            MongoJobRepository(self.db.jobs, self.max_time_ms),
+        )
+
+    @_translate_errors
+    async def connect(self):
+        # The client connects lazily; a ping makes server selection and the first handshake happen here
+        await self.client.admin.command("ping")
+
+    @_translate_errors
+    async def init_indexes(self):
+        await self.db.users.create_index("email", unique=True)
+        await self.db.quizzes.create_index("id", unique=True)
+        await self.db.quizzes.create_index("is_active")
+        await self.db.quiz_versions.create_index("version_id", unique=True)
+        await self.db.quiz_results.create_index("id", unique=True)
+        await self.db.quiz_results.create_index([("is_evaluated", 1), ("completed_at", 1)])
+        await self.db.quiz_results.create_index([("user_id", 1), ("is_published", 1), ("completed_at", -1), ("id", -1)])
+        await self.db.quiz_results.create_index([("quiz_id", 1), ("is_published", 1), ("percentage", -1)])
+        await self.db.quiz_results.create_index([("quiz_id", 1), ("is_published", 1), ("is_evaluated", 1), ("id", 1)])
+        await self.db.quiz_results.create_index([("is_published", 1), ("completed_at", 1)])
+        await self.db.quiz_analytics.create_index([("kind", 1), ("quiz_id", 1)], unique=True)
+        await self.db.user_result_summaries.create_index("user_id", unique=True)
+        await self.db.jobs.create_index("id", unique=True)
+        await self.db.jobs.create_index([("status", 1), ("created_at", 1)])
+
+    def stats(self):
+        return {
+            "engine": self.name,
+            "client_options": self.client_options,
+            "query_timeout_ms": self.max_time_ms,
+            "listing_read_preference": self.listing_read_preference,
+            "pools": copy.deepcopy(self.pool_stats.pools),
+        }
+
+    async def close(self):
+        self.client.close()
+
+
+# In-memory engine
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self._by_email: Dict[str, Dict[str, Any]] = {}
+
+    async def get_by_email(self, email):
+        user = self._by_email.get(email)
+        return copy.deepcopy(user) if user is not None else None
+
+    async def create(self, user):
+        if user["email"] in self._by_email:
+            raise ValueError(f"Duplicate email: {user['email']}")
+        self._by_email[user["email"]] = copy.deepcopy(user)
+
+    async def bump_token_version(self, email):
+        user = self._by_email.get(email)
+        if user is None:
+            return 0
+        user["token_version"] = user.get("token_version", 0) + 1
+        return user["token_version"]
+
+    async def list_token_versions(self):
+        return {
+            user["id"]: user["token_version"]
+            for user in self._by_email.values() if user.get("token_version", 0) > 0
+        }
+
+
+class MemoryQuizRepository(QuizRepository):
+    def __init__(self):
+        # Insertion order doubles as the natural order Mongo returns
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, Dict[str, Any]] = {}
+
+    async def create(self, quiz):
+        if quiz["id"] in self._by_id:
+            raise ValueError(f"Duplicate quiz id: {quiz['id']}")
+        self._by_id[quiz["id"]] = copy.deepcopy(quiz)
+
+    async def get_active(self, quiz_id):
+        quiz = self._by_id.get(quiz_id)
+        if quiz is None or not quiz.get("is_active"):
+            return None
+        return copy.deepcopy(quiz)
+
+    async def list_active(self, fields=None, primary=False):
+        active = [quiz for quiz in self._by_id.values() if quiz.get("is_active")]
+        return [_project(quiz, fields) for quiz in active[:MAX_LIST_RESULTS]]
+
+    async def list_inactive_ids(self):
+        return [quiz["id"] for quiz in self._by_id.values() if not quiz.get("is_active")]
+
+    async def update(self, quiz_id, fields):
+        quiz = self._by_id.get(quiz_id)
+        if quiz is None:
+            return False
+        quiz.update(copy.deepcopy(fields))
+        return True
+
+    async def save_version(self, version):
+        self._versions.setdefault(version["version_id"], copy.deepcopy(version))
+
+    async def get_version(self, version_id):
+        version = self._versions.get(version_id)
+        return copy.deepcopy(version) if version is not None else None
+
+
+class MemoryResultRepository(ResultRepository):
+    def __init__(self):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, Dict[str, None]] = {}
+        self._by_quiz: Dict[str, Dict[str, None]] = {}
+        self._pending: Dict[str, None] = {}
+
+    def _reindex(self, result: Dict[str, Any]) -> None:
+        if result.get("is_evaluated"):
+            self._pending.pop(result["id"], None)
+        else:
+            self._pending[result["id"]] = None
+
+    def _select(self, ids: Iterable[str], **match) -> List[Dict[str, Any]]:
+        docs = (self._by_id[result_id] for result_id in ids)
+        return [doc for doc in docs if all(doc.get(key) == value for key, value in match.items())]
+
+    @staticmethod
+    def _finish(docs, sort_key: str, descending: bool, fields=None) -> List[Dict[str, Any]]:
+        # Python's sort is stable, matching Mongo's natural order on ties
+        docs = sorted(docs, key=lambda doc: doc.get(sort_key), reverse=descending)
+        return [_project(doc, fields) for doc in docs[:MAX_LIST_RESULTS]]
+
+    async def create(self, result):
+        if result["id"] in self._by_id:
+            raise ValueError(f"Duplicate result id: {result['id']}")
+        stored = copy.deepcopy(result)
+        self._by_id[stored["id"]] = stored
+        self._by_user.setdefault(stored["user_id"], {})[stored["id"]] = None
+        self._by_quiz.setdefault(stored["quiz_id"], {})[stored["id"]] = None
+        self._reindex(stored)
+
+    async def get(self, result_id):
+        result = self._by_id.get(result_id)
+        return copy.deepcopy(result) if result is not None else None
+
+    async def update(self, result_id, fields):
+        result = self._by_id.get(result_id)
+        if result is None:
+            return 0
+        result.update(copy.deepcopy(fields))
+        self._reindex(result)
+        return 1
+
+    async def publish(self, result_id):
+        result = self._by_id.get(result_id)
+        if result is None or result.get("is_published"):
+            return None
+        result["is_published"] = True
+        return _project(result, SUMMARY_ENTRY_FIELDS + ("user_id",))
+
+    async def list_publishable_ids(self, quiz_id, after, limit):
+        results = self._select(self._by_quiz.get(quiz_id, {}), is_evaluated=True, is_published=False)
+        ids = sorted(result["id"] for result in results if after is None or result["id"] > after)
+        return ids[:limit]
+
+    async def list_pending(self):
+        return self._finish(self._select(self._pending), "completed_at", descending=False)
+
+    async def list_published_for_user(self, user_id, before=None, limit=MAX_LIST_RESULTS, before_id=None):
+        docs = self._select(self._by_user.get(user_id, {}), is_published=True)
+        if before is not None:
+            docs = [
+                doc for doc in docs
+                if doc["completed_at"] < before
+                or (before_id is not None and doc["completed_at"] == before and doc["id"] < before_id)
+            ]
+        # Sorted by id first so ties on completed_at stay in descending id order
+        docs.sort(key=lambda doc: doc["id"], reverse=True)
+        return self._finish(docs, "completed_at", descending=True)[:limit]
+
+    async def list_published_user_ids(self):
+        return [user_id for user_id, ids in self._by_user.items() if self._select(ids, is_published=True)]
+
+    async def list_published_for_quiz(self, quiz_id, fields=None):
+        docs = self._select(self._by_quiz.get(quiz_id, {}), is_published=True)
+        return self._finish(docs, "percentage", descending=True, fields=fields)
+
+    async def list_all(self):
+        return self._finish(self._by_id.values(), "completed_at", descending=True)
+
+    async def stream_for_quiz(self, quiz_id, fields=None, batch_size=1000):
+        ids = list(self._by_quiz.get(quiz_id, {}))
+        for start in range(0, len(ids), batch_size):
+            yield [_project(self._by_id[result_id], fields) for result_id in ids[start:start + batch_size]]
+
+    async def list_archivable(self, cutoff, quiz_ids, limit):
+        quiz_ids = set(quiz_ids)
+        docs = [
+            doc for doc in self._by_id.values()
+            if doc.get("is_published") and (doc["completed_at"] < cutoff or doc["quiz_id"] in quiz_ids)
+        ]
+        docs.sort(key=lambda doc: doc["completed_at"])
+        return [copy.deepcopy(doc) for doc in docs[:limit]]
+
+    async def delete_many(self, result_ids):
+        deleted = 0
+        for result_id in result_ids:
+            result = self._by_id.pop(result_id, None)
+            if result is None:
+                continue
+            self._by_user[result["user_id"]].pop(result_id, None)
+            self._by_quiz[result["quiz_id"]].pop(result_id, None)
+            self._pending.pop(result_id, None)
+            deleted += 1
+        return deleted
+
+
+class MemoryAnalyticsRepository(AnalyticsRepository):
+    def __init__(self):
+        self._reports: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    async def save(self, kind, quiz_id, report):
+        self._reports[(kind, quiz_id)] = copy.deepcopy({**report, "kind": kind, "quiz_id": quiz_id})
+
+    async def get(self, kind, quiz_id):
+        report = self._reports.get((kind, quiz_id))
+        return copy.deepcopy(report) if report is not None else None
+
+
+class MemorySummaryRepository(SummaryRepository):
+    def __init__(self):
+        self._by_user: Dict[str, Dict[str, Any]] = {}
+
+    async def get(self, user_id):
+        summary = self._by_user.get(user_id)
+        return copy.deepcopy(summary) if summary is not None else None
+
+    async def record_published(self, result):
+        summary = self._by_user.setdefault(
+            result["user_id"],
+            {"user_id": result["user_id"], "attempts": 0, "quizzes": {}, "recent": [], "complete": False},
+        )
+        quiz = summary["quizzes"].setdefault(
+            result["quiz_id"], {"attempts": 0, "percentage_sum": 0.0, "best_percentage": result["percentage"]}
+        )
+        summary["attempts"] += 1
+        quiz["attempts"] += 1
+        quiz["percentage_sum"] += result["percentage"]
+        quiz["best_percentage"] = max(quiz["best_percentage"], result["percentage"])
+        quiz["quiz_title"] = result["quiz_title"]
+        recent = summary["recent"] + [_summary_entry(copy.deepcopy(result))]
+        recent.sort(key=lambda entry: entry["completed_at"], reverse=True)
+        summary["recent"] = recent[:RECENT_ATTEMPTS]
+        summary["updated_at"] = datetime.utcnow()
+
+    async def record_rescored(self, result, previous_percentage):
+        summary = self._by_user.get(result["user_id"])
+        if summary is None or result["quiz_id"] not in summary["quizzes"]:
+            return
+        quiz = summary["quizzes"][result["quiz_id"]]
+        quiz["percentage_sum"] += result["percentage"] - previous_percentage
+        if result["percentage"] >= previous_percentage:
+            quiz["best_percentage"] = max(quiz["best_percentage"], result["percentage"])
+        elif quiz["best_percentage"] == previous_percentage:
+            summary["complete"] = False
+        for entry in summary["recent"]:
+            if entry["id"] == result["id"]:
+                entry.update(
+                    total_score=result["total_score"],
+                    percentage=result["percentage"],
+                    is_evaluated=result["is_evaluated"],
+                )
+        summary["updated_at"] = datetime.utcnow()
+
+    async def replace(self, summary, expected_updated_at):
+        current = self._by_user.get(summary["user_id"])
+        if (current["updated_at"] if current is not None else None) != expected_updated_at:
+            return False
+        self._by_user[summary["user_id"]] = copy.deepcopy(summary)
+        return True
+
+
+class MemoryJobRepository(JobRepository):
+    def __init__(self):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _claimable(job, now):
+        lease = job.get("lease_expires_at")
+        return job["status"] in JOB_ACTIVE_STATUSES and (lease is None or lease <= now)
+
+    async def create(self, job):
+        self._by_id[job["id"]] = copy.deepcopy(job)
+
+    async def get(self, job_id):
+        job = self._by_id.get(job_id)
+        return copy.deepcopy(job) if job is not None else None
+
+    async def list_recent(self, limit):
+        jobs = sorted(self._by_id.values(), key=lambda job: job["created_at"], reverse=True)[:limit]
+        return [copy.deepcopy(job) for job in jobs]
+
+    async def list_claimable(self, now):
+        jobs = sorted(self._by_id.values(), key=lambda job: job["created_at"])
+        return [job["id"] for job in jobs if self._claimable(job, now)]
+
+    async def claim(self, job_id, owner, now, lease_until):
+        job = self._by_id.get(job_id)
+        if job is None or not self._claimable(job, now):
+            return False
+        job.update(owner=owner, lease_expires_at=lease_until)
+        return True
+
+    async def record_chunk(self, job_id, cursor, processed, lease_until):
+        job = self._by_id.get(job_id)
+        if job is None:
+            return False
+        job["cursor"] = cursor
+        job["completed_chunks"] += 1
+        job["processed_items"] += processed
+        job["lease_expires_at"] = lease_until
+        return bool(job.get("cancel_requested"))
+
+    async def update(self, job_id, fields):
+        if job_id in self._by_id:
+            self._by_id[job_id].update(copy.deepcopy(fields))
+
+    async def request_cancel(self, job_id):
+        job = self._by_id.get(job_id)
+        if job is None or job["status"] not in JOB_ACTIVE_STATUSES:
+            return False
+        job["cancel_requested"] = True
+        return True
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self):
+        super().__init__(
+            MemoryUserRepository(),
+            MemoryQuizRepository(),
+            MemoryResultRepository(),
+            MemoryAnalyticsRepository(),
+            MemorySummaryRepository(),
+            MemoryJobRepository(),
+        )
+
+
+def create_storage() -> Storage:
+    """Pick the engine from ``STORAGE_BACKEND`` (``mongo`` by default)"""
+    backend = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "mongo":
+        return MongoStorage(os.environ["MONGO_URL"], os.environ["DB_NAME"])
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
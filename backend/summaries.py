@@ -0,0 +1,97 @@
+"""
+Rebuilding per-user result summaries from full history.
+
+Summaries are maintained incrementally as results are published, so a
+user whose results were published before summaries existed, or whose
+summary was marked incomplete, has it rebuilt from the hot results plus
+the archive the first time it is read. Running this module rebuilds every
+user's summary up front::
+
+    python summaries.py
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from storage import MAX_LIST_RESULTS, build_summary
+
+logger = logging.getLogger(__name__)
+
+
+async def list_user_results(
+    storage,
+    archive,
+    user_id: str,
+    before: Optional[datetime] = None,
+    limit: int = MAX_LIST_RESULTS,
+    before_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Published results of a user from both tiers, newest first and by
+    descending id on ties, after the ``(before, before_id)`` cursor
+    """
+    hot = await storage.results.list_published_for_user(user_id, before, limit, before_id)
+    archived = await archive.list_for_user(user_id, limit, before, before_id)
+    # A result being archived sits in both tiers until its hot copy is deleted
+    merged = {result["id"]: result for result in archived}
+    merged.update((result["id"], result) for result in hot)
+    results = sorted(merged.values(), key=lambda result: (result["completed_at"], result["id"]), reverse=True)
+    return results[:limit]
+
+
+async def rebuild_summary(storage, archive, user_id: str) -> Dict[str, Any]:
+    """Recompute a user's summary from every published result and store it"""
+    previous = await storage.summaries.get(user_id)
+    results: List[Dict[str, Any]] = []
+    before = before_id = None
+    while True:
+        # Results completed at the same instant can straddle a page, so the cursor includes the id
+        page = await list_user_results(storage, archive, user_id, before, MAX_LIST_RESULTS, before_id)
+        results.extend(page)
+        if len(page) < MAX_LIST_RESULTS:
+            break
+        before, before_id = page[-1]["completed_at"], page[-1]["id"]
+
+    summary = build_summary(user_id, results)
+    # Losing the race to a concurrent publish leaves the stored summary incomplete, so the next read rebuilds it
+    if not await storage.summaries.replace(summary, previous["updated_at"] if previous else None):
+        logger.info("Summary of user %s changed while being rebuilt", user_id)
+    return summary
+
+
+async def backfill(storage, archive) -> int:
+    """Rebuild the summary of every user with published results"""
+    user_ids = set(await storage.results.list_published_user_ids()) | set(await archive.user_ids())
+    for user_id in user_ids:
+        await rebuild_summary(storage, archive, user_id)
+    logger.info("Rebuilt %d result summaries", len(user_ids))
+    return len(user_ids)
+
+
+async def _main() -> None:
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    root = Path(__file__).parent
+    load_dotenv(root / ".env")
+    from archive import ResultArchive
+    from storage import create_storage
+
+    storage = create_storage()
+    archive = ResultArchive(os.environ.get("ARCHIVE_DIR", str(root / "archive")))
+    try:
+        print({"summaries": await backfill(storage, archive)})
+    finally:
+        archive.close()
+        await storage.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    argparse.ArgumentParser(description="Rebuild every user's result summary from full history").parse_args()
+    asyncio.run(_main())
@@ -0,0 +1,314 @@
+"""
+Lightweight request tracing.
+
+``TracingMiddleware`` opens a root span per request, continuing the trace
+of an incoming W3C ``traceparent`` header, and returns the request id in
+``X-Request-ID`` (the incoming one, or the trace id). Code anywhere below
+opens nested spans with ``span(name, **attributes)``, which finds its
+parent through a context variable. Outside a sampled request ``span``
+hands out a shared no-op span, so instrumentation costs one context
+variable lookup.
+
+Finished traces are exported in the OTLP JSON encoding by a background
+thread, either as JSON lines to a file (readable by the OpenTelemetry
+Collector's ``otlpjsonfile`` receiver) or posted to an OTLP/HTTP
+collector's ``/v1/traces``.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str, kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Spans of one sampled request"""
+
+    __slots__ = ("trace_id", "spans", "finished")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.finished = False
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; a no-op outside a sampled request"""
+    parent = _current_span.get()
+    # Tasks spawned by a request inherit its context and may outlive the exported trace
+    if parent is None or parent.trace.finished:
+        yield NOOP_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, KIND_INTERNAL, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end()
+        _current_span.reset(token)
+        parent.trace.spans.append(child)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def encode_otlp(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """An OTLP ExportTraceServiceRequest in its JSON encoding"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": s.trace.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id,
+                        "name": s.name,
+                        "kind": s.kind,
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": _otlp_attributes(s.attributes),
+                        "status": {"code": 2, "message": s.error} if s.error else {},
+                    }
+                    for s in spans
+                ],
+            }],
+        }]
+    }
+
+
+class FileExporter:
+    """Appends one OTLP JSON document per batch to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OTLPHttpExporter:
+    """Posts batches to an OTLP/HTTP collector"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        import requests
+
+        requests.post(self.url, json=payload, timeout=self.timeout).raise_for_status()
+
+
+class Tracer:
+    def __init__(self, exporter, sample_rate: float, service_name: str = "quiz-api",
+                 batch_size: int = 512, flush_seconds: float = 2.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate if exporter is not None else 0.0
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.exported = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=10_000)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.exporter is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=self.flush_seconds + 5)
+            self._thread = None
+
+    def should_sample(self, parent_flags: Optional[str]) -> bool:
+        if parent_flags is not None:
+            return self.sample_rate > 0 and int(parent_flags, 16) & 1 == 1
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def finish(self, trace: Trace) -> None:
+        trace.finished = True
+        try:
+            self._queue.put_nowait(trace.spans)
+        except queue.Full:
+            self.dropped += len(trace.spans)
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_seconds
+        stopping = False
+        while not stopping:
+            try:
+                spans = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if spans is None:
+                    stopping = True
+                else:
+                    batch.extend(spans)
+            except queue.Empty:
+                pass
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    self.exporter.export(encode_otlp(batch, self.service_name))
+                    self.exported += len(batch)
+                except Exception:
+                    self.dropped += len(batch)
+                    logger.exception("Exporting %d spans failed", len(batch))
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "exporter": type(self.exporter).__name__ if self.exporter is not None else None,
+            "exported_spans": self.exported,
+            "dropped_spans": self.dropped,
+            "queued_traces": self._queue.qsize(),
+        }
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        parent = TRACEPARENT.match(headers.get(b"traceparent", b"").decode("latin-1"))
+        trace_id = parent.group(1) if parent else os.urandom(16).hex()
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:128] or trace_id
+        request_token = _request_id.set(request_id)
+
+        root = None
+        if self.tracer.should_sample(parent.group(3) if parent else None):
+            root = Span(Trace(trace_id), f"{scope['method']} {scope['path']}", parent.group(2) if parent else "",
+                        KIND_SERVER, {"http.method": scope["method"], "http.target": scope["path"],
+                                      "request.id": request_id})
+        span_token = _current_span.set(root)
+        response_bytes = 0
+
+        async def send_with_request_id(message):
+            nonlocal response_bytes
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+                if root is not None:
+                    root.set_attribute("http.status_code", message["status"])
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+                if root is not None and not message.get("more_body", False):
+                    # Background tasks run after this; they still show up as children
+                    root.set_attribute("http.response_content_length", response_bytes)
+                    root.end()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except BaseException as e:
+            if root is not None:
+                root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _request_id.reset(request_token)
+            if root is not None:
+                route = scope.get("route")
+                if route is not None and hasattr(route, "path"):
+                    root.name = f"{scope['method']} {route.path}"
+                root.end()
+                root.trace.spans.append(root)
+                self.tracer.finish(root.trace)
+
+
+def create_tracer() -> Tracer:
+    """
+    Build the tracer from ``TRACE_SAMPLE_RATE`` (0 to 1) and either
+    ``TRACE_FILE`` or ``TRACE_OTLP_ENDPOINT``.
+    """
+    exporter = None
+    if os.environ.get("TRACE_OTLP_ENDPOINT"):
+        exporter = OTLPHttpExporter(os.environ["TRACE_OTLP_ENDPOINT"])
+    elif os.environ.get("TRACE_FILE"):
+        exporter = FileExporter(os.environ["TRACE_FILE"])
+    return Tracer(
+        exporter,
+        sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0")),
+        service_name=os.environ.get("TRACE_SERVICE_NAME", "quiz-api"),
+    )
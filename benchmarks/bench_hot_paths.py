@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the API's hot paths, with regression tracking.
+
+Times Quiz and QuizResult validation and serialization, submission
+scoring and the whole submit handler, the answer-key stripping of
+get_quiz, JWT encoding and decoding at several question counts, and the
+end-to-end latency of the main endpoints through an in-process ASGI client.
+The API runs on the in-memory storage engine, or with ``--storage mongo``
+on a scratch database of the MongoDB named by ``MONGO_URL``, so the two
+runs show how much of the latency is the database.
+
+Results can be written to JSON with ``--output``. With a baseline (the
+stored one by default) every case is compared against it, and the run
+fails when a case's fastest timing is slower than the baseline's median
+by more than ``--threshold``; a case over it is re-timed ``--retries``
+times first. ``--update-baseline`` stores the run as the new baseline.
+Timings depend on the machine, so keep the baseline from the machine the
+comparison runs on. Quick runs, and runs on another storage engine than
+the baseline's, are compared for information only and never fail.
+
+    python benchmarks/bench_hot_paths.py [--quick] [--storage mongo] [--filter submit] [--output run.json]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "hot_paths_baseline.json"
+
+QUESTION_COUNTS = (10, 50, 100, 500)
+HTTP_QUESTION_COUNTS = (50, 500)
+
+import httpx
+
+# The server module and its serializer, imported by configure() once the storage engine is chosen
+server = None
+serialize_json = None
+
+
+def configure(storage: str) -> None:
+    """
+    Import the server with the benchmark's configuration, which it reads on
+    import: the storage engine, scratch directories and rate limits that a
+    benchmark loop cannot trip.
+    """
+    global server, serialize_json
+    scratch = tempfile.mkdtemp(prefix="bench-hot-paths-")
+    env = {
+        "STORAGE_BACKEND": storage,
+        "CHANGE_STREAMS": "off",
+        "ARCHIVE_DIR": os.path.join(scratch, "archive"),
+        "CACHE_BUS_DIR": os.path.join(scratch, "bus"),
+        "TRACE_SAMPLE_RATE": "0",
+        "RATE_LIMIT_LOGIN": "1000000/1",
+        "RATE_LIMIT_LOGIN_IP": "1000000/1",
+        "RATE_LIMIT_REGISTER": "1000000/1",
+        "RATE_LIMIT_REGISTER_IP": "1000000/1",
+        "RATE_LIMIT_QUIZ_ATTEMPT": "1000000/1",
+    }
+    if storage == "mongo":
+        from dotenv import load_dotenv
+
+        load_dotenv(ROOT / "backend" / ".env")
+        # The fixed benchmark ids would collide with an earlier run's; the database is dropped afterwards
+        env["DB_NAME"] = f"{os.environ.get('DB_NAME', 'quiz')}_bench_{uuid.uuid4().hex[:8]}"
+    os.environ.update(env)
+    sys.path.insert(0, str(ROOT / "backend"))
+
+    import server as server_module
+    from cache import serialize_json as serialize
+
+    server, serialize_json = server_module, serialize
+    logging.getLogger().setLevel(logging.WARNING)
+
+# Quiz version of each benchmark quiz by question count, filled in by run()
+VERSIONS = {}
+
+
+def make_quiz_doc(n_questions: int):
+    """An active quiz with four-option MCQs and every tenth question a text question"""
+    questions = []
+    for i in range(n_questions):
+        if i % 10 == 9:
+            questions.append({
+                "id": f"q{i:04d}", "question_text": f"Explain concept {i} in your own words.",
+                "question_type": "text", "options": None, "correct_option": None,
+                "explanation": None, "points": 5,
+            })
+        else:
+            questions.append({
+                "id": f"q{i:04d}", "question_text": f"Which statement about topic {i} is correct?",
+                "question_type": "multiple_choice",
+                "options": [f"Statement {k} about topic {i}" for k in range(4)],
+                "correct_option": i % 4, "explanation": f"Statement {i % 4} is the textbook definition.",
+                "points": 1,
+            })
+    return {
+        "id": f"bench-quiz-{n_questions}", "title": f"Benchmark quiz ({n_questions} questions)",
+        "subject": "Benchmarks", "description": None, "questions": questions, "created_by": "admin",
+        "created_at": datetime.utcnow(), "time_limit": 60, "total_questions": n_questions,
+        "total_points": sum(question["points"] for question in questions), "is_active": True,
+        "requires_evaluation": any(question["question_type"] == "text" for question in questions),
+    }
+
+
+def make_submission(quiz_doc, quiz_version=None):
+    responses = []
+    for i, question in enumerate(quiz_doc["questions"]):
+        if question["question_type"] == "multiple_choice":
+            responses.append({"question_id": question["id"], "selected_option": (i * 7) % 4})
+        else:
+            responses.append({"question_id": question["id"], "text_answer": "A short answer " * 20})
+    return {"responses": responses, "time_taken": 600, "quiz_version": quiz_version}
+
+
+# Timing
+def time_sync(fn, repeat: int, target: float):
+    """Per-call seconds of ``fn`` over ``repeat`` rounds of at least ``target`` seconds"""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < target:
+        number *= 2
+    return [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+
+
+async def time_async(fn, repeat: int, target: float):
+    async def run(number):
+        # Like timeit, keep garbage collection out of the measurement
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                await fn()
+            return time.perf_counter() - start
+        finally:
+            gc.enable()
+
+    number = 1
+    while await run(number) < target:
+        number *= 2
+    return [await run(number) / number for _ in range(repeat)]
+
+
+async def time_requests(fn, count: int):
+    """Latency of ``count`` sequential requests, after a few to warm up"""
+    for _ in range(min(10, count)):
+        await fn()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summarize(samples, percentiles: bool = False):
+    summary = {
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "min_us": round(min(samples) * 1e6, 2),
+    }
+    if percentiles:
+        ordered = sorted(samples)
+        summary["p95_us"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6, 2)
+        summary["requests"] = len(samples)
+    return summary
+
+
+# Cases
+def model_cases():
+    for n in QUESTION_COUNTS:
+        doc = make_quiz_doc(n)
+        quiz = server.Quiz(**doc)
+        yield f"model.quiz.validate[q={n}]", lambda doc=doc: server.Quiz(**doc)
+        yield f"model.quiz.serialize[q={n}]", lambda quiz=quiz: serialize_json(quiz)
+
+        version = VERSIONS[n]
+        attempt = server.QuizAttemptSubmission(**make_submission(doc))
+        auto_score, details, responses = version.score(attempt.responses)
+        fields = dict(
+            quiz_id=doc["id"], quiz_version=version.version_id, quiz_title=doc["title"], user_id="bench-user",
+            user_email="bench@example.com", user_name="Bench User", responses=responses, auto_score=auto_score,
+            total_score=auto_score, max_possible_score=doc["total_points"], time_taken=600,
+            detailed_results=details,
+        )
+        result = server.QuizResult(**fields)
+        yield f"model.result.validate[q={n}]", lambda fields=fields: server.QuizResult(**fields)
+        yield f"model.result.serialize[q={n}]", lambda result=result: serialize_json(result)
+
+
+def scoring_cases():
+    for n in QUESTION_COUNTS:
+        doc = make_quiz_doc(n)
+        version = VERSIONS[n]
+        attempt = server.QuizAttemptSubmission(**make_submission(doc))
+        yield f"submit.score[q={n}]", lambda version=version, attempt=attempt: version.score(attempt.responses)
+        yield f"get_quiz.sanitize[q={n}]", lambda doc=doc: server.sanitize_questions(doc["questions"])
+
+
+def jwt_cases():
+    user = {"id": "bench-user", "email": "bench@example.com", "full_name": "Bench User", "role": "user"}
+    access_token, _ = server.create_token_pair(user)
+    claims = {"sub": user["email"], "uid": user["id"], "role": "user", "name": user["full_name"], "ver": 0,
+              "typ": "access"}
+    expires = server.timedelta(minutes=server.ACCESS_TOKEN_EXPIRE_MINUTES)
+    yield "jwt.encode", lambda: server.create_access_token(claims, expires_delta=expires)
+    yield "jwt.decode", lambda: server.jwt.decode(access_token, server.SECRET_KEY, algorithms=[server.ALGORITHM])
+
+
+def handler_cases():
+    user = server.User.model_construct(id="bench-user", email="bench@example.com", full_name="Bench User",
+                                       role="user")
+    for n in QUESTION_COUNTS:
+        doc = make_quiz_doc(n)
+        attempt = server.QuizAttemptSubmission(
+            **make_submission(doc, VERSIONS[n].version_id)
+        )
+        yield f"submit.handler[q={n}]", lambda doc=doc, attempt=attempt: server.submit_quiz_attempt(
+            doc["id"], attempt, current_user=user
+        )
+
+
+async def http_cases(client):
+    """End-to-end requests as (name, zero-argument coroutine function)"""
+    response = await client.post("/api/register", json={
+        "email": "bench-user@example.com", "password": "benchmark", "full_name": "Bench User",
+    })
+    response.raise_for_status()
+    response = await client.post("/api/login", json={"email": "bench-user@example.com", "password": "benchmark"})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def get(url):
+        (await client.get(url, headers=headers)).raise_for_status()
+
+    async def post(url, body):
+        (await client.post(url, headers=headers, json=body)).raise_for_status()
+
+    cases = [("http.GET /api/quizzes", lambda: get("/api/quizzes"))]
+    result_id = None
+    for n in HTTP_QUESTION_COUNTS:
+        quiz_id = f"bench-quiz-{n}"
+        body = make_submission(make_quiz_doc(n), VERSIONS[n].version_id)
+        if result_id is None:
+            response = await client.post(f"/api/quizzes/{quiz_id}/attempt", headers=headers, json=body)
+            response.raise_for_status()
+            result_id = response.json()["id"]
+        cases.append((f"http.GET /api/quizzes/{{id}}[q={n}]", lambda quiz_id=quiz_id: get(f"/api/quizzes/{quiz_id}")))
+        cases.append((f"http.POST /api/quizzes/{{id}}/attempt[q={n}]",
+                      lambda quiz_id=quiz_id, body=body: post(f"/api/quizzes/{quiz_id}/attempt", body)))
+    cases.append(("http.GET /api/results/{id}", lambda: get(f"/api/results/{result_id}")))
+    return cases
+
+
+async def measure(kind: str, fn, args):
+    if kind == "sync":
+        summary = summarize(time_sync(fn, args.repeat, args.target))
+    elif kind == "async":
+        summary = summarize(await time_async(fn, args.repeat, args.target))
+    else:
+        summary = summarize(await time_requests(fn, args.requests), percentiles=True)
+    gc.collect()
+    return summary
+
+
+def report_line(name, summary, note=""):
+    extra = f"  p95 {summary['p95_us'] / 1000:8.2f} ms" if "p95_us" in summary else ""
+    print(f"  {name:<44} {summary['median_us']:>12,.1f} us{extra}{note}", flush=True)
+
+
+async def run(args, baseline=None):
+    """Time every selected case; cases slower than ``baseline`` are re-timed up to ``args.retries`` times"""
+    def selected(name):
+        return not args.filter or any(part in name for part in args.filter)
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        try:
+            # Quizzes and their versions go straight into storage, as create_quiz would leave them
+            for n in QUESTION_COUNTS:
+                doc = make_quiz_doc(n)
+                version = await server.quiz_versions.save(doc)
+                doc["current_version"] = version.version_id
+                await server.storage.quizzes.create(doc)
+                VERSIONS[n] = version
+            server.quiz_catalogue.invalidate()
+
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                cases = [(name, "sync", fn) for name, fn in (*model_cases(), *scoring_cases(), *jwt_cases())]
+                cases += [(name, "async", fn) for name, fn in handler_cases()]
+                cases += [(name, "http", fn) for name, fn in await http_cases(client)]
+                cases = [case for case in cases if selected(case[0])]
+
+                for name, kind, fn in cases:
+                    results[name] = await measure(kind, fn, args)
+                    report_line(name, results[name])
+
+                # A real regression shows up every time; a noisy neighbour does not
+                for name, kind, fn in cases:
+                    before = (baseline or {}).get("results", {}).get(name)
+                    for _ in range(args.retries if before else 0):
+                        if change(results[name], before) <= args.threshold:
+                            break
+                        retry = await measure(kind, fn, args)
+                        report_line(name, retry, "  (retry)")
+                        if retry["min_us"] < results[name]["min_us"]:
+                            results[name] = retry
+        finally:
+            if args.storage == "mongo":
+                await server.storage.client.drop_database(server.storage.db.name)
+    return results
+
+
+# Regression tracking
+def metadata(storage: str):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "storage": storage,
+    }
+
+
+def change(summary, before) -> float:
+    """
+    Slowdown of a case against its baseline. A busy machine only ever makes
+    timings slower, so this run's fastest timing is held against the
+    baseline's typical one: noise cannot push it over, a real slowdown does.
+    """
+    return summary["min_us"] / before["median_us"] - 1
+
+
+def compare(report, baseline, threshold: float):
+    """Print each case against the baseline and return the names that regressed"""
+    regressions = []
+    print(f"\ncompared with baseline from {baseline['meta'].get('created_at')} "
+          f"(commit {baseline['meta'].get('commit')}): baseline median -> fastest now, threshold +{threshold:.0%}")
+    for name, summary in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"  {name:<44} new")
+            continue
+        slowdown = change(summary, before)
+        flag = ""
+        if slowdown > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"  {name:<44} {before['median_us']:>12,.1f} -> {summary['min_us']:>12,.1f} us ({slowdown:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", action="append", help="only run cases whose name contains this; repeatable")
+    parser.add_argument("--repeat", type=int, default=7, help="timing rounds per case")
+    parser.add_argument("--target", type=float, default=0.2, help="minimum seconds per timing round")
+    parser.add_argument("--requests", type=int, default=300, help="requests per end-to-end case")
+    parser.add_argument("--quick", action="store_true",
+                        help="fewer and shorter rounds, for a smoke run; compared with the baseline but never fails")
+    parser.add_argument("--storage", choices=("memory", "mongo"), default="memory",
+                        help="storage engine; mongo uses MONGO_URL from the environment or backend/.env")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fail when a case is slower than the baseline by more than this fraction")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="re-time a case that looks regressed up to this many times before failing it")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args()
+    if args.quick:
+        if args.update_baseline:
+            parser.error("a --quick run is too noisy to be stored as the baseline")
+        args.repeat, args.target, args.requests = 3, 0.05, 50
+
+    baseline = None
+    if not args.update_baseline and args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+    # Baselines taken before the storage engine was recorded all ran on the memory engine
+    gated = baseline is not None and not args.quick and baseline["meta"].get("storage", "memory") == args.storage
+
+    configure(args.storage)
+    print(f"hot paths on {args.storage} storage (median per call):")
+    gc.collect()
+    report = {"meta": metadata(args.storage), "results": asyncio.run(run(args, baseline if gated else None))}
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nresults written to {args.output}")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline updated: {args.baseline}")
+        return
+    if baseline is None:
+        print(f"\nno baseline at {args.baseline}; run with --update-baseline to store one")
+        return
+
+    regressions = compare(report, baseline, args.threshold)
+    if not gated:
+        if args.quick:
+            reason = "a quick run"
+        else:
+            reason = f"{args.storage} storage against a {baseline['meta'].get('storage', 'memory')} baseline"
+        print(f"\n{len(regressions)} case(s) past +{args.threshold:.0%}, not enforced for {reason}")
+        return
+    if regressions:
+        print(f"\n{len(regressions)} hot path(s) regressed past +{args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the item analysis engine.
+
+Streams synthetic quiz results through ItemAnalyzer in chunks, the same
+way run_item_analysis consumes the results collection, and reports the
+runtime and peak RSS. Results are generated chunk by chunk so memory use
+reflects the analyzer rather than the data set.
+"""
+
+import argparse
+import random
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from item_analysis import ItemAnalyzer  # noqa: E402
+
+
+def make_quiz(n_questions: int, n_options: int):
+    return {
+        "id": "bench-quiz",
+        "title": "Benchmark quiz",
+        "questions": [
+            {
+                "id": f"q{i}",
+                "question_text": f"Question {i}",
+                "question_type": "multiple_choice",
+                "options": [f"option {k}" for k in range(n_options)],
+                "correct_answer": "option 0",
+                "points": 1,
+            }
+            for i in range(n_questions)
+        ],
+    }
+
+
+def make_results(quiz, count: int, rng: random.Random):
+    questions = quiz["questions"]
+    results = []
+    for _ in range(count):
+        skill = rng.random()
+        responses = []
+        for question in questions:
+            roll = rng.random()
+            if roll < 0.02:
+                continue
+            answer = question["correct_answer"] if roll < skill else rng.choice(question["options"])
+            responses.append({"question_id": question["id"], "selected_answer": answer, "text_answer": None})
+        results.append({"responses": responses})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--attempts", type=int, default=1_000_000)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    quiz = make_quiz(args.questions, args.options)
+    analyzer = ItemAnalyzer(quiz)
+
+    generate_time = encode_time = compute_time = 0.0
+    remaining = args.attempts
+    while remaining > 0:
+        count = min(args.chunk_size, remaining)
+        remaining -= count
+
+        start = time.perf_counter()
+        results = make_results(quiz, count, rng)
+        generate_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        matrix = analyzer.encode(results)
+        encode_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        analyzer.add_matrix(matrix)
+        compute_time += time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = analyzer.report()
+    report_time = time.perf_counter() - start
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    analysis_time = encode_time + compute_time + report_time
+    print(f"attempts:        {report['attempts']:,} x {args.questions} questions")
+    print(f"encode:          {encode_time:.2f}s")
+    print(f"vectorized pass: {compute_time:.2f}s")
+    print(f"report:          {report_time * 1000:.1f}ms")
+    print(f"analysis total:  {analysis_time:.2f}s ({report['attempts'] / analysis_time:,.0f} attempts/s)")
+    print(f"data generation: {generate_time:.2f}s (not counted)")
+    print(f"peak RSS:        {peak_rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
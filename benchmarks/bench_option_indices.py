@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark for storing MCQ answers as option indices.
+
+Compares results with answers stored as option text, the format written
+before option indices, against the index format. It measures the BSON size
+of a stored result, the time to score a submission, and the time to encode
+results for item analysis.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from item_analysis import ItemAnalyzer  # noqa: E402
+from quiz_versions import VERSIONED_DETAIL_FIELDS, QuizVersion  # noqa: E402
+
+
+class Response(NamedTuple):
+    question_id: str
+    selected_option: Optional[int] = None
+    selected_answer: Optional[str] = None
+    text_answer: Optional[str] = None
+
+
+def make_version(n_questions: int, n_options: int, option_words: int, rng: random.Random):
+    words = "cell energy market velocity protein theory evidence increase result system".split()
+    questions = []
+    for i in range(n_questions):
+        options = [" ".join(rng.choices(words, k=option_words)) + f" ({k})" for k in range(n_options)]
+        questions.append({
+            "id": f"question-{i:04d}-" + "0" * 22,  # uuid4-length ids
+            "question_text": f"Question {i}",
+            "question_type": "multiple_choice",
+            "options": options,
+            "correct_option": rng.randrange(n_options),
+            "explanation": "",
+            "points": 1,
+        })
+    return QuizVersion({
+        "version_id": "bench", "quiz_id": "bench-quiz", "title": "Benchmark quiz",
+        "questions": questions, "total_points": n_questions, "requires_evaluation": False,
+    })
+
+
+def score_as_text(version: QuizVersion, responses):
+    """The scoring loop as it was before option indices, comparing option text"""
+    auto_score = 0
+    detailed_results = []
+    stored_responses = []
+    for response in responses:
+        stored_responses.append({
+            "question_id": response.question_id,
+            "selected_answer": response.selected_answer,
+            "text_answer": response.text_answer,
+        })
+        question_data = version.questions_by_id.get(response.question_id, {})
+        if question_data.get("question_type") == "multiple_choice":
+            selected_answer = response.selected_answer
+            correct_answer = question_data.get("correct_answer")
+            is_correct = selected_answer == correct_answer
+            points_earned = question_data.get("points", 1) if is_correct else 0
+            auto_score += points_earned
+            detailed_results.append({
+                "question_id": response.question_id,
+                "question_text": question_data.get("question_text", ""),
+                "question_type": "multiple_choice",
+                "selected_answer": selected_answer,
+                "correct_answer": correct_answer,
+                "is_correct": is_correct,
+                "points_possible": question_data.get("points", 1),
+                "points_earned": points_earned,
+                "explanation": question_data.get("explanation", ""),
+            })
+    return auto_score, detailed_results, stored_responses
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--attempts", type=int, default=20_000)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--option-words", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    version = make_version(args.questions, args.options, args.option_words, rng)
+    text_version = QuizVersion({
+        "version_id": "bench-text", "quiz_id": "bench-quiz", "title": version.title,
+        "questions": [
+            {**{k: v for k, v in q.items() if k != "correct_option"}, "correct_answer": q["options"][q["correct_option"]]}
+            for q in version.questions
+        ],
+        "total_points": version.total_points, "requires_evaluation": False,
+    })
+    picks = [[rng.randrange(args.options) for _ in version.questions] for _ in range(args.attempts)]
+    as_index = [
+        [Response(q["id"], selected_option=k) for q, k in zip(version.questions, row)] for row in picks
+    ]
+    as_text = [
+        [Response(q["id"], selected_answer=q["options"][k]) for q, k in zip(version.questions, row)] for row in picks
+    ]
+
+    # Stored size of one result's responses and detailed results
+    sample = range(min(1000, args.attempts))
+    text_size = index_size = 0
+    for i in sample:
+        _, details, responses = score_as_text(text_version, as_text[i])
+        text_size += len(bson.encode({
+            "responses": responses,
+            "detailed_results": details,
+        }))
+        _, details, responses = version.score(as_index[i])
+        index_size += len(bson.encode({
+            "responses": responses,
+            "detailed_results": [
+                {key: value for key, value in detail.items() if key not in VERSIONED_DETAIL_FIELDS}
+                for detail in details
+            ],
+        }))
+    text_size /= len(sample)
+    index_size /= len(sample)
+
+    text_score = timed(lambda responses: score_as_text(text_version, responses), as_text)
+    compat_score = timed(version.score, as_text)
+    index_score = timed(version.score, as_index)
+
+    analyzer = ItemAnalyzer({"title": version.title, "questions": version.questions})
+    text_docs = [{"responses": [r._asdict() for r in responses]} for responses in as_text]
+    index_docs = [{"responses": [r._asdict() for r in responses]} for responses in as_index]
+    start = time.perf_counter()
+    analyzer.encode(text_docs)
+    text_encode = time.perf_counter() - start
+    start = time.perf_counter()
+    analyzer.encode(index_docs)
+    index_encode = time.perf_counter() - start
+
+    print(f"quiz:                   {args.questions} MCQ x {args.options} options of {args.option_words} words")
+    print(f"stored answers (BSON):  text {text_size:,.0f} B -> index {index_size:,.0f} B per result "
+          f"({1 - index_size / text_size:.0%} smaller)")
+    print(f"scoring:                text {text_score:.1f} us, index {index_score:.1f} us, "
+          f"text via compat path {compat_score:.1f} us per attempt")
+    print(f"item analysis encode:   text {text_encode:.2f}s, index {index_encode:.2f}s "
+          f"for {args.attempts:,} attempts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark for answer-similarity detection.
+
+Generates synthetic attempts of a quiz with multiple choice and text
+questions, plants a number of colluding pairs (copied answers with a few
+changes), runs SimilarityDetector over them and reports the runtime, the
+peak RSS and how many planted pairs were found.
+"""
+
+import argparse
+import random
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from similarity import SimilarityDetector  # noqa: E402
+
+VOCABULARY = (
+    "the a of to and in is that for it as was with be by on not this are or from at which "
+    "energy force mass velocity cell protein market price demand supply theory evidence "
+    "because therefore however result process system change increase decrease value"
+).split()
+
+
+def make_quiz(n_questions: int, n_options: int, n_text: int):
+    questions = [
+        {
+            "id": f"q{i}",
+            "question_text": f"Question {i}",
+            "question_type": "multiple_choice",
+            "options": [f"option {k}" for k in range(n_options)],
+            "correct_answer": "option 0",
+            "points": 1,
+        }
+        for i in range(n_questions)
+    ]
+    questions += [
+        {"id": f"t{i}", "question_text": f"Essay {i}", "question_type": "text", "points": 5}
+        for i in range(n_text)
+    ]
+    return {"id": "bench-quiz", "title": "Benchmark quiz", "questions": questions}
+
+
+def make_attempt(quiz, index: int, rng: random.Random):
+    skill = rng.random()
+    responses = []
+    for question in quiz["questions"]:
+        if question["question_type"] == "text":
+            words = rng.choices(VOCABULARY, k=rng.randint(30, 80))
+            responses.append({"question_id": question["id"], "selected_answer": None, "text_answer": " ".join(words)})
+            continue
+        roll = rng.random()
+        if roll < 0.02:
+            continue
+        answer = question["correct_answer"] if roll < skill else rng.choice(question["options"])
+        responses.append({"question_id": question["id"], "selected_answer": answer, "text_answer": None})
+    return {
+        "id": f"r{index}", "user_id": f"u{index}", "user_name": f"User {index}",
+        "user_email": f"user{index}@example.com", "responses": responses,
+    }
+
+
+def copy_attempt(source, index: int, quiz, rng: random.Random):
+    responses = []
+    for response in source["responses"]:
+        response = dict(response)
+        if response["text_answer"]:
+            words = response["text_answer"].split()
+            for _ in range(len(words) // 20):
+                words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+            response["text_answer"] = " ".join(words)
+        responses.append(response)
+    # Change one MCQ answer so the copy is not byte-identical
+    mcq = [r for r in responses if r["selected_answer"] is not None]
+    if mcq:
+        question = next(q for q in quiz["questions"] if q["id"] == mcq[0]["question_id"])
+        mcq[0]["selected_answer"] = rng.choice(question["options"])
+    return {**source, "id": f"r{index}", "user_id": f"u{index}", "user_name": f"User {index}", "responses": responses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--attempts", type=int, default=10_000)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--text-questions", type=int, default=2)
+    parser.add_argument("--colluding-pairs", type=int, default=25)
+    parser.add_argument("--workers", type=int, default=0, help="process pool size, 0 runs in-process")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--block-memory-mb", type=int, default=64, help="memory budget of one MCQ comparison block")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    quiz = make_quiz(args.questions, args.options, args.text_questions)
+    attempts = [make_attempt(quiz, i, rng) for i in range(args.attempts - args.colluding_pairs)]
+    planted = set()
+    for k in range(args.colluding_pairs):
+        source = rng.randrange(len(attempts))
+        attempts.append(copy_attempt(attempts[source], len(attempts), quiz, rng))
+        planted.add((f"r{source}", f"r{len(attempts) - 1}"))
+
+    detector = SimilarityDetector(quiz, block_memory_bytes=args.block_memory_mb * 1024 * 1024)
+    start = time.perf_counter()
+    for offset in range(0, len(attempts), args.chunk_size):
+        detector.add_results(attempts[offset:offset + args.chunk_size])
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = detector.run(args.workers)
+    compare_time = time.perf_counter() - start
+
+    def found(pairs):
+        ids = {tuple(sorted(a["id"] for a in pair["attempts"])) for pair in pairs}
+        return sum(tuple(sorted(pair)) in ids for pair in planted)
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    n = report["attempts"]
+    print(f"attempts:        {n:,} ({n * (n - 1) // 2:,} pairs), {args.questions} MCQ + {args.text_questions} text")
+    print(f"workers:         {args.workers or 'in-process'}")
+    print(f"encode:          {encode_time:.2f}s")
+    print(f"compare:         {compare_time:.2f}s")
+    print(f"MCQ pairs:       {report['mcq_pairs_found']} flagged, {found(report['mcq_pairs'])}/{len(planted)} planted found")
+    print(f"text pairs:      {report['text_pairs_found']} flagged, "
+          f"{found(report['text_pairs'])}/{len(planted)} planted found")
+    print(f"peak RSS:        {peak_rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark for API worker startup.
+
+Starts fresh interpreters that import the server module and run its
+lifespan startup, the way each uvicorn worker does, and reports the import
+time, the startup time and the worker's RSS after each step, plus which
+heavy modules ended up loaded. With ``--profile`` it also lists the
+slowest imports from ``python -X importtime``.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+HEAVY_MODULES = ("numpy", "pymongo", "motor", "jose", "passlib", "email_validator", "zstandard", "sqlite3")
+
+WORKER = """
+import asyncio, json, sys, time
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+import_rss = rss_mb()
+
+async def startup():
+    async with server.app.router.lifespan_context(server.app):
+        return time.perf_counter()
+
+started = asyncio.run(startup())
+print(json.dumps({
+    "import_s": imported - start,
+    "startup_s": started - imported,
+    "import_rss_mb": import_rss,
+    "started_rss_mb": rss_mb(),
+    "loaded": [name for name in json.loads(sys.argv[1]) if name in sys.modules],
+}))
+"""
+
+
+def run_worker(env):
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER, json.dumps(HEAVY_MODULES)],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _direct_imports(env, code: str):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only imports made directly by the top-level module, so nested ones are not counted twice
+        if len(name) - len(name.lstrip()) == 3:
+            yield name.strip(), int(cumulative) / 1000
+
+
+def slowest_imports(env, top: int):
+    interpreter = {name for name, _ in _direct_imports(env, "pass")}
+    rows = [(millis, name) for name, millis in _direct_imports(env, "import server") if name not in interpreter]
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--storage", choices=("memory", "mongo"), default="memory",
+                        help="storage engine; mongo uses MONGO_URL and DB_NAME from the environment or backend/.env")
+    parser.add_argument("--profile", type=int, default=0, metavar="N", help="list the N slowest imports made by the server module")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-startup-")
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": args.storage,
+        "ARCHIVE_DIR": os.path.join(scratch, "archive"),
+        "CACHE_BUS_DIR": os.path.join(scratch, "bus"),
+        "PYTHONDONTWRITEBYTECODE": "",
+    }
+    runs = [run_worker(env) for _ in range(args.runs)]
+
+    def median(key):
+        return statistics.median(run[key] for run in runs)
+
+    print(f"storage:            {args.storage}, median of {args.runs} runs")
+    print(f"import:             {median('import_s') * 1000:.0f} ms, RSS {median('import_rss_mb'):.1f} MB")
+    print(f"lifespan startup:   {median('startup_s') * 1000:.0f} ms, RSS {median('started_rss_mb'):.1f} MB")
+    print(f"heavy modules:      {', '.join(runs[-1]['loaded']) or 'none'}")
+    if args.profile:
+        print("slowest imports:")
+        for millis, name in slowest_imports(env, args.profile):
+            print(f"  {millis:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,12 @@ export const useAuth = () => {
   return context;
 };
 
+// Endpoints whose 401 means bad credentials, not an expired access token
+const NO_REFRESH_PATHS = ['/login', '/register', '/token/refresh', '/logout'];
+
+// One refresh at a time; requests failing meanwhile wait for it instead of refreshing again
+let refreshRequest = null;
+
 const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem('token'));
@@ -24,19 +30,77 @@ const AuthProvider = ({ children }) => {
   useEffect(() => {
     if (token) {
       axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
-      fetchUserProfile();
+      if (!user) {
+        fetchUserProfile();
+      }
     } else {
       setLoading(false);
     }
   }, [token]);
 
+  useEffect(() => {
+    // Access tokens are short-lived: on a 401, exchange the refresh token once and retry
+    const interceptor = axios.interceptors.response.use(
+      response => response,
+      async error => {
+        const config = error.config;
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (
+          error.response?.status !== 401 ||
+          !config ||
+          config._retried ||
+          !refreshToken ||
+          NO_REFRESH_PATHS.some(path => config.url?.endsWith(path))
+        ) {
+          return Promise.reject(error);
+        }
+        config._retried = true;
+        try {
+          const accessToken = await refreshTokens(refreshToken);
+          config.headers['Authorization'] = `Bearer ${accessToken}`;
+          return axios(config);
+        } catch (refreshError) {
+          // Refresh token expired or revoked: back to the login form
+          clearSession();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
+  const storeTokens = (accessToken, refreshToken) => {
+    localStorage.setItem('token', accessToken);
+    if (refreshToken) {
+      localStorage.setItem('refreshToken', refreshToken);
+    }
+    axios.defaults.headers.common['Authorization'] = `Bearer ${accessToken}`;
+    setToken(accessToken);
+  };
+
+  const refreshTokens = (refreshToken) => {
+    if (!refreshRequest) {
+      refreshRequest = axios
+        .post(`${API}/token/refresh`, { refresh_token: refreshToken })
+        .then(response => {
+          storeTokens(response.data.access_token, response.data.refresh_token);
+          setUser(response.data.user);
+          return response.data.access_token;
+        })
+        .finally(() => {
+          refreshRequest = null;
+        });
+    }
+    return refreshRequest;
+  };
+
   const fetchUserProfile = async () => {
     try {
       const response = await axios.get(`${API}/me`);
       setUser(response.data);
     } catch (error) {
       console.error('Error fetching user profile:', error);
-      logout();
+      clearSession();
     } finally {
       setLoading(false);
     }
@@ -45,12 +109,10 @@ const AuthProvider = ({ children }) => {
   const login = async (email, password) => {
     try {
       const response = await axios.post(`${API}/login`, { email, password });
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
       
-      localStorage.setItem('token', access_token);
-      setToken(access_token);
       setUser(userData);
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      storeTokens(access_token, refresh_token);
       
       return { success: true };
     } catch (error) {
@@ -78,13 +140,24 @@ const AuthProvider = ({ children }) => {
     }
   };
 
-  const logout = () => {
+  const clearSession = () => {
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     setToken(null);
     setUser(null);
     delete axios.defaults.headers.common['Authorization'];
   };
 
+  const logout = async () => {
+    try {
+      // Revokes every token issued to the user, on every device
+      await axios.post(`${API}/logout`);
+    } catch (error) {
+      console.error('Error logging out:', error);
+    }
+    clearSession();
+  };
+
   const value = {
     user,
     token,
@@ -339,10 +412,19 @@ const QuizCreator = ({ onQuizCreated }) => {
         alert('Please provide the correct answer');
         return;
       }
+      const correctOption = filteredOptions.indexOf(currentQuestion.correct_answer);
+      if (correctOption === -1) {
+        alert('The correct answer must match one of the options');
+        return;
+      }
       
       const newQuestion = {
-        ...currentQuestion,
-        options: filteredOptions
+        question_text: currentQuestion.question_text,
+        question_type: 'multiple_choice',
+        options: filteredOptions,
+        correct_option: correctOption,
+        explanation: currentQuestion.explanation,
+        points: currentQuestion.points
       };
       
       setQuizData(prev => ({
@@ -546,7 +628,7 @@ const QuizCreator = ({ onQuizCreated }) => {
                     Options: {question.options.join(', ')}
                   </p>
                   <p className="text-sm text-green-600 mt-1">
-                    Correct Answer: {question.correct_answer}
+                    Correct Answer: {question.options[question.correct_option]}
                   </p>
                 </>
               )}
@@ -614,7 +696,7 @@ const QuizTaker = ({ quizId, onQuizComplete }) => {
       ...prev,
       [questionId]: {
         ...prev[questionId],
-        [answerType === 'selected' ? 'selected_answer' : 'text_answer']: answer
+        [answerType === 'selected' ? 'selected_option' : 'text_answer']: answer
       }
     }));
   };
@@ -622,7 +704,7 @@ const QuizTaker = ({ quizId, onQuizComplete }) => {
   const submitQuiz = async () => {
     const responseList = Object.entries(responses).map(([questionId, answerData]) => ({
       question_id: questionId,
-      selected_answer: answerData.selected_answer || null,
+      selected_option: answerData.selected_option ?? null,
       text_answer: answerData.text_answer || null
     }));
 
@@ -631,12 +713,21 @@ const QuizTaker = ({ quizId, onQuizComplete }) => {
     try {
       const response = await axios.post(`${API}/quizzes/${quizId}/attempt`, {
         responses: responseList,
-        time_taken: timeTaken
+        time_taken: timeTaken,
+        quiz_version: quiz.current_version
       });
       
       onQuizComplete(response.data);
     } catch (error) {
       console.error('Error submitting quiz:', error);
+      if (error.response?.status === 409) {
+        // The quiz was edited and this version can no longer be scored; start over on the new one
+        alert(error.response.data.detail);
+        setResponses({});
+        setCurrentQuestionIndex(0);
+        fetchQuiz();
+        return;
+      }
       alert('Error submitting quiz. Please try again.');
     }
   };
@@ -703,9 +794,9 @@ const QuizTaker = ({ quizId, onQuizComplete }) => {
                 <input
                   type="radio"
                   name={`question-${currentQuestion.id}`}
-                  value={option}
-                  checked={responses[currentQuestion.id]?.selected_answer === option}
-                  onChange={(e) => handleAnswer(currentQuestion.id, e.target.value, 'selected')}
+                  value={index}
+                  checked={responses[currentQuestion.id]?.selected_option === index}
+                  onChange={() => handleAnswer(currentQuestion.id, index, 'selected')}
                   className="mr-3 text-blue-500"
                 />
                 <span className="text-lg">{option}</span>
@@ -1169,8 +1260,13 @@ const QuizList = ({ onSelectQuiz }) => {
 };
 
 // My Results Component
-const MyResults = () => {
+const OLDER_RESULTS_PAGE = 20;
+
+const MyResults = ({ onViewResult }) => {
   const [results, setResults] = useState([]);
+  const [quizStats, setQuizStats] = useState([]);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -1179,15 +1275,50 @@ const MyResults = () => {
 
   const fetchMyResults = async () => {
     try {
-      const response = await axios.get(`${API}/results/my/all`);
-      setResults(response.data);
+      // The summary only carries scores; full results load when opened
+      const response = await axios.get(`${API}/results/my/summary`);
+      setResults(response.data.recent);
+      setQuizStats(response.data.quizzes);
+      setHasOlder(response.data.attempts > response.data.recent.length);
     } catch (error) {
-      console.error('Error fetching results:', error);
+      console.error('Error fetching results summary, falling back to the results list:', error);
+      try {
+        const response = await axios.get(`${API}/results/my/all`, { params: { limit: OLDER_RESULTS_PAGE } });
+        setResults(response.data);
+        setHasOlder(response.data.length === OLDER_RESULTS_PAGE);
+      } catch (listError) {
+        console.error('Error fetching results:', listError);
+      }
     } finally {
       setLoading(false);
     }
   };
 
+  const loadOlderResults = async () => {
+    setLoadingOlder(true);
+    try {
+      const oldest = results[results.length - 1];
+      const response = await axios.get(`${API}/results/my/all`, {
+        params: { before: oldest.completed_at, before_id: oldest.id, limit: OLDER_RESULTS_PAGE }
+      });
+      setResults([...results, ...response.data]);
+      setHasOlder(response.data.length === OLDER_RESULTS_PAGE);
+    } catch (error) {
+      console.error('Error fetching older results:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  const openResult = async (resultId) => {
+    try {
+      const response = await axios.get(`${API}/results/${resultId}`);
+      onViewResult(response.data);
+    } catch (error) {
+      console.error('Error fetching result:', error);
+    }
+  };
+
   if (loading) {
     return <div className="text-center py-8">Loading your results...</div>;
   }
@@ -1202,8 +1333,38 @@ const MyResults = () => {
         </div>
       ) : (
         <div className="grid grid-cols-1 gap-6">
+          {quizStats.length > 0 && (
+            <div className="bg-white p-6 rounded-lg shadow-md">
+              <h3 className="text-lg font-semibold mb-4">Quiz Overview</h3>
+              <table className="w-full text-left">
+                <thead>
+                  <tr className="text-gray-600 text-sm">
+                    <th className="pb-2">Quiz</th>
+                    <th className="pb-2">Attempts</th>
+                    <th className="pb-2">Best</th>
+                    <th className="pb-2">Average</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {quizStats.map((quiz) => (
+                    <tr key={quiz.quiz_id} className="border-t">
+                      <td className="py-2">{quiz.quiz_title}</td>
+                      <td className="py-2">{quiz.attempts}</td>
+                      <td className="py-2">{quiz.best_percentage}%</td>
+                      <td className="py-2">{quiz.average_percentage}%</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            </div>
+          )}
+
           {results.map((result) => (
-            <div key={result.id} className="bg-white p-6 rounded-lg shadow-md">
+            <div
+              key={result.id}
+              className="bg-white p-6 rounded-lg shadow-md cursor-pointer hover:shadow-lg"
+              onClick={() => openResult(result.id)}
+            >
               <div className="flex justify-between items-start mb-4">
                 <div>
                   <h3 className="text-lg font-semibold">{result.quiz_title}</h3>
@@ -1235,6 +1396,16 @@ const MyResults = () => {
               </div>
             </div>
           ))}
+
+          {hasOlder && (
+            <button
+              onClick={loadOlderResults}
+              disabled={loadingOlder}
+              className="bg-gray-200 text-gray-700 px-4 py-2 rounded hover:bg-gray-300 disabled:opacity-50"
+            >
+              {loadingOlder ? 'Loading...' : 'Load older attempts'}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -1373,7 +1544,7 @@ const AppContent = ({ authView, setAuthView }) => {
         )}
         
         {currentView === 'my-results' && !isAdmin && (
-          <MyResults />
+          <MyResults onViewResult={handleQuizComplete} />
         )}
         
         {currentView === 'create' && isAdmin && (
@@ -0,0 +1,100 @@
+"""
+Fixtures running the API in-process on the memory storage engine.
+
+The backend modules import each other by their flat names, so ``backend``
+goes on ``sys.path``, and the engine is picked from the environment when
+``server`` is imported, so that is set first.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+_scratch = tempfile.mkdtemp(prefix="quiz-tests-")
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["CHANGE_STREAMS"] = "off"
+os.environ["RATE_LIMIT_STORE"] = "memory"
+os.environ["CACHE_BUS_DIR"] = os.path.join(_scratch, "bus")
+os.environ["ARCHIVE_DIR"] = os.path.join(_scratch, "archive")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """The ``server`` module with empty storage, caches and rate limit buckets"""
+    import server
+    from archive import ResultArchive
+
+    for repository in (
+        server.storage.users, server.storage.quizzes, server.storage.results,
+        server.storage.analytics, server.storage.summaries, server.storage.jobs,
+    ):
+        repository.__init__()
+    server.quiz_versions._cache.clear()
+    server.token_denylist.min_versions.clear()
+    server.quiz_catalogue.drop()
+    for limiter in server.rate_limiters.values():
+        limiter.store._buckets.clear()
+    monkeypatch.setattr(server, "result_archive", ResultArchive(str(tmp_path / "archive")))
+    return server
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def login(client):
+    """Register a user and return the headers of their access token"""
+
+    def login(role: str = "user", email: str = None, password: str = "secret"):
+        email = email or f"{role}-{uuid.uuid4().hex[:8]}@example.com"
+        response = client.post(
+            "/api/register",
+            json={"email": email, "password": password, "full_name": email.split("@")[0], "role": role},
+        )
+        assert response.status_code == 200, response.text
+        tokens = client.post("/api/login", json={"email": email, "password": password}).json()
+        return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    return login
+
+
+@pytest.fixture
+def admin(login):
+    return login("admin")
+
+
+@pytest.fixture
+def create_quiz(client, admin):
+    """Create a quiz through the API and return it"""
+
+    def create_quiz(questions=None, **fields):
+        body = {
+            "title": "Arithmetic",
+            "subject": "maths",
+            "questions": questions or [
+                {"question_text": "2+2", "options": ["3", "4"], "correct_option": 1, "explanation": "sum"},
+            ],
+            **fields,
+        }
+        response = client.post("/api/quizzes", headers=admin, json=body)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return create_quiz
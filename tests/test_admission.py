@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from admission import AdmissionController, AdmissionMiddleware, Overloaded, RouteClass, classify
+
+pytestmark = pytest.mark.anyio
+
+
+def make_controller(max_in_flight=1, target_queue_delay=0.05, read_limit=8):
+    return AdmissionController(
+        [
+            RouteClass("submission", 0, 8, sheddable=False),
+            RouteClass("auth", 1, 8, sheddable=False),
+            RouteClass("write", 2, 8, sheddable=False),
+            RouteClass("read", 3, read_limit, sheddable=True),
+        ],
+        max_in_flight=max_in_flight,
+        target_queue_delay=target_queue_delay,
+    )
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("POST", "/api/quizzes/abc/attempt", "submission"),
+    ("GET", "/api/quizzes/abc/attempt", "read"),
+    ("POST", "/api/login", "auth"),
+    ("POST", "/api/token/refresh", "auth"),
+    ("GET", "/api/quizzes", "read"),
+    ("PUT", "/api/quizzes/abc", "write"),
+])
+def test_classify(method, path, expected):
+    assert classify(method, path) == expected
+
+
+async def test_freed_slots_go_to_the_highest_priority_class():
+    controller = make_controller(target_queue_delay=10)
+    await controller.acquire("read")
+
+    admitted = []
+
+    async def request(name):
+        await controller.acquire(name)
+        admitted.append(name)
+
+    tasks = [asyncio.create_task(request(name)) for name in ("read", "write", "submission")]
+    await asyncio.sleep(0)
+    assert admitted == []
+
+    holder = "read"
+    for _ in tasks:
+        controller.release(holder)
+        await asyncio.sleep(0.01)
+        holder = admitted[-1]
+    await asyncio.gather(*tasks)
+    assert admitted == ["submission", "write", "read"]
+
+
+async def test_class_caps_leave_room_for_other_classes():
+    controller = make_controller(max_in_flight=4, read_limit=1)
+    await controller.acquire("read")
+    waiting = asyncio.create_task(controller.acquire("read"))
+    await asyncio.sleep(0)
+    await asyncio.wait_for(controller.acquire("submission"), 1)
+    assert controller.stats()["classes"]["read"]["waiting"] == 1
+    controller.release("read")
+    await asyncio.wait_for(waiting, 1)
+
+
+async def test_queued_reads_are_shed_after_the_target_delay():
+    controller = make_controller()
+    await controller.acquire("write")
+    with pytest.raises(Overloaded) as shed:
+        await controller.acquire("read")
+    assert shed.value.route_class == "read"
+    assert controller.stats()["classes"]["read"]["shed"] == 1
+    assert controller.stats()["classes"]["read"]["waiting"] == 0
+
+
+async def test_new_reads_are_shed_while_the_queue_is_over_target():
+    controller = make_controller()
+    await controller.acquire("write")
+    queued_write = asyncio.create_task(controller.acquire("write"))
+    await asyncio.sleep(0.06)
+
+    with pytest.raises(Overloaded):
+        await controller.acquire("read")
+
+    # Writes keep queueing whatever the delay
+    assert not queued_write.done()
+    controller.release("write")
+    await asyncio.wait_for(queued_write, 1)
+    assert controller.in_flight == 1
+
+
+async def test_cancelled_waiters_leave_the_queue():
+    controller = make_controller()
+    await controller.acquire("write")
+    waiter = asyncio.create_task(controller.acquire("submission"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert controller.stats()["classes"]["submission"]["waiting"] == 0
+
+    controller.release("write")
+    assert controller.in_flight == 0
+
+
+def test_middleware_answers_shed_requests_with_503():
+    controller = make_controller(max_in_flight=0)
+
+    async def homepage(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/api/quizzes", homepage), Route("/health", homepage)])
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    client = TestClient(app)
+
+    response = client.get("/api/quizzes")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # Paths outside the prefix bypass admission
+    assert client.get("/health").status_code == 200
+
+
+async def test_slot_is_released_before_background_tasks_run():
+    controller = make_controller()
+    background_done = asyncio.Event()
+    release_background = asyncio.Event()
+
+    async def finish_later():
+        await release_background.wait()
+        background_done.set()
+
+    async def start_job(request):
+        return PlainTextResponse("started", background=BackgroundTask(finish_later))
+
+    app = Starlette(routes=[Route("/api/jobs", start_job, methods=["POST"])])
+    middleware = AdmissionMiddleware(app, controller)
+    sent = []
+    response_sent = asyncio.Event()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_sent.set()
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/api/jobs", "raw_path": b"/api/jobs", "root_path": "",
+        "scheme": "http", "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("test", 80),
+        "http_version": "1.1", "asgi": {"version": "3.0"},
+    }
+    request = asyncio.create_task(middleware(scope, receive, send))
+    await asyncio.wait_for(response_sent.wait(), 1)
+
+    assert not background_done.is_set()
+    assert controller.in_flight == 0
+    # The slot is free for the next write while the task still runs
+    await asyncio.wait_for(controller.acquire("write"), 1)
+    controller.release("write")
+
+    release_background.set()
+    await asyncio.wait_for(request, 1)
+    assert controller.in_flight == 0
+    assert sent[0]["status"] == 200
@@ -0,0 +1,79 @@
+from jose import jwt
+
+
+def tokens_for(client, email, password="secret"):
+    response = client.post("/api/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_login_token_authenticates_from_its_claims(server, client, login):
+    login(email="ada@example.com")
+    tokens = tokens_for(client, "ada@example.com")
+    claims = jwt.get_unverified_claims(tokens["access_token"])
+    assert claims["typ"] == "access" and claims["uid"] == tokens["user"]["id"] and claims["ver"] == 0
+
+    me = client.get("/api/me", headers=bearer(tokens["access_token"]))
+    assert me.status_code == 200
+    assert me.json()["email"] == "ada@example.com"
+
+
+def test_wrong_password_is_rejected(client, login):
+    login(email="ada@example.com")
+    response = client.post("/api/login", json={"email": "ada@example.com", "password": "nope"})
+    assert response.status_code == 401
+
+
+def test_refresh_token_is_not_an_access_token(client, login):
+    login(email="ada@example.com")
+    tokens = tokens_for(client, "ada@example.com")
+    assert client.get("/api/me", headers=bearer(tokens["refresh_token"])).status_code == 401
+    response = client.post("/api/token/refresh", json={"refresh_token": tokens["access_token"]})
+    assert response.status_code == 401
+
+
+def test_refresh_issues_a_new_pair(client, login):
+    login(email="ada@example.com")
+    tokens = tokens_for(client, "ada@example.com")
+    response = client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    refreshed = response.json()
+    assert client.get("/api/me", headers=bearer(refreshed["access_token"])).status_code == 200
+
+
+def test_logout_revokes_access_and_refresh_tokens(server, client, login):
+    login(email="ada@example.com")
+    tokens = tokens_for(client, "ada@example.com")
+    assert client.post("/api/logout", headers=bearer(tokens["access_token"])).status_code == 200
+
+    assert client.get("/api/me", headers=bearer(tokens["access_token"])).status_code == 401
+    response = client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+    # Logging in again issues tokens at the new version
+    fresh = tokens_for(client, "ada@example.com")
+    assert jwt.get_unverified_claims(fresh["access_token"])["ver"] == 1
+    assert client.get("/api/me", headers=bearer(fresh["access_token"])).status_code == 200
+
+
+def test_revocation_published_by_another_worker(server, client, login):
+    login(email="ada@example.com")
+    tokens = tokens_for(client, "ada@example.com")
+    server.invalidation_bus.dispatch("token_revocation", f"{tokens['user']['id']}:1")
+    assert client.get("/api/me", headers=bearer(tokens["access_token"])).status_code == 401
+
+
+def test_revocations_are_loaded_at_startup(server, login, client):
+    login(email="ada@example.com")
+    tokens = tokens_for(client, "ada@example.com")
+    client.post("/api/logout", headers=bearer(tokens["access_token"]))
+    server.token_denylist.min_versions.clear()
+
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as restarted:
+        assert restarted.get("/api/me", headers=bearer(tokens["access_token"])).status_code == 401
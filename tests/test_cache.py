@@ -0,0 +1,141 @@
+import asyncio
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import cache
+from cache import InvalidationBus, SerializedCache
+
+pytestmark = pytest.mark.anyio
+
+BACKEND_DIR = Path(cache.__file__).resolve().parent
+
+
+class Loader:
+    """Returns its next value once released, counting calls"""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        value = self.values[min(self.calls, len(self.values)) - 1]
+        await self.release.wait()
+        return value
+
+
+async def test_concurrent_misses_share_one_load():
+    loader = Loader([{"id": "quiz-1"}])
+    catalogue = SerializedCache("quiz_catalogue", loader, ttl=60)
+    gets = [asyncio.create_task(catalogue.get()) for _ in range(5)]
+    await asyncio.sleep(0)
+    loader.release.set()
+
+    assert await asyncio.gather(*gets) == [b'[{"id":"quiz-1"}]'] * 5
+    assert loader.calls == 1
+    assert await catalogue.get() == b'[{"id":"quiz-1"}]'
+    assert catalogue.stats == {"hits": 1, "misses": 1, "coalesced": 4, "invalidations": 0}
+
+
+async def test_cancelled_request_does_not_abort_the_shared_load():
+    loader = Loader("fresh")
+    catalogue = SerializedCache("quiz_catalogue", loader, ttl=60)
+    first = asyncio.create_task(catalogue.get())
+    second = asyncio.create_task(catalogue.get())
+    await asyncio.sleep(0)
+    first.cancel()
+    loader.release.set()
+    assert await second == b'"fresh"'
+    assert loader.calls == 1
+
+
+async def test_invalidation_during_a_load_discards_its_result():
+    loader = Loader("stale", "fresh")
+    catalogue = SerializedCache("quiz_catalogue", loader, ttl=60)
+    in_flight = asyncio.create_task(catalogue.get())
+    await asyncio.sleep(0)
+
+    catalogue.drop()
+    loader.release.set()
+    # The request that started the load still gets its answer, but it is not kept
+    assert await in_flight == b'"stale"'
+    assert await catalogue.get() == b'"fresh"'
+    assert loader.calls == 2
+
+
+async def test_body_expires_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    loader = Loader("v1", "v2")
+    loader.release.set()
+    catalogue = SerializedCache("quiz_catalogue", loader, ttl=30)
+
+    assert await catalogue.get() == b'"v1"'
+    now[0] += 29
+    assert await catalogue.get() == b'"v1"'
+    now[0] += 2
+    assert await catalogue.get() == b'"v2"'
+    assert loader.calls == 2
+
+
+async def test_bus_delivers_to_other_processes(tmp_path):
+    received = asyncio.Event()
+    keys = []
+    bus = InvalidationBus(str(tmp_path))
+    bus.subscribe("quiz_catalogue", lambda key: (keys.append(key), received.set()))
+    await bus.start()
+    # A worker that died without cleaning up leaves its socket behind
+    (tmp_path / "gone.sock").touch()
+
+    publisher = textwrap.dedent(f"""
+        import asyncio, sys
+        sys.path.insert(0, {str(BACKEND_DIR)!r})
+        from cache import InvalidationBus
+
+        async def main():
+            bus = InvalidationBus({str(tmp_path)!r})
+            bus.subscribe("quiz_catalogue", lambda key: sys.exit("published to itself"))
+            await bus.start()
+            bus.publish("quiz_catalogue", "quiz-1")
+            await bus.stop()
+
+        asyncio.run(main())
+    """)
+    try:
+        process = await asyncio.to_thread(
+            subprocess.run, [sys.executable, "-c", publisher], capture_output=True, text=True, timeout=30
+        )
+        assert process.returncode == 0, process.stderr
+        await asyncio.wait_for(received.wait(), 5)
+    finally:
+        await bus.stop()
+
+    assert keys == ["quiz-1"]
+    assert not (tmp_path / "gone.sock").exists()
+    assert list(tmp_path.glob("*.sock")) == []
+
+
+async def test_invalidate_reaches_caches_of_other_workers(tmp_path):
+    loader = Loader("v1", "v2")
+    loader.release.set()
+    worker_bus, other_bus = InvalidationBus(str(tmp_path)), InvalidationBus(str(tmp_path))
+    writer = SerializedCache("quiz_catalogue", loader, ttl=60, bus=worker_bus)
+    reader = SerializedCache("quiz_catalogue", loader, ttl=60, bus=other_bus)
+    await worker_bus.start()
+    await other_bus.start()
+    try:
+        assert await reader.get() == b'"v1"'
+        writer.invalidate()
+        for _ in range(100):
+            if reader.stats["invalidations"]:
+                break
+            await asyncio.sleep(0.01)
+        assert await reader.get() == b'"v2"'
+    finally:
+        await worker_bus.stop()
+        await other_bus.stop()
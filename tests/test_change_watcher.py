@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from change_watcher import RESET, ChangeEvent, ChangeStreamWatcher
+
+pytestmark = pytest.mark.anyio
+
+
+def change(collection, operation, token, **document):
+    return {"_id": token, "operationType": operation, "ns": {"coll": collection}, "fullDocument": document}
+
+
+class FakeStream:
+    def __init__(self, items):
+        self.items = items
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.items:
+            # An idle stream: wait to be cancelled
+            await asyncio.Event().wait()
+        item = self.items.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        self.resume_token = item["_id"]
+        return item
+
+
+class FakeDatabase:
+    """Hands out one scripted stream per ``watch`` call, recording where each resumed"""
+
+    def __init__(self, *sessions):
+        self.sessions = list(sessions)
+        self.resumed_after = []
+
+    def watch(self, pipeline, full_document, resume_after):
+        self.resumed_after.append(resume_after)
+        if not self.sessions:
+            return FakeStream([])
+        session = self.sessions.pop(0)
+        if isinstance(session, Exception):
+            raise session
+        return FakeStream(list(session))
+
+
+async def run_watcher(db, until, collections=("quizzes", "users")):
+    events = []
+    watcher = ChangeStreamWatcher(db, retry_delay=0)
+    for collection in collections:
+        watcher.subscribe(collection, events.append)
+    await watcher.start()
+    try:
+        for _ in range(200):
+            if until(watcher, events):
+                break
+            await asyncio.sleep(0.005)
+        else:
+            raise AssertionError(f"watcher never got there: {events}")
+    finally:
+        await watcher.stop()
+    return watcher, events
+
+
+async def test_changes_reach_subscribers_of_their_collection():
+    db = FakeDatabase([
+        change("quizzes", "update", {"t": 1}, id="quiz-1", is_active=False),
+        change("users", "update", {"t": 2}, id="user-1", token_version=3),
+        change("quizzes", "delete", {"t": 3}),
+    ])
+    watcher, events = await run_watcher(db, lambda watcher, events: len(events) == 3)
+    assert events == [
+        ChangeEvent("quizzes", "update", {"id": "quiz-1", "is_active": False}),
+        ChangeEvent("users", "update", {"id": "user-1", "token_version": 3}),
+        ChangeEvent("quizzes", "delete", {}),
+    ]
+    assert events[1].document_id == "user-1"
+    assert watcher.stats()["events"] == 3 and watcher.resume_token == {"t": 3}
+
+
+async def test_interrupted_stream_resumes_after_the_last_event():
+    db = FakeDatabase(
+        [change("quizzes", "insert", {"t": 1}, id="quiz-1"), AutoReconnect("primary stepped down")],
+        [change("quizzes", "insert", {"t": 2}, id="quiz-2")],
+    )
+    _, events = await run_watcher(db, lambda watcher, events: len(events) == 2)
+    assert db.resumed_after == [None, {"t": 1}]
+    assert RESET not in [event.operation for event in events]
+
+
+async def test_lost_history_resets_every_subscriber():
+    db = FakeDatabase(
+        [change("users", "update", {"t": 1}, id="user-1"), OperationFailure("oplog rolled over", code=286)],
+        [],
+    )
+    _, events = await run_watcher(db, lambda watcher, events: len(db.resumed_after) == 2)
+    assert [(event.collection, event.operation) for event in events[1:]] == [("quizzes", RESET), ("users", RESET)]
+    # The expired token is not retried
+    assert db.resumed_after == [None, None]
+
+
+async def test_invalidate_resets_and_starts_a_fresh_stream():
+    db = FakeDatabase(
+        [change("quizzes", "insert", {"t": 1}, id="quiz-1"), change("quizzes", "invalidate", {"t": 2})],
+        [],
+    )
+    watcher, events = await run_watcher(db, lambda watcher, events: len(events) == 3)
+    assert [event.operation for event in events] == ["insert", RESET, RESET]
+    assert watcher.resume_token is None
+
+
+async def test_standalone_server_falls_back_to_ttls():
+    db = FakeDatabase(OperationFailure("The $changeStream stage is only supported on replica sets", code=40573))
+    watcher, events = await run_watcher(db, lambda watcher, events: not watcher.supported)
+    assert events == [] and not watcher.active
+    assert db.resumed_after == [None]
+
+
+async def test_failing_handler_does_not_stop_the_others():
+    db = FakeDatabase([change("quizzes", "update", {"t": 1}, id="quiz-1")])
+    events = []
+    watcher = ChangeStreamWatcher(db, retry_delay=0)
+    watcher.subscribe("quizzes", lambda event: 1 / 0)
+    watcher.subscribe("quizzes", events.append)
+    await watcher.start()
+    for _ in range(200):
+        if events:
+            break
+        await asyncio.sleep(0.005)
+    await watcher.stop()
+    assert events[0].document_id == "quiz-1"
+
+
+async def test_token_version_changes_revoke_tokens(server):
+    server._revoke_from_change(ChangeEvent("users", "update", {"id": "user-1", "token_version": 2}))
+    assert server.token_denylist.is_revoked("user-1", 1)
+    assert not server.token_denylist.is_revoked("user-1", 2)
+    # Unrelated updates change nothing
+    server._revoke_from_change(ChangeEvent("users", "update", {"id": "user-2"}))
+    assert "user-2" not in server.token_denylist.min_versions
+
+
+async def test_reset_reloads_revocations_missed_while_down(server):
+    await server.storage.users.create({"id": "user-1", "email": "ada@example.com", "full_name": "Ada"})
+    # Revoked by another worker while this one's stream was down
+    await server.storage.users.bump_token_version("ada@example.com")
+    assert not server.token_denylist.is_revoked("user-1", 0)
+
+    server._revoke_from_change(ChangeEvent("users", RESET, {}))
+    await asyncio.gather(*server._denylist_reloads)
+    assert server.token_denylist.is_revoked("user-1", 0)
+    assert not server._denylist_reloads
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobRunner
+from storage import MemoryJobRepository
+
+KEYS = [f"{n:04d}" for n in range(100)]
+
+
+class Items:
+    """A job kind over ``KEYS`` recording the chunks it ran"""
+
+    def __init__(self, gate: asyncio.Event = None):
+        self.chunks = []
+        self.gate = gate
+
+    async def fetch(self, params, after, limit):
+        return [key for key in KEYS if after is None or key > after][:limit]
+
+    async def run_chunk(self, params, keys):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.chunks.append(keys)
+        return len(keys)
+
+
+async def wait_for_status(repository, job_id, *statuses):
+    for _ in range(500):
+        job = await repository.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is still {job['status']}")
+
+
+def make_runner(items, **options):
+    runner = JobRunner(MemoryJobRepository(), chunk_size=10, chunk_concurrency=3, **options)
+    runner.register("items", items.fetch, items.run_chunk)
+    return runner
+
+
+@pytest.mark.anyio
+async def test_job_runs_every_chunk_in_order():
+    items = Items()
+    runner = make_runner(items)
+    job = await runner.submit("items", {}, "admin@example.com")
+    done = await wait_for_status(runner.repository, job["id"], "completed")
+
+    assert [key for chunk in items.chunks for key in chunk] == KEYS
+    assert (done["cursor"], done["completed_chunks"], done["processed_items"]) == ("0099", 10, 100)
+    assert done["owner"] is None and done["finished_at"] is not None
+
+
+@pytest.mark.anyio
+async def test_job_resumes_after_its_cursor():
+    items = Items()
+    runner = make_runner(items)
+    now = datetime.utcnow()
+    # Left behind by a worker that died after four chunks
+    await runner.repository.create({
+        "id": "job-1", "kind": "items", "params": {}, "status": "running", "cursor": "0039",
+        "completed_chunks": 4, "processed_items": 40, "cancel_requested": False, "error": None,
+        "owner": "gone", "lease_expires_at": now - timedelta(seconds=1), "created_by": "admin@example.com",
+        "created_at": now - timedelta(minutes=5), "started_at": now - timedelta(minutes=5), "finished_at": None,
+    })
+
+    await runner.start()
+    try:
+        done = await wait_for_status(runner.repository, "job-1", "completed")
+    finally:
+        await runner.stop()
+    assert items.chunks[0][0] == "0040"
+    assert [key for chunk in items.chunks for key in chunk] == KEYS[40:]
+    assert (done["completed_chunks"], done["processed_items"]) == (10, 100)
+
+
+@pytest.mark.anyio
+async def test_cursor_waits_for_earlier_chunks():
+    gate = asyncio.Event()
+    items = Items(gate)
+    runner = make_runner(items)
+    job = await runner.submit("items", {}, "admin@example.com")
+    await asyncio.sleep(0.05)
+
+    # Chunks are in flight but none finished, so a resumed job would start over
+    stalled = await runner.repository.get(job["id"])
+    assert stalled["status"] == "running" and stalled["cursor"] is None
+    gate.set()
+    await wait_for_status(runner.repository, job["id"], "completed")
+
+
+@pytest.mark.anyio
+async def test_cancel_stops_a_running_job_before_its_next_chunk():
+    gate = asyncio.Event()
+    items = Items(gate)
+    runner = make_runner(items)
+    job = await runner.submit("items", {}, "admin@example.com")
+    await asyncio.sleep(0.05)
+
+    assert await runner.cancel(job["id"])
+    gate.set()
+    done = await wait_for_status(runner.repository, job["id"], "cancelled")
+    # Only the chunks already in flight ran
+    assert len(items.chunks) == 3
+    assert done["processed_items"] == 30
+    assert not runner._cancelled
+    assert not await runner.cancel(job["id"])
+
+
+@pytest.mark.anyio
+async def test_cancelling_a_job_claimed_elsewhere_flags_it():
+    items = Items()
+    runner = make_runner(items, max_running=0)
+    job = await runner.submit("items", {}, "admin@example.com")
+    assert (await runner.repository.get(job["id"]))["status"] == "queued"
+
+    assert await runner.cancel(job["id"])
+    assert job["id"] not in runner._cancelled
+
+    # Whichever worker claims it finishes it without running a chunk
+    runner.max_running = 1
+    await runner._try_start(job["id"])
+    await wait_for_status(runner.repository, job["id"], "cancelled")
+    assert items.chunks == []
+
+
+@pytest.mark.anyio
+async def test_failed_chunk_fails_the_job():
+    items = Items()
+
+    async def run_chunk(params, keys):
+        raise RuntimeError("boom")
+
+    runner = make_runner(items)
+    runner.register("items", items.fetch, run_chunk)
+    job = await runner.submit("items", {}, "admin@example.com")
+    failed = await wait_for_status(runner.repository, job["id"], "failed")
+    assert failed["error"] == "boom"
+
+
+def test_publish_all_publishes_evaluated_results(server, client, admin, login, create_quiz):
+    quiz = create_quiz(questions=[{"question_text": "Why?", "question_type": "text", "points": 2}])
+    question_id = quiz["questions"][0]["id"]
+    result_ids = []
+    for _ in range(3):
+        result = client.post(
+            f"/api/quizzes/{quiz['id']}/attempt",
+            headers=login(),
+            json={"responses": [{"question_id": question_id, "text_answer": "because"}]},
+        ).json()
+        result_ids.append(result["id"])
+    # The last attempt is not evaluated yet, so it stays unpublished
+    for result_id in result_ids[:2]:
+        client.post(
+            f"/api/admin/evaluate/{result_id}",
+            headers=admin,
+            json={"result_id": result_id, "evaluations": [{"question_id": question_id, "points_awarded": 1}]},
+        )
+
+    response = client.post(f"/api/admin/publish-all/{quiz['id']}", headers=admin)
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    for _ in range(200):
+        job = client.get(f"/api/admin/jobs/{job_id}", headers=admin).json()
+        if job["status"] == "completed":
+            break
+        time.sleep(0.01)
+    assert job["status"] == "completed"
+    assert job["processed_items"] == 2
+
+    published = [server.storage.results._by_id[result_id]["is_published"] for result_id in result_ids]
+    assert published == [True, True, False]
+    assert client.post(f"/api/admin/jobs/{job_id}/cancel", headers=admin).status_code == 404
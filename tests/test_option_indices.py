@@ -0,0 +1,91 @@
+from option_indices import correct_option, migrate_question, migrate_result, option_lookup, selected_option
+
+LEGACY_QUESTION = {
+    "id": "q1",
+    "question_type": "multiple_choice",
+    "question_text": "2+2",
+    "options": ["3", "4", "4"],
+    "correct_answer": "4",
+}
+
+
+def test_option_lookup_keeps_the_first_of_repeated_options():
+    assert option_lookup(LEGACY_QUESTION) == {"3": 0, "4": 1}
+    assert option_lookup({"options": None}) == {}
+
+
+def test_correct_option_reads_both_forms():
+    assert correct_option(LEGACY_QUESTION) == 1
+    assert correct_option({"options": ["a", "b"], "correct_option": 0, "correct_answer": "b"}) == 0
+    assert correct_option({"options": ["a"], "correct_answer": "z"}) is None
+    assert correct_option({"options": ["a"]}) is None
+
+
+def test_selected_option_prefers_the_index():
+    lookup = {"3": 0, "4": 1}
+    assert selected_option(2, lookup, 1, "3") == 1
+    assert selected_option(2, lookup, None, "3") == 0
+    assert selected_option(2, lookup, 5, None) is None
+    assert selected_option(2, lookup, -1, None) is None
+    assert selected_option(2, lookup, None, "5") is None
+    assert selected_option(2, lookup, None, None) is None
+
+
+def test_migrate_question():
+    migrated = migrate_question(LEGACY_QUESTION)
+    assert migrated["correct_option"] == 1 and "correct_answer" not in migrated
+    assert "correct_answer" in LEGACY_QUESTION
+
+    text = {"id": "q2", "question_type": "text", "correct_answer": "anything"}
+    assert migrate_question(text) == text
+
+
+def test_migrate_question_keeps_keys_outside_the_options():
+    broken = {**LEGACY_QUESTION, "correct_answer": "5"}
+    assert migrate_question(broken) == broken
+
+
+def legacy_result(**fields):
+    return {
+        "responses": [
+            {"question_id": "q1", "selected_answer": "4"},
+            {"question_id": "q1", "selected_answer": "7"},
+            {"question_id": "q2", "text_answer": "because", "selected_answer": None},
+        ],
+        "detailed_results": [
+            {
+                "question_id": "q1", "question_type": "multiple_choice", "question_text": "2+2",
+                "selected_answer": "3", "correct_answer": "4",
+            },
+            {"question_id": "q2", "question_type": "text", "text_answer": "because"},
+        ],
+        **fields,
+    }
+
+
+def test_migrate_result_without_version_keeps_option_text():
+    changes = migrate_result(legacy_result(), {"q1": option_lookup(LEGACY_QUESTION)})
+    assert changes["responses"] == [
+        {"question_id": "q1", "selected_option": 1},
+        # Text matching no option is kept rather than lost
+        {"question_id": "q1", "selected_answer": "7"},
+        {"question_id": "q2", "text_answer": "because"},
+    ]
+    mcq, text = changes["detailed_results"]
+    assert (mcq["selected_option"], mcq["correct_option"]) == (0, 1)
+    assert (mcq["selected_answer"], mcq["correct_answer"]) == ("3", "4")
+    assert text == {"question_id": "q2", "question_type": "text", "text_answer": "because"}
+
+
+def test_migrate_result_with_version_drops_option_text():
+    changes = migrate_result(legacy_result(quiz_version="v1"), {"q1": option_lookup(LEGACY_QUESTION)})
+    mcq = changes["detailed_results"][0]
+    assert (mcq["selected_option"], mcq["correct_option"]) == (0, 1)
+    assert "selected_answer" not in mcq and "correct_answer" not in mcq
+    assert mcq["question_text"] == "2+2"
+
+
+def test_migrate_result_is_idempotent():
+    lookups = {"q1": option_lookup(LEGACY_QUESTION)}
+    once = migrate_result(legacy_result(quiz_version="v1"), lookups)
+    assert migrate_result({**once, "quiz_version": "v1"}, lookups) == once
@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+import pytest
+
+from quiz_versions import QuizVersionStore, version_id_for
+from storage import MemoryQuizRepository
+
+QUESTION = {"question_text": "2+2", "options": ["3", "4"], "correct_option": 1, "explanation": "sum"}
+
+
+def post_attempt(client, headers, quiz_id, question_id, option, version=None):
+    body = {"responses": [{"question_id": question_id, "selected_option": option}]}
+    if version is not None:
+        body["quiz_version"] = version
+    return client.post(f"/api/quizzes/{quiz_id}/attempt", headers=headers, json=body)
+
+
+def attempt(client, headers, quiz_id, question_id, option, version=None):
+    response = post_attempt(client, headers, quiz_id, question_id, option, version)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def edit(client, admin, quiz, **question):
+    response = client.put(
+        f"/api/quizzes/{quiz['id']}",
+        headers=admin,
+        json={
+            "title": "Arithmetic v2", "subject": "maths", "time_limit": quiz.get("time_limit"),
+            "questions": [{"id": quiz["questions"][0]["id"], **question}],
+        },
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_version_id_depends_on_scoring_content_only():
+    quiz = {"id": "quiz-1", "title": "T", "questions": [{"id": "q"}], "total_points": 1, "requires_evaluation": False}
+    assert version_id_for(quiz) == version_id_for({**quiz, "subject": "other", "time_limit": 5})
+    assert version_id_for(quiz) != version_id_for({**quiz, "title": "T2"})
+    assert version_id_for(quiz) != version_id_for({**quiz, "id": "quiz-2"})
+
+
+def test_results_are_stored_without_versioned_text(server, client, admin, login, create_quiz):
+    quiz = create_quiz()
+    student = login()
+    result = attempt(client, student, quiz["id"], quiz["questions"][0]["id"], 0)
+    detail = result["detailed_results"][0]
+    assert (detail["question_text"], detail["selected_answer"], detail["correct_answer"]) == ("2+2", "3", "4")
+
+    stored = server.storage.results._by_id[result["id"]]["detailed_results"][0]
+    assert not {"question_text", "explanation", "selected_answer", "correct_answer"} & set(stored)
+
+    fetched = client.get(f"/api/results/{result['id']}", headers=student).json()["detailed_results"][0]
+    assert fetched["explanation"] == "sum"
+    assert (fetched["selected_answer"], fetched["correct_answer"]) == ("3", "4")
+
+
+def test_results_render_against_the_version_they_were_scored_on(client, admin, login, create_quiz):
+    quiz = create_quiz(time_limit=10)
+    student = login()
+    question_id = quiz["questions"][0]["id"]
+    before = attempt(client, student, quiz["id"], question_id, 1)
+
+    edited = edit(client, admin, quiz, question_text="2+3", options=["4", "5"], correct_option=1)
+    assert edited["current_version"] != quiz["current_version"]
+    assert edited["questions"][0]["id"] == question_id
+
+    fetched = client.get(f"/api/results/{before['id']}", headers=student).json()
+    assert fetched["quiz_version"] == quiz["current_version"]
+    detail = fetched["detailed_results"][0]
+    assert (detail["question_text"], detail["correct_answer"]) == ("2+2", "4")
+
+    after = attempt(client, student, quiz["id"], question_id, 0)
+    assert after["quiz_version"] == edited["current_version"]
+    assert after["detailed_results"][0]["question_text"] == "2+3"
+
+
+def test_superseded_version_is_accepted_within_the_time_limit(server, client, admin, login, create_quiz):
+    quiz = create_quiz(time_limit=10)
+    student = login()
+    question_id = quiz["questions"][0]["id"]
+    old_version = quiz["current_version"]
+    # Reordered options: index 1 was "4" when the student answered, it is "3" now
+    edit(client, admin, quiz, question_text="2+2", options=["4", "3"], correct_option=0)
+
+    # Started before the edit: scored on what the student saw
+    late = attempt(client, student, quiz["id"], question_id, 1, version=old_version)
+    assert late["quiz_version"] == old_version and late["total_score"] == 1
+    assert late["detailed_results"][0]["selected_answer"] == "4"
+
+    superseded = server.storage.quizzes._by_id[quiz["id"]]["superseded_versions"]
+    superseded[0]["superseded_at"] -= timedelta(minutes=11)
+    too_late = post_attempt(client, student, quiz["id"], question_id, 1, version=old_version)
+    assert too_late.status_code == 409
+    assert len(server.storage.results._by_id) == 1
+
+
+def test_untimed_quiz_refuses_superseded_versions(server, client, admin, login, create_quiz):
+    quiz = create_quiz()
+    student = login()
+    question_id = quiz["questions"][0]["id"]
+    edit(client, admin, quiz, question_text="2+2", options=["4", "3"], correct_option=0)
+
+    # Never rescored against the new option list, where index 1 is now wrong
+    response = post_attempt(client, student, quiz["id"], question_id, 1, version=quiz["current_version"])
+    assert response.status_code == 409
+    assert server.storage.results._by_id == {}
+
+
+def test_unknown_version_is_refused(client, login, create_quiz):
+    quiz = create_quiz()
+    response = post_attempt(client, login(), quiz["id"], quiz["questions"][0]["id"], 1, version="no-such-version")
+    assert response.status_code == 409
+
+
+def test_submissions_without_a_version_use_the_current_one(client, admin, login, create_quiz):
+    quiz = create_quiz()
+    edited = edit(client, admin, quiz, question_text="2+2", options=["4", "3"], correct_option=0)
+    result = attempt(client, login(), quiz["id"], quiz["questions"][0]["id"], 0)
+    assert result["quiz_version"] == edited["current_version"] and result["total_score"] == 1
+
+
+@pytest.mark.anyio
+async def test_versions_are_cached_once_loaded():
+    repository = MemoryQuizRepository()
+    quiz = {
+        "id": "quiz-1", "title": "T", "questions": [{"id": "q", "question_type": "multiple_choice", **QUESTION}],
+        "total_points": 1, "requires_evaluation": False,
+    }
+    version = await QuizVersionStore(repository).save(quiz)
+
+    fresh = QuizVersionStore(repository)
+    assert await fresh.preload([version.version_id, None]) == 1
+    assert await fresh.preload([version.version_id]) == 0
+    assert (await fresh.get(version.version_id)).correct_options == {"q": 1}
+    assert await fresh.get("missing") is None
+
+
+@pytest.mark.anyio
+async def test_rehydrate_leaves_unversioned_results_alone():
+    store = QuizVersionStore(MemoryQuizRepository())
+    legacy = {"detailed_results": [{"question_id": "q", "question_text": "kept", "question_type": "multiple_choice"}]}
+    assert await store.rehydrate([legacy]) == [legacy]
+    assert legacy["detailed_results"][0] == {"question_id": "q", "question_text": "kept", "question_type": "multiple_choice"}
@@ -0,0 +1,118 @@
+import pytest
+
+import ratelimit
+from ratelimit import MemoryBucketStore, RateLimitExceeded, TokenBucketLimiter, create_limiters
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+@pytest.mark.anyio
+async def test_bucket_refills_at_capacity_per_period(clock):
+    limiter = TokenBucketLimiter("login", 3, 60, MemoryBucketStore())
+    for _ in range(3):
+        await limiter.hit("ada")
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        await limiter.hit("ada")
+    assert exceeded.value.retry_after == pytest.approx(20)
+
+    # Other keys have buckets of their own
+    await limiter.hit("grace")
+
+    clock.now += 20
+    await limiter.hit("ada")
+    with pytest.raises(RateLimitExceeded):
+        await limiter.hit("ada")
+
+
+@pytest.mark.anyio
+async def test_refill_is_capped_at_capacity(clock):
+    limiter = TokenBucketLimiter("login", 2, 60, MemoryBucketStore())
+    await limiter.hit("ada")
+    clock.now += 3600
+    await limiter.hit("ada")
+    await limiter.hit("ada")
+    with pytest.raises(RateLimitExceeded):
+        await limiter.hit("ada")
+
+
+@pytest.mark.anyio
+async def test_full_buckets_are_evicted_first(clock):
+    store = MemoryBucketStore(max_keys=2)
+    await store.take("old", 2, 1.0)
+    clock.now += 10
+    await store.take("recent", 2, 1.0)
+    await store.take("new", 2, 1.0)
+    assert set(store._buckets) == {"recent", "new"}
+
+
+@pytest.mark.anyio
+async def test_buckets_refill_by_their_own_route(clock):
+    store = MemoryBucketStore(max_keys=10)
+    slow = TokenBucketLimiter("register", 1, 3600, store)
+    fast = TokenBucketLimiter("quiz_list", 100, 1, store)
+    await slow.hit("ada")
+    # A spray of short-lived buckets from a fast route must not free the slow one
+    for n in range(50):
+        clock.now += 1
+        await fast.hit(f"ip-{n}")
+    assert len(store._buckets) <= 10
+    with pytest.raises(RateLimitExceeded):
+        await slow.hit("ada")
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_buckets_are_evicted_when_none_are_full(clock):
+    store = MemoryBucketStore(max_keys=3)
+    limiter = TokenBucketLimiter("register", 1, 3600, store)
+    for key in ("ada", "grace", "alan"):
+        await limiter.hit(key)
+    with pytest.raises(RateLimitExceeded):
+        await limiter.hit("ada")
+    await limiter.hit("edsger")
+    assert list(store._buckets) == [f"register:{key}" for key in ("alan", "ada", "edsger")]
+    with pytest.raises(RateLimitExceeded):
+        await limiter.hit("ada")
+
+
+def test_limits_are_overridable_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_LOGIN", "2/10")
+    limiters = create_limiters({"login": "10/60", "register": "5/60"})
+    assert (limiters["login"].capacity, limiters["login"].rate) == (2, 0.2)
+    assert limiters["register"].capacity == 5
+    # Every route shares one store
+    assert limiters["login"].store is limiters["register"].store
+
+
+def login_status(client, email):
+    return client.post("/api/login", json={"email": email, "password": "wrong"}).status_code
+
+
+def test_login_is_limited_per_ip_and_email(server, client, monkeypatch):
+    store = server.rate_limiters["login"].store
+    monkeypatch.setitem(server.rate_limiters, "login", TokenBucketLimiter("login", 3, 60, store))
+    assert [login_status(client, "ada@example.com") for _ in range(4)] == [401, 401, 401, 429]
+    # Another account from the same address is not locked out
+    assert login_status(client, "grace@example.com") == 401
+
+    response = client.post("/api/login", json={"email": "ada@example.com", "password": "wrong"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_login_is_capped_per_ip(server, client, monkeypatch):
+    store = server.rate_limiters["login_ip"].store
+    monkeypatch.setitem(server.rate_limiters, "login_ip", TokenBucketLimiter("login_ip", 2, 60, store))
+    assert [login_status(client, f"user{n}@example.com") for n in range(3)] == [401, 401, 429]
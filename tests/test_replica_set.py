@@ -0,0 +1,105 @@
+"""
+Degradation against a live MongoDB replica set.
+
+Skipped unless ``TEST_MONGO_REPLICA_SET_URL`` points at a replica set, for
+instance one started with ``mongod --replSet rs0`` and ``rs.initiate()``::
+
+    TEST_MONGO_REPLICA_SET_URL="mongodb://localhost:27017/?replicaSet=rs0" python -m pytest tests/test_replica_set.py
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from pymongo.read_preferences import Secondary
+
+from storage import MongoQuizRepository, MongoStorage, StorageUnavailableError
+
+REPLICA_SET_URL = os.environ.get("TEST_MONGO_REPLICA_SET_URL")
+
+
+def _replica_set_name():
+    if not REPLICA_SET_URL:
+        return None
+    try:
+        with MongoClient(REPLICA_SET_URL, serverSelectionTimeoutMS=2000) as client:
+            return client.admin.command("hello").get("setName")
+    except PyMongoError:
+        return None
+
+
+pytestmark = pytest.mark.skipif(_replica_set_name() is None, reason="no MongoDB replica set available")
+
+# A read preference no member can satisfy, standing in for every secondary being down
+NO_MEMBER = Secondary(tag_sets=[{"dc": "nowhere"}])
+
+
+@pytest.fixture
+def mongo_storage(monkeypatch):
+    monkeypatch.setenv("MONGO_LISTING_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "500")
+    monkeypatch.setenv("MONGO_QUERY_TIMEOUT_MS", "2000")
+    db_name = f"quiz_test_{uuid.uuid4().hex[:8]}"
+    storage = MongoStorage(REPLICA_SET_URL, db_name)
+    yield storage
+    with MongoClient(REPLICA_SET_URL) as client:
+        client.drop_database(db_name)
+    storage.client.close()
+
+
+def unreachable_quizzes(storage):
+    db = storage.client.get_database(storage.db.name, read_preference=NO_MEMBER)
+    return MongoQuizRepository(db.quizzes, db.quizzes, db.quiz_versions, storage.max_time_ms)
+
+
+def quiz(quiz_id):
+    return {"id": quiz_id, "title": "Arithmetic", "is_active": True, "questions": []}
+
+
+@pytest.mark.anyio
+async def test_listings_are_served_by_secondaries(mongo_storage):
+    await mongo_storage.connect()
+    await mongo_storage.quizzes.create(quiz("quiz-1"))
+
+    # The primary sees its own write at once; secondaries catch up shortly after
+    assert [doc["id"] for doc in await mongo_storage.quizzes.list_active(("id",), primary=True)] == ["quiz-1"]
+    deadline = time.monotonic() + 10
+    while not await mongo_storage.quizzes.list_active(("id",)):
+        assert time.monotonic() < deadline, "secondaries never caught up"
+        await asyncio.sleep(0.1)
+
+    stats = mongo_storage.stats()
+    assert stats["listing_read_preference"] == "secondaryPreferred"
+    assert stats["pools"], "no connection pool was opened"
+
+
+@pytest.mark.anyio
+async def test_reads_without_an_eligible_member_fail_fast(mongo_storage):
+    await mongo_storage.connect()
+    quizzes = unreachable_quizzes(mongo_storage)
+
+    started = time.monotonic()
+    with pytest.raises(StorageUnavailableError):
+        await quizzes.list_active(("id",))
+    # Bounded by the server selection timeout rather than hanging
+    assert time.monotonic() - started < 5
+
+    # Reads from the primary are unaffected
+    assert await mongo_storage.quizzes.list_active(("id",), primary=True) == []
+
+
+def test_api_answers_503_while_the_database_is_unreachable(server, client, login, mongo_storage, monkeypatch):
+    headers = login()
+    monkeypatch.setattr(server.storage, "quizzes", unreachable_quizzes(mongo_storage))
+    server.quiz_catalogue.drop()
+
+    started = time.monotonic()
+    for path in ("/api/quizzes", "/api/quizzes/quiz-1"):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 503, response.text
+        assert response.headers["Retry-After"] == "1"
+    assert time.monotonic() - started < 10
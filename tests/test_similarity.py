@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from similarity import SimilarityDetector
+
+N_QUESTIONS = 20
+
+QUIZ = {
+    "title": "Collusion",
+    "questions": [
+        {"id": f"q{k}", "question_type": "multiple_choice", "options": ["a", "b", "c", "d"], "correct_option": 0}
+        for k in range(N_QUESTIONS)
+    ] + [{"id": "essay", "question_type": "text"}],
+}
+
+ESSAY = (
+    "The French revolution began in 1789 when a financial crisis and widespread hunger pushed the "
+    "third estate to declare itself a national assembly and demand a constitution for the kingdom"
+)
+OTHER_ESSAYS = [
+    "Photosynthesis turns light water and carbon dioxide into glucose and oxygen inside the chloroplasts of green plants",
+    "A binary search halves the sorted range on every comparison so it finds an item in logarithmic time",
+    "Plate tectonics explains earthquakes mountain ranges and volcanoes as the slow movement of rigid lithosphere plates",
+]
+
+
+def result(user, answers, essay=None):
+    responses = [{"question_id": f"q{k}", "selected_option": int(option)} for k, option in enumerate(answers)]
+    if essay:
+        responses.append({"question_id": "essay", "text_answer": essay})
+    return {"id": f"r-{user}", "user_id": user, "user_name": user, "user_email": f"{user}@example.com", "responses": responses}
+
+
+def planted_results():
+    rng = np.random.default_rng(7)
+    results = [result(f"random-{k}", rng.integers(0, 4, N_QUESTIONS), OTHER_ESSAYS[k % 3] if k < 3 else None)
+               for k in range(30)]
+    # A weak student and a near copy of their attempt, one answer and the last word changed
+    source = np.array([0] * 8 + [1, 2, 3] * 4)
+    copy = source.copy()
+    copy[-1] = 0
+    results.append(result("source", source, ESSAY))
+    results.append(result("copier", copy, ESSAY.rsplit(" ", 1)[0] + " realm"))
+    # Two perfect scores agree everywhere but share no wrong answers
+    results.append(result("strong-1", [0] * N_QUESTIONS))
+    results.append(result("strong-2", [0] * N_QUESTIONS))
+    return results
+
+
+def flagged_users(pairs):
+    return {frozenset(attempt["user_id"] for attempt in pair["attempts"]) for pair in pairs}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_near_copies_are_flagged_and_dissimilar_attempts_are_not(workers):
+    detector = SimilarityDetector(QUIZ)
+    results = planted_results()
+    # Chunks as they arrive from storage
+    detector.add_results(results[:17])
+    detector.add_results(results[17:])
+    report = detector.run(workers)
+
+    assert report["attempts"] == len(results)
+    assert flagged_users(report["mcq_pairs"]) == {frozenset({"source", "copier"})}
+    (pair,) = report["mcq_pairs"]
+    assert pair["agreement"] == pytest.approx(19 / 20)
+    assert pair["shared_wrong_answers"] == 11
+    assert report["mcq_pairs_found"] == 1
+
+    assert flagged_users(report["text_pairs"]) == {frozenset({"source", "copier"})}
+    assert report["text_pairs"][0]["question_id"] == "essay"
+    assert report["text_pairs_found"] == 1
+
+
+def test_attempts_by_the_same_user_are_not_paired():
+    detector = SimilarityDetector(QUIZ)
+    answers = [1] * N_QUESTIONS
+    detector.add_results([
+        {**result("retaker", answers, ESSAY), "id": "first"},
+        {**result("retaker", answers, ESSAY), "id": "second"},
+    ])
+    report = detector.run(0)
+    assert report["mcq_pairs_found"] == 0
+    assert report["text_pairs_found"] == 0
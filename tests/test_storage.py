@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage import MemoryStorage, create_storage
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+
+def result(result_id, user_id="ada", quiz_id="q1", minutes=0, percentage=50.0, **fields):
+    return {
+        "id": result_id, "quiz_id": quiz_id, "quiz_title": "Arithmetic", "user_id": user_id,
+        "user_email": f"{user_id}@example.com", "user_name": user_id, "total_score": 1,
+        "max_possible_score": 2, "percentage": percentage, "time_taken": None,
+        "completed_at": NOW + timedelta(minutes=minutes), "is_evaluated": True, "is_published": False,
+        "detailed_results": [], **fields,
+    }
+
+
+def test_engine_is_picked_from_the_environment(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    assert isinstance(create_storage(), MemoryStorage)
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    with pytest.raises(ValueError):
+        create_storage()
+
+
+async def test_documents_are_copied_in_and_out():
+    storage = MemoryStorage()
+    doc = result("r1")
+    await storage.results.create(doc)
+    doc["percentage"] = 0.0
+    fetched = await storage.results.get("r1")
+    assert fetched["percentage"] == 50.0
+    fetched["percentage"] = 0.0
+    assert (await storage.results.get("r1"))["percentage"] == 50.0
+
+
+async def test_duplicate_keys_are_rejected():
+    storage = MemoryStorage()
+    await storage.users.create({"id": "u1", "email": "ada@example.com"})
+    with pytest.raises(ValueError):
+        await storage.users.create({"id": "u2", "email": "ada@example.com"})
+    await storage.results.create(result("r1"))
+    with pytest.raises(ValueError):
+        await storage.results.create(result("r1"))
+
+
+async def test_publish_happens_once():
+    storage = MemoryStorage()
+    await storage.results.create(result("r1"))
+    published = await storage.results.publish("r1")
+    assert published["id"] == "r1" and published["user_id"] == "ada"
+    assert await storage.results.publish("r1") is None
+    assert await storage.results.publish("missing") is None
+
+
+async def test_pending_index_follows_updates():
+    storage = MemoryStorage()
+    await storage.results.create(result("r1", is_evaluated=False))
+    await storage.results.create(result("r2", is_evaluated=False, minutes=-5))
+    assert [doc["id"] for doc in await storage.results.list_pending()] == ["r2", "r1"]
+    await storage.results.update("r2", {"is_evaluated": True})
+    assert [doc["id"] for doc in await storage.results.list_pending()] == ["r1"]
+
+
+async def test_published_listings_sort_like_mongo():
+    storage = MemoryStorage()
+    for n, (minutes, percentage) in enumerate([(0, 40.0), (2, 90.0), (1, 70.0)]):
+        await storage.results.create(result(f"r{n}", minutes=minutes, percentage=percentage))
+        await storage.results.publish(f"r{n}")
+    await storage.results.create(result("hidden", minutes=3))
+
+    assert [doc["id"] for doc in await storage.results.list_published_for_user("ada")] == ["r1", "r2", "r0"]
+    leaderboard = await storage.results.list_published_for_quiz("q1", ("id", "percentage"))
+    assert leaderboard == [
+        {"id": "r1", "percentage": 90.0},
+        {"id": "r2", "percentage": 70.0},
+        {"id": "r0", "percentage": 40.0},
+    ]
+
+
+async def test_delete_many_drops_every_index_entry():
+    storage = MemoryStorage()
+    await storage.results.create(result("r1", is_evaluated=False))
+    assert await storage.results.delete_many(["r1", "missing"]) == 1
+    assert await storage.results.list_pending() == []
+    assert await storage.results.list_all() == []
@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import summaries
+from summaries import backfill, rebuild_summary
+
+
+def submit(client, headers, quiz, option):
+    question = quiz["questions"][0]
+    response = client.post(
+        f"/api/quizzes/{quiz['id']}/attempt",
+        headers=headers,
+        json={"responses": [{"question_id": question["id"], "selected_option": option}]},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def publish(client, admin, result):
+    assert client.post(f"/api/admin/publish/{result['id']}", headers=admin).status_code == 200
+
+
+def quiz_summary(client, headers):
+    response = client.get("/api/results/my/summary", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_summary_follows_published_results(client, login, create_quiz):
+    quiz = create_quiz()
+    student = login()
+    # Multiple choice only results are published on submission
+    results = [submit(client, student, quiz, option) for option in (1, 0)]
+
+    summary = quiz_summary(client, student)
+    assert summary["attempts"] == 2
+    assert summary["quizzes"] == [{
+        "quiz_id": quiz["id"], "quiz_title": "Arithmetic", "attempts": 2,
+        "best_percentage": 100.0, "average_percentage": 50.0,
+    }]
+    assert [entry["id"] for entry in summary["recent"]] == [result["id"] for result in reversed(results)]
+
+
+def test_results_needing_evaluation_count_once_published(client, admin, login, create_quiz):
+    quiz = create_quiz(questions=[{"question_text": "Why?", "question_type": "text", "points": 4}])
+    student = login()
+    question_id = quiz["questions"][0]["id"]
+    result = client.post(
+        f"/api/quizzes/{quiz['id']}/attempt",
+        headers=student,
+        json={"responses": [{"question_id": question_id, "text_answer": "because"}]},
+    ).json()
+    assert quiz_summary(client, student)["attempts"] == 0
+
+    client.post(
+        f"/api/admin/evaluate/{result['id']}",
+        headers=admin,
+        json={"result_id": result["id"], "evaluations": [{"question_id": question_id, "points_awarded": 3}]},
+    )
+    publish(client, admin, result)
+    summary = quiz_summary(client, student)
+    assert summary["attempts"] == 1
+    assert summary["quizzes"][0]["best_percentage"] == 75.0
+
+
+def test_missing_summary_is_rebuilt_on_read(server, client, login, create_quiz):
+    quiz = create_quiz()
+    student = login()
+    for option in (1, 0, 1):
+        submit(client, student, quiz, option)
+    # As if the results were published before summaries existed
+    server.storage.summaries.__init__()
+
+    summary = quiz_summary(client, student)
+    assert summary["attempts"] == 3
+    assert summary["quizzes"][0]["best_percentage"] == 100.0
+
+
+def test_lowering_the_best_score_rebuilds_the_summary(server, client, admin, login, create_quiz):
+    quiz = create_quiz(questions=[{"question_text": "Why?", "question_type": "text", "points": 4}])
+    student = login()
+    question_id = quiz["questions"][0]["id"]
+    results = [
+        client.post(
+            f"/api/quizzes/{quiz['id']}/attempt",
+            headers=student,
+            json={"responses": [{"question_id": question_id, "text_answer": "because"}]},
+        ).json()
+        for _ in range(2)
+    ]
+
+    def evaluate(result, points):
+        response = client.post(
+            f"/api/admin/evaluate/{result['id']}",
+            headers=admin,
+            json={"result_id": result["id"], "evaluations": [{"question_id": question_id, "points_awarded": points}]},
+        )
+        assert response.status_code == 200, response.text
+
+    evaluate(results[0], 4)
+    evaluate(results[1], 2)
+    for result in results:
+        publish(client, admin, result)
+    assert quiz_summary(client, student)["quizzes"][0]["best_percentage"] == 100.0
+
+    evaluate(results[0], 1)
+    user_id = results[0]["user_id"]
+    stored = server.storage.summaries._by_user[user_id]
+    assert stored["complete"] is False
+
+    stats = quiz_summary(client, student)["quizzes"][0]
+    assert stats["best_percentage"] == 50.0
+    assert stats["average_percentage"] == 37.5
+
+
+def test_summary_counts_archived_results(server, client, admin, login, create_quiz, monkeypatch):
+    quiz = create_quiz()
+    student = login()
+    ids = [submit(client, student, quiz, option)["id"] for option in (1, 0, 0)]
+
+    monkeypatch.setenv("ARCHIVE_AFTER_DAYS", "0")
+    assert client.post("/api/admin/archive", headers=admin).status_code == 202
+    assert server.storage.results._by_id == {}
+    server.storage.summaries.__init__()
+
+    summary = quiz_summary(client, student)
+    assert summary["attempts"] == 3
+    assert {entry["id"] for entry in summary["recent"]} == set(ids)
+    assert client.get(f"/api/results/{ids[0]}", headers=student).json()["detailed_results"][0]["question_text"] == "2+2"
+
+
+def test_older_results_page_across_tiers(server, client, admin, login, create_quiz):
+    quiz = create_quiz()
+    student = login()
+    ids = [submit(client, student, quiz, 1)["id"] for _ in range(5)]
+    # Oldest first, the first three old enough to be archived
+    start = datetime.utcnow() - timedelta(hours=1)
+    for minutes, result_id in enumerate(ids):
+        completed_at = start + timedelta(minutes=minutes) - timedelta(days=365 if minutes < 3 else 0)
+        server.storage.results._by_id[result_id]["completed_at"] = completed_at
+    client.post("/api/admin/archive", headers=admin)
+    assert set(server.storage.results._by_id) == set(ids[3:])
+
+    pages = []
+    before = None
+    while True:
+        params = {"limit": 2, **({"before": before} if before else {})}
+        page = client.get("/api/results/my/all", headers=student, params=params).json()
+        if not page:
+            break
+        pages.append([result["id"] for result in page])
+        before = page[-1]["completed_at"]
+    assert pages == [[ids[4], ids[3]], [ids[2], ids[1]], [ids[0]]]
+
+
+def test_results_completed_together_page_by_id(server, client, login, create_quiz):
+    quiz = create_quiz()
+    student = login()
+    ids = [submit(client, student, quiz, 1)["id"] for _ in range(5)]
+    completed_at = datetime.utcnow().replace(microsecond=0)
+    for result_id in ids:
+        server.storage.results._by_id[result_id]["completed_at"] = completed_at
+
+    seen = []
+    params = {"limit": 2}
+    while page := client.get("/api/results/my/all", headers=student, params=params).json():
+        seen.extend(result["id"] for result in page)
+        params = {"limit": 2, "before": page[-1]["completed_at"], "before_id": page[-1]["id"]}
+    assert seen == sorted(ids, reverse=True)
+
+
+def published_result(n, user_id, percentage, completed_at):
+    return {
+        "id": f"r{n}", "quiz_id": "q1", "quiz_title": "Arithmetic", "user_id": user_id,
+        "user_email": f"{user_id}@example.com", "user_name": user_id, "responses": [],
+        "total_score": 0, "max_possible_score": 1, "percentage": percentage, "time_taken": None,
+        "completed_at": completed_at, "is_evaluated": True, "is_published": True,
+        "detailed_results": [],
+    }
+
+
+@pytest.mark.anyio
+async def test_rebuild_keeps_results_completed_together_across_pages(server, tmp_path, monkeypatch):
+    from archive import ResultArchive
+
+    monkeypatch.setattr(summaries, "MAX_LIST_RESULTS", 2)
+    storage = server.storage
+    completed_at = datetime(2024, 5, 1, 12, 0)
+    for n in range(5):
+        await storage.results.create(published_result(n, "ada", 10.0 * n, completed_at))
+    archive = ResultArchive(str(tmp_path / "rebuild"))
+    try:
+        archive.index(archive.write_segments([published_result(n, "ada", 50.0, completed_at) for n in (5, 6)]))
+        summary = await rebuild_summary(storage, archive, "ada")
+        assert summary["attempts"] == 7
+    finally:
+        archive.close()
+
+
+@pytest.mark.anyio
+async def test_backfill_rebuilds_every_user(server, tmp_path):
+    from archive import ResultArchive
+
+    storage = server.storage
+    now = datetime.utcnow()
+    for n, (user_id, percentage) in enumerate([("ada", 80.0), ("ada", 40.0), ("grace", 100.0)]):
+        await storage.results.create(published_result(n, user_id, percentage, now - timedelta(minutes=n)))
+    archive = ResultArchive(str(tmp_path / "backfill"))
+    try:
+        assert await backfill(storage, archive) == 2
+        ada = await storage.summaries.get("ada")
+        assert ada["complete"] and ada["attempts"] == 2
+        assert ada["quizzes"]["q1"]["best_percentage"] == 80.0
+
+        # A rebuild that lost the race to a publish leaves the newer summary in place
+        await storage.summaries.record_published(
+            {**(await storage.results.get("r0")), "id": "r9", "completed_at": now}
+        )
+        racing = await storage.summaries.get("ada")
+        assert not await storage.summaries.replace({**ada, "attempts": 0}, ada["updated_at"])
+        assert (await storage.summaries.get("ada"))["attempts"] == racing["attempts"] == 3
+        assert (await rebuild_summary(storage, archive, "ada"))["attempts"] == 2
+    finally:
+        archive.close()
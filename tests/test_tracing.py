@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from tracing import NOOP_SPAN, FileExporter, Tracer, TracingMiddleware, current_request_id, span
+
+pytestmark = pytest.mark.anyio
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+def traced_app(tracer, routes):
+    app = Starlette(routes=routes)
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    return app
+
+
+def finished_traces(tracer):
+    traces = []
+    while not tracer._queue.empty():
+        traces.append(tracer._queue.get_nowait())
+    return traces
+
+
+def by_name(spans):
+    return {s.name: s for s in spans}
+
+
+async def nested(request):
+    with span("quiz.load", quiz_id="q1"):
+        with span("storage.get"):
+            pass
+    with span("quiz.score") as score_span:
+        score_span.set_attribute("auto_score", 3)
+    return PlainTextResponse(current_request_id())
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    return Tracer(FileExporter(str(tmp_path / "traces.jsonl")), sample_rate=1.0)
+
+
+async def request(app, path, **headers):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path, headers=headers)
+
+
+async def test_children_are_parented_to_the_enclosing_span(tracer):
+    response = await request(traced_app(tracer, [Route("/quizzes", nested)]), "/quizzes")
+
+    [spans] = finished_traces(tracer)
+    spans = by_name(spans)
+    root = spans["GET /quizzes"]
+    assert root.parent_id == "" and root.attributes["http.status_code"] == 200
+    assert spans["quiz.load"].parent_id == root.span_id
+    assert spans["storage.get"].parent_id == spans["quiz.load"].span_id
+    assert spans["quiz.score"].parent_id == root.span_id
+    assert spans["quiz.score"].attributes == {"auto_score": 3}
+    assert {s.trace.trace_id for s in spans.values()} == {root.trace.trace_id}
+    # Without an incoming id, the trace id is the request id
+    assert response.headers["x-request-id"] == response.text == root.trace.trace_id
+
+
+async def test_incoming_traceparent_is_continued(tracer):
+    app = traced_app(tracer, [Route("/quizzes", nested)])
+    headers = {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01", "X-Request-ID": "req-42"}
+    response = await request(app, "/quizzes", **headers)
+
+    [spans] = finished_traces(tracer)
+    root = by_name(spans)["GET /quizzes"]
+    assert root.trace.trace_id == TRACE_ID and root.parent_id == PARENT_ID
+    assert root.attributes["request.id"] == "req-42"
+    assert response.headers["x-request-id"] == response.text == "req-42"
+
+
+async def test_unsampled_parent_is_not_traced(tracer):
+    app = traced_app(tracer, [Route("/quizzes", nested)])
+    response = await request(app, "/quizzes", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-00")
+    assert finished_traces(tracer) == []
+    # The request id is still the propagated trace id
+    assert response.headers["x-request-id"] == TRACE_ID
+
+
+async def test_malformed_traceparent_starts_a_new_trace(tracer):
+    await request(traced_app(tracer, [Route("/quizzes", nested)]), "/quizzes", traceparent="00-xyz-01")
+    [spans] = finished_traces(tracer)
+    root = by_name(spans)["GET /quizzes"]
+    assert root.parent_id == "" and root.trace.trace_id != TRACE_ID
+
+
+async def test_spans_outside_a_request_are_noops(tmp_path):
+    with span("startup") as startup:
+        assert startup is NOOP_SPAN
+    tracer = Tracer(FileExporter(str(tmp_path / "traces.jsonl")), sample_rate=0.0)
+    await request(traced_app(tracer, [Route("/quizzes", nested)]), "/quizzes")
+    assert finished_traces(tracer) == []
+
+
+async def test_tasks_outliving_the_request_do_not_attach_to_its_trace(tracer):
+    release = asyncio.Event()
+    late_spans = []
+
+    async def outlive_request():
+        await release.wait()
+        with span("job.chunk") as chunk:
+            late_spans.append(chunk)
+
+    def background():
+        with span("background.task"):
+            pass
+
+    tasks = []
+
+    async def start_job(request):
+        tasks.append(asyncio.create_task(outlive_request()))
+        return PlainTextResponse("started", background=BackgroundTask(background))
+
+    await request(traced_app(tracer, [Route("/jobs", start_job)]), "/jobs")
+    [spans] = finished_traces(tracer)
+    # Background tasks run before the trace is finished and show up as children
+    assert by_name(spans)["background.task"].parent_id == by_name(spans)["GET /jobs"].span_id
+
+    count = len(spans)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert late_spans == [NOOP_SPAN]
+    assert len(spans) == count
+
+
+async def test_exported_otlp_json(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(FileExporter(str(path)), sample_rate=1.0, service_name="quiz-test", flush_seconds=0.05)
+
+    async def failing(request):
+        with span("quiz.score"):
+            raise ValueError("bad key")
+
+    app = traced_app(tracer, [Route("/quizzes", nested), Route("/fail", failing)])
+    tracer.start()
+    try:
+        await request(app, "/quizzes", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01")
+        with pytest.raises(ValueError):
+            await request(app, "/fail")
+    finally:
+        tracer.stop()
+
+    spans = []
+    for line in path.read_text().splitlines():
+        [resource_spans] = json.loads(line)["resourceSpans"]
+        assert resource_spans["resource"]["attributes"] == [
+            {"key": "service.name", "value": {"stringValue": "quiz-test"}}
+        ]
+        [scope_spans] = resource_spans["scopeSpans"]
+        assert scope_spans["scope"] == {"name": "tracing"}
+        spans.extend(scope_spans["spans"])
+    assert tracer.stats()["exported_spans"] == len(spans) == 6
+
+    root = next(s for s in spans if s["name"] == "GET /quizzes")
+    assert (root["traceId"], root["parentSpanId"], root["kind"]) == (TRACE_ID, PARENT_ID, 2)
+    assert len(root["spanId"]) == 16
+    assert int(root["endTimeUnixNano"]) >= int(root["startTimeUnixNano"]) > 0
+    attributes = {a["key"]: a["value"] for a in root["attributes"]}
+    assert attributes["http.status_code"] == {"intValue": "200"}
+    assert attributes["http.method"] == {"stringValue": "GET"}
+    assert root["status"] == {}
+
+    load = next(s for s in spans if s["name"] == "quiz.load")
+    assert load["kind"] == 1 and load["parentSpanId"] == root["spanId"]
+    assert load["attributes"] == [{"key": "quiz_id", "value": {"stringValue": "q1"}}]
+
+    failed = [s for s in spans if s["status"]]
+    assert {s["name"] for s in failed} == {"quiz.score", "GET /fail"}
+    assert all(s["status"] == {"code": 2, "message": "ValueError: bad key"} for s in failed)